@@ -6,7 +6,7 @@
 # from typing import Any, Dict
 # from fastapi import FastAPI, HTTPException
 # from fastapi.middleware.cors import CORSMiddleware
-# from pydantic import BaseModel
+# from pydantic import BaseModel, Field
 # from models.schemas import AnalysisResult 
 # from core.config import get_settings
 # from services.analyze import analyze_repository, load_cached_result
@@ -60,20 +60,56 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import logging
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from core.config import get_settings
-from services.analyze import analyze_repository, load_cached_result
+from graphs.graph_store import EXPORT_MEDIA_TYPES, iter_export
+from services.analyze import (
+    analyze_archive,
+    analyze_repository,
+    find_graph_path,
+    get_summaries,
+    load_route_index,
+)
+from services.cache_janitor import get_cache_janitor
+from services.git_clone import parse_repo_url
+from services.jobs import get_job_manager
+from services.llm import LocalLLM, llm_health
+from services.llm_queue import BACKGROUND, INTERACTIVE, get_llm_queue
+from services.metrics import REGISTRY
+from services.tracing import collect_trace
+from services.result_store import get_result_store
+from services.scheduler import AdmissionError, get_scheduler
 
 settings = get_settings()
 
+MB = 1024 * 1024
+
+# Hit/miss counters kept in the result store: ``<cache>_<event>``.
+_CACHE_STAT = re.compile(r"^(result|clone|ref|llm)_(hits|misses|stale_hits|evictions)$")
+
+_REQUEST_SECONDS = REGISTRY.histogram(
+    "repo_diagrammer_http_request_seconds",
+    "Time to respond to HTTP requests (to the first byte for streamed responses).",
+    ["method", "route", "status"],
+)
+
 app = FastAPI(title="Repo Diagrammer", version="0.1.0")
 
 app.add_middleware(
@@ -87,6 +123,8 @@ app.add_middleware(
 
 class AnalyzeRequest(BaseModel):
     repo_url: str
+    # Background refreshes yield LLM slots to interactive requests.
+    priority: str = Field(INTERACTIVE, pattern=f"^({INTERACTIVE}|{BACKGROUND})$")
 
 
 @app.get("/")
@@ -96,7 +134,19 @@ def root():
         "docs": "/docs",
         "health": "/api/health",
         "analyze": {"POST": "/api/analyze", "body": {"repo_url": "https://github.com/<owner>/<repo>" }},
-        "cache": "/api/cache/{sha}"
+        "cache": "/api/cache/{sha}",
+        "summaries": "/api/summaries/{sha}",
+        "graph_export": "/api/graph/{sha}/export?format=ndjson|graphml|json",
+        "routes": "/api/routes/{sha}?prefix=/&offset=0&limit=100",
+        "jobs": {
+            "POST": "/api/jobs",
+            "status": "/api/jobs/{id}",
+            "events": "/api/jobs/{id}/events",
+            "DELETE": "/api/jobs/{id}",
+        },
+        "archives": {"POST": "/api/archives?filename=<name>", "body": "raw .zip/.tar.gz bytes"},
+        "metrics": "/metrics",
+        "tracing": "add ?trace=1 or an X-Trace: 1 header to analyses and summaries"
     }
 
 @app.get("/api")
@@ -106,7 +156,17 @@ def api_index():
         "endpoints": {
             "GET /api/health": "basic health",
             "POST /api/analyze": "analyze a repo; JSON body { repo_url }",
-            "GET /api/cache/{sha}": "fetch cached result by commit sha"
+            "POST /api/archives": "analyze a .zip/.tar.gz sent as the raw body (?filename=) or a local ?path=",
+            "POST /api/jobs": "start a background analysis; JSON body { repo_url }; returns a job id",
+            "GET /api/jobs/{id}": "job stage and progress",
+            "GET /api/jobs/{id}/events": "server-sent events: stages, clone progress, diagrams as they are ready, the result",
+            "DELETE /api/jobs/{id}": "cancel a job; a running clone or fetch is stopped",
+            "GET /api/cache/{sha}": "fetch cached result by commit sha",
+            "GET /api/summaries/{sha}": "LLM summaries of an analysed commit; written on first request",
+            "GET /api/cache/stats": "cache disk usage, budgets and hit ratios",
+            "GET /api/graph/{sha}/export": "stream the full dependency graph; ?format=ndjson|graphml|json",
+            "GET /api/routes/{sha}": "page through detected routes; ?prefix=&method=&offset=&limit=",
+            "GET /metrics": "Prometheus metrics, merged across worker processes"
         }
     }
 
@@ -120,28 +180,355 @@ def configure_logging() -> None:
     )
 
 
+@app.on_event("startup")
+def start_cache_janitor() -> None:
+    get_cache_janitor().start(settings.janitor_interval_seconds)
+
+
+@app.on_event("startup")
+def warm_up_llm() -> None:
+    # Loading the model can take a while; don't hold up startup for it.
+    if settings.llm_warm_up:
+        threading.Thread(target=LocalLLM().warm_up, name="llm-warm-up", daemon=True).start()
+
+
+@app.on_event("startup")
+def start_metrics() -> None:
+    def lanes(field: str):
+        return lambda: {(lane,): values[field] for lane, values in get_scheduler().snapshot().items()}
+
+    REGISTRY.gauge("repo_diagrammer_analyses_in_flight", "Analyses running, per scheduler lane.", ["lane"], lanes("running"))
+    REGISTRY.gauge("repo_diagrammer_analyses_queued", "Analyses waiting for a scheduler slot.", ["lane"], lanes("waiting"))
+    REGISTRY.gauge(
+        "repo_diagrammer_llm_prompts_in_flight",
+        "Prompts holding an LLM slot.",
+        sample=lambda: {(): get_llm_queue().snapshot()["running"]},
+    )
+    REGISTRY.gauge(
+        "repo_diagrammer_llm_prompts_queued",
+        "Prompts waiting for an LLM slot, per priority.",
+        ["priority"],
+        sample=lambda: {(name,): count for name, count in get_llm_queue().snapshot()["waiting"].items()},
+    )
+    REGISTRY.start(settings.metrics_dir)
+
+
+@app.on_event("shutdown")
+def stop_cache_janitor() -> None:
+    get_cache_janitor().stop()
+
+
+@app.on_event("shutdown")
+def flush_result_store() -> None:
+    get_result_store().flush()
+
+
+@app.on_event("shutdown")
+def stop_metrics() -> None:
+    REGISTRY.stop()
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.monotonic()
+    response = await call_next(request)
+    # The route template, not the path, so per-sha URLs share one series.
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    _REQUEST_SECONDS.observe(
+        time.monotonic() - started, method=request.method, route=route, status=response.status_code
+    )
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    return Response(REGISTRY.render(_cache_families()), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _cache_families() -> Dict[str, Dict[str, Any]]:
+    # These counters already live in the shared result store, so every worker reports the same totals.
+    families: Dict[str, Dict[str, Any]] = {}
+    for name, value in get_result_store().stats().items():
+        match = _CACHE_STAT.match(name)
+        if match is None:
+            continue
+        cache, event = match.groups()
+        family = families.setdefault(
+            f"repo_diagrammer_cache_{event}_total",
+            {"type": "counter", "help": f"Cache {event.replace('_', ' ')}, per cache.", "labels": ["cache"], "samples": []},
+        )
+        family["samples"].append([[cache], value])
+    return families
+
+
 @app.get("/api/health")
-def health() -> Dict[str, str]:
-    return {"status": "ok"}
+def health() -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "scheduler": get_scheduler().snapshot(),
+        "llm": llm_health(),
+        "llm_queue": get_llm_queue().snapshot(),
+    }
+
+
+def _trace_requested(request: Request) -> bool:
+    # Tracing is per request and off by default: only then are spans recorded at all.
+    value = request.headers.get("x-trace") or request.query_params.get("trace") or ""
+    return value.lower() in ("1", "true", "yes")
+
 
+def _too_busy(exc: AdmissionError) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
 
-@app.get("/api/cache/{sha}", response_model=dict)
-def get_cached(sha: str) -> Dict[str, Any]:
-    cached = load_cached_result(sha)
-    if cached is None:
+
+@app.get("/api/cache/stats", response_model=dict)
+def cache_stats() -> Dict[str, Any]:
+    return get_cache_janitor().usage()
+
+
+@app.get("/api/cache/{sha}")
+def get_cached(sha: str, request: Request) -> Response:
+    # Results are immutable per commit: serve the stored compressed bytes as-is.
+    stored = get_result_store().get_blob(sha)
+    if stored is None:
         raise HTTPException(status_code=404, detail="Cache miss")
-    return dict(cached)
+    etag = f'"{sha}-{stored.analyzer_version}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body, encoding = stored.payload, stored.encoding
+    if encoding != "identity" and not _accepts_encoding(request.headers.get("accept-encoding"), encoding):
+        body, encoding = stored.decoded_bytes(), "identity"
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    if not accept_encoding:
+        return False
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() in (encoding, "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+@app.get("/api/summaries/{sha}", response_model=dict)
+def get_commit_summaries(
+    sha: str,
+    request: Request,
+    priority: str = Query(INTERACTIVE, pattern=f"^({INTERACTIVE}|{BACKGROUND})$"),
+) -> Dict[str, Any]:
+    # Analyses return diagrams straight away; the slow LLM part is only paid for here.
+    with collect_trace(_trace_requested(request)):
+        summaries = get_summaries(sha, priority=priority)
+    if summaries is None:
+        raise HTTPException(status_code=404, detail="Unknown commit")
+    return dict(summaries)
+
+
+@app.get("/api/graph/{sha}/export")
+def export_graph(
+    sha: str,
+    format: str = Query("ndjson", pattern="^(ndjson|graphml|json)$"),
+) -> StreamingResponse:
+    graph_path = find_graph_path(sha)
+    if graph_path is None:
+        raise HTTPException(status_code=404, detail="No stored graph for this commit")
+    return StreamingResponse(
+        iter_export(graph_path, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{sha}.{format}"'},
+    )
+
+
+@app.get("/api/routes/{sha}", response_model=dict)
+def list_routes(
+    sha: str,
+    prefix: str = "/",
+    method: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+) -> Dict[str, Any]:
+    index = load_route_index(sha)
+    if index is None:
+        raise HTTPException(status_code=404, detail="No stored routes for this commit")
+    total, page = index.query(prefix, offset=offset, limit=limit, method=method)
+    node = index.find(prefix)
+    children = (
+        [{"prefix": child.prefix, "count": child.count} for _, child in sorted(node.children.items())]
+        if node is not None
+        else []
+    )
+    return {
+        "sha": sha,
+        "prefix": prefix,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "routes": [asdict(route) for route in page],
+        "children": children,
+    }
 
 
 @app.post("/api/analyze", response_model=dict)
-def analyze(req: AnalyzeRequest) -> Dict[str, Any]:
+def analyze(req: AnalyzeRequest, request: Request) -> Dict[str, Any]:
     try:
-        result = analyze_repository(req.repo_url)
+        with collect_trace(_trace_requested(request)):
+            result = analyze_repository(req.repo_url, priority=req.priority)
         return dict(result)
+    except AdmissionError as exc:
+        raise _too_busy(exc) from exc
     except ValueError as exc:  # validation errors
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except TimeoutError as exc:  # git ls-remote / clone exceeded its deadline
+        raise HTTPException(status_code=504, detail=str(exc)) from exc
     except FileNotFoundError as exc:  # git missing etc.
         raise HTTPException(status_code=500, detail=str(exc)) from exc
     except Exception as exc:  # pragma: no cover - fallback
         logging.exception("Analysis failed")
-        raise HTTPException(status_code=500, detail="Analysis failed") from exc
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Analysis failed") from exc
+
+
+@app.post("/api/archives", response_model=dict)
+async def analyze_archive_upload(
+    request: Request,
+    filename: str = "upload",
+    path: Optional[str] = None,
+    priority: str = Query(INTERACTIVE, pattern=f"^({INTERACTIVE}|{BACKGROUND})$"),
+) -> Dict[str, Any]:
+    # The body is the archive itself (no multipart), spooled to disk while it is
+    # hashed; members are read straight from it and nothing is extracted.
+    if path is not None:
+        archive_path = _local_archive(path)
+        return await _analyze_archive(archive_path, archive_path.name, None, priority, _trace_requested(request))
+
+    upload_dir = settings.cache_root / "uploads"
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    upload_path = upload_dir / f"{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with upload_path.open("wb") as handle:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > settings.archive_max_mb * MB:
+                    raise HTTPException(status_code=413, detail=f"Archives are limited to {settings.archive_max_mb} MB")
+                digest.update(chunk)
+                # A slow disk must not stall the event loop (and every other request with it).
+                await run_in_threadpool(handle.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty upload")
+        return await _analyze_archive(upload_path, filename, digest.hexdigest(), priority, _trace_requested(request))
+    finally:
+        upload_path.unlink(missing_ok=True)
+
+
+def _local_archive(path: str) -> Path:
+    if settings.archive_root is None:
+        raise HTTPException(status_code=403, detail="Local archive paths are disabled")
+    root = settings.archive_root.resolve()
+    archive_path = Path(path)
+    archive_path = (archive_path if archive_path.is_absolute() else root / archive_path).resolve()
+    if not archive_path.is_relative_to(root):
+        raise HTTPException(status_code=403, detail="Path is outside the archive root")
+    if not archive_path.is_file():
+        raise HTTPException(status_code=404, detail="Archive not found")
+    return archive_path
+
+
+async def _analyze_archive(
+    archive_path: Path,
+    filename: str,
+    digest: Optional[str],
+    priority: str,
+    traced: bool = False,
+) -> Dict[str, Any]:
+    try:
+        # The worker thread runs in a copy of this context, trace included.
+        with collect_trace(traced):
+            result = await run_in_threadpool(analyze_archive, archive_path, filename, digest, priority=priority)
+        return dict(result)
+    except AdmissionError as exc:
+        raise _too_busy(exc) from exc
+    except ValueError as exc:  # not an archive, or a corrupt one
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except Exception as exc:  # pragma: no cover - fallback
+        logging.exception("Archive analysis failed")
+        raise HTTPException(status_code=500, detail="Analysis failed") from exc
+
+
+@app.post("/api/jobs", status_code=202, response_model=dict)
+def create_job(req: AnalyzeRequest, request: Request) -> Dict[str, Any]:
+    try:
+        owner, repo = parse_repo_url(req.repo_url)
+        get_scheduler().check(owner, repo)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except AdmissionError as exc:
+        raise _too_busy(exc) from exc
+    return get_job_manager().submit(req.repo_url, req.priority, trace=_trace_requested(request)).snapshot()
+
+
+@app.get("/api/jobs/{job_id}", response_model=dict)
+def get_job(job_id: str) -> Dict[str, Any]:
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.snapshot()
+
+
+@app.delete("/api/jobs/{job_id}", status_code=202, response_model=dict)
+def cancel_job(job_id: str) -> Dict[str, Any]:
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.snapshot()
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request) -> StreamingResponse:
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    last_event_id = request.headers.get("last-event-id", "0")
+    last_id = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def stream():
+        nonlocal last_id
+        idle = 0.0
+        while True:
+            events = manager.events_since(job, last_id)
+            for event in events:
+                last_id = event.id
+                yield f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data)}\n\n"
+            if job.finished and not manager.events_since(job, last_id):
+                return
+            if await request.is_disconnected():
+                return
+            if events:
+                idle = 0.0
+            elif idle >= 15:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(0.25)
+            idle += 0.25
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -12,10 +12,60 @@ class Settings(BaseModel):
 
     cache_root: Path = Field(default_factory=lambda: Path(os.getenv("REPO_DIAGRAMMER_CACHE", ".cache")))
     llm_model: str = Field(default_factory=lambda: os.getenv("LLM_MODEL", "llama3.1:8b"))
-    ollama_endpoint: str = Field(default_factory=lambda: os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434"))
+    # Comma-separated to spread prompts over several Ollama servers.
+    ollama_endpoints: List[str] = Field(
+        default_factory=lambda: [
+            url.strip().rstrip("/")
+            for url in os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434").split(",")
+            if url.strip()
+        ]
+    )
+    llm_keep_alive: str = Field(default_factory=lambda: os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+    llm_concurrency: int = Field(default_factory=lambda: int(os.getenv("LLM_CONCURRENCY", "2")))
+    llm_timeout_seconds: float = 30
+    llm_queue_timeout_seconds: float = Field(default_factory=lambda: float(os.getenv("LLM_QUEUE_TIMEOUT", "120")))
+    llm_queue_scope: str = Field(default_factory=lambda: os.getenv("LLM_QUEUE_SCOPE", "process"))
+    llm_breaker_failures: int = Field(default_factory=lambda: int(os.getenv("LLM_BREAKER_FAILURES", "3")))
+    llm_probe_interval_seconds: float = 5
+    llm_hedge: bool = Field(default_factory=lambda: os.getenv("LLM_HEDGE", "0") not in ("0", "false", "no"))
+    summary_budget_seconds: float = Field(default_factory=lambda: float(os.getenv("REPO_DIAGRAMMER_SUMMARY_BUDGET", "20")))
+    llm_batch: bool = Field(default_factory=lambda: os.getenv("LLM_BATCH", "1") not in ("0", "false", "no"))
+    llm_warm_up: bool = Field(default_factory=lambda: os.getenv("LLM_WARM_UP", "1") not in ("0", "false", "no"))
     max_nodes: int = 40
+    clone_cache_budget_mb: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_CLONE_BUDGET_MB", "2048")))
+    result_cache_budget_mb: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_RESULT_BUDGET_MB", "256")))
+    llm_cache_budget_mb: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_LLM_CACHE_BUDGET_MB", "64")))
+    janitor_interval_seconds: int = 300
+    ref_cache_ttl_seconds: float = Field(default_factory=lambda: float(os.getenv("REPO_DIAGRAMMER_REF_TTL", "60")))
+    ref_cache_stale_seconds: float = 3600
     max_files_for_llm: int = 20
+    git_timeout_seconds: float = 120
+    git_ls_remote_timeout_seconds: float = Field(default_factory=lambda: float(os.getenv("REPO_DIAGRAMMER_LS_REMOTE_TIMEOUT", "30")))
+    git_clone_timeout_seconds: float = Field(default_factory=lambda: float(os.getenv("REPO_DIAGRAMMER_CLONE_TIMEOUT", "600")))
+    clone_mode: str = Field(default_factory=lambda: os.getenv("REPO_DIAGRAMMER_CLONE_MODE", "sparse"))
+    clone_filter: str = Field(default_factory=lambda: os.getenv("REPO_DIAGRAMMER_CLONE_FILTER", "blob:none"))
+    git_max_processes: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_GIT_PROCESSES", "8")))
+    analysis_fast_concurrency: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_FAST_WORKERS", "4")))
+    analysis_slow_concurrency: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_SLOW_WORKERS", "1")))
+    analysis_queue_size: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_QUEUE_SIZE", "16")))
+    analysis_queue_timeout_seconds: float = 300
+    slow_lane_min_files: int = 2000
+    slow_lane_min_clone_mb: int = 200
+    archive_root: Optional[Path] = Field(
+        default_factory=lambda: Path(os.environ["REPO_DIAGRAMMER_ARCHIVE_ROOT"])
+        if os.getenv("REPO_DIAGRAMMER_ARCHIVE_ROOT")
+        else None
+    )
+    archive_max_mb: int = Field(default_factory=lambda: int(os.getenv("REPO_DIAGRAMMER_ARCHIVE_MAX_MB", "512")))
+    # Shared by every worker process so /metrics can report them all.
+    metrics_dir: Path | None = Field(
+        default_factory=lambda: Path(os.environ["REPO_DIAGRAMMER_METRICS_DIR"])
+        if os.getenv("REPO_DIAGRAMMER_METRICS_DIR")
+        else None
+    )
     log_dir: Path | None = None
+    result_db: Path | None = None
+    lock_dir: Path | None = None
 
     class Config:
         frozen = True
@@ -32,5 +82,12 @@ def get_settings() -> Settings:
         cache_root.mkdir(parents=True, exist_ok=True)
         log_dir = cache_root / "logs"
         log_dir.mkdir(parents=True, exist_ok=True)
-        _SETTINGS = settings.copy(update={"log_dir": log_dir})
+        _SETTINGS = settings.copy(
+            update={
+                "log_dir": log_dir,
+                "result_db": cache_root / "results.sqlite3",
+                "lock_dir": cache_root / "locks",
+                "metrics_dir": settings.metrics_dir or cache_root / "metrics",
+            }
+        )
     return _SETTINGS
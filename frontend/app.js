@@ -49,6 +49,15 @@ tabs.forEach((button) => {
   });
 });
 
+const API_BASE = 'http://127.0.0.1:8000';
+const diagramTargets = {
+  c4_modules_mermaid: c4Diagram,
+  dependencies_mermaid: dependenciesDiagram,
+  routes_mermaid: routesDiagram,
+  db_mermaid: dbDiagram
+};
+let activeEvents = null;
+
 async function analyzeRepo() {
   const url = repoInput.value.trim();
   if (!url) {
@@ -56,11 +65,15 @@ async function analyzeRepo() {
     return;
   }
   errorBox.textContent = '';
+  spinner.textContent = 'Analyzing...';
   spinner.classList.remove('hidden');
   resultsSection.classList.add('hidden');
+  if (activeEvents) {
+    activeEvents.close();
+  }
 
   try {
-    const response = await fetch('http://127.0.0.1:8000/api/analyze', {
+    const response = await fetch(`${API_BASE}/api/jobs`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ repo_url: url })
@@ -69,16 +82,80 @@ async function analyzeRepo() {
       const payload = await response.json();
       throw new Error(payload.detail || 'Analysis failed');
     }
-    const data = await response.json();
-    renderResults(data);
+    const job = await response.json();
+    followJob(job.id);
   } catch (err) {
     console.error(err);
     errorBox.textContent = err.message;
-  } finally {
     spinner.classList.add('hidden');
   }
 }
 
+function followJob(jobId) {
+  const events = new EventSource(`${API_BASE}/api/jobs/${jobId}/events`);
+  const draftSummaries = {};
+  activeEvents = events;
+
+  events.addEventListener('stage', (event) => {
+    const { stage, progress } = JSON.parse(event.data);
+    spinner.textContent = `Analyzing... ${stage} (${Math.round(progress * 100)}%)`;
+  });
+
+  events.addEventListener('diagram', (event) => {
+    const { name, value } = JSON.parse(event.data);
+    const target = diagramTargets[name];
+    if (!target) {
+      return;
+    }
+    resultsSection.classList.remove('hidden');
+    target.removeAttribute('data-processed');
+    target.textContent = value;
+    mermaid.run({ nodes: [target] });
+  });
+
+  events.addEventListener('token', (event) => {
+    const { name, value } = JSON.parse(event.data);
+    draftSummaries[name] = (draftSummaries[name] || '') + value;
+    renderDraftSummaries(draftSummaries);
+  });
+
+  events.addEventListener('done', (event) => {
+    events.close();
+    spinner.classList.add('hidden');
+    renderResults(JSON.parse(event.data).result);
+  });
+
+  events.addEventListener('failed', (event) => {
+    events.close();
+    spinner.classList.add('hidden');
+    errorBox.textContent = JSON.parse(event.data).error || 'Analysis failed';
+  });
+
+  events.onerror = () => {
+    if (events.readyState === EventSource.CLOSED) {
+      spinner.classList.add('hidden');
+      errorBox.textContent = 'Lost connection to the analysis job.';
+    }
+  };
+}
+
+function renderDraftSummaries(drafts) {
+  // Summaries as they are being written; replaced by renderResults when the job is done.
+  resultsSection.classList.remove('hidden');
+  const heading = document.createElement('h3');
+  heading.textContent = 'Writing summaries...';
+  const sections = Object.entries(drafts).map(([name, text]) => {
+    const section = document.createElement('div');
+    const title = document.createElement('h4');
+    title.textContent = name === 'high_level' ? "Explain Like I'm New" : name;
+    const body = document.createElement('p');
+    body.textContent = text;
+    section.append(title, body);
+    return section;
+  });
+  summaryBox.replaceChildren(heading, ...sections);
+}
+
 function renderResults(data) {
   resultsSection.classList.remove('hidden');
   metadataBox.innerHTML = `
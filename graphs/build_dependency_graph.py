@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Iterable, List, Mapping
+from typing import Iterable, List, Mapping, Optional
 
 import networkx as nx
 
@@ -11,7 +11,7 @@ from parsers.python_parser import PythonFileSummary
 def build_dependency_graph(
     python_summaries: Iterable[PythonFileSummary],
     javascript_summaries: Iterable[JavaScriptFileSummary],
-    max_nodes: int,
+    max_nodes: Optional[int],
 ) -> nx.DiGraph:
     graph = nx.DiGraph()
 
@@ -29,6 +29,13 @@ def build_dependency_graph(
             if target:
                 graph.add_edge(summary.path, target)
 
+    if max_nodes is None:
+        return graph
+    return limit_graph(graph, max_nodes)
+
+
+def limit_graph(graph: nx.DiGraph, max_nodes: int) -> nx.DiGraph:
+    """Keep only the ``max_nodes`` most central nodes of ``graph``."""
     if graph.number_of_nodes() <= max_nodes:
         return graph
 
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator
+from xml.sax.saxutils import escape, quoteattr
+
+import networkx as nx
+
+GRAPH_FILENAME = "graph.ndjson"
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "graphml": "application/graphml+xml",
+    "json": "application/json",
+}
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def write_graph(graph: nx.DiGraph, path: Path) -> None:
+    """Persist ``graph`` as NDJSON: every node record first, then every edge.
+
+    The file is written to a temporary sibling and renamed into place so
+    readers never observe a half-written graph.
+    """
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        for node, attrs in graph.nodes(data=True):
+            record = {"type": "node", "id": node}
+            if attrs.get("language"):
+                record["language"] = attrs["language"]
+            handle.write(json.dumps(record) + "\n")
+        for source, target in graph.edges():
+            handle.write(json.dumps({"type": "edge", "source": source, "target": target}) + "\n")
+    os.replace(tmp_path, path)
+
+
+def iter_graph_records(path: Path) -> Iterator[Dict[str, str]]:
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_export(path: Path, fmt: str) -> Iterator[bytes]:
+    """Yield ``path`` rendered as ``fmt`` in bounded-size byte chunks."""
+    if fmt == "ndjson":
+        pieces = _iter_ndjson(path)
+    elif fmt == "graphml":
+        pieces = _iter_graphml(path)
+    elif fmt == "json":
+        pieces = _iter_json(path)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return _chunked(pieces)
+
+
+def _iter_ndjson(path: Path) -> Iterator[str]:
+    with path.open("r", encoding="utf-8") as handle:
+        yield from handle
+
+
+def _iter_graphml(path: Path) -> Iterator[str]:
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    yield '  <key id="language" for="node" attr.name="language" attr.type="string"/>\n'
+    yield '  <graph id="dependencies" edgedefault="directed">\n'
+    for record in iter_graph_records(path):
+        if record["type"] == "node":
+            language = record.get("language")
+            if language:
+                yield (
+                    f"    <node id={quoteattr(record['id'])}>"
+                    f'<data key="language">{escape(language)}</data></node>\n'
+                )
+            else:
+                yield f"    <node id={quoteattr(record['id'])}/>\n"
+        else:
+            yield f"    <edge source={quoteattr(record['source'])} target={quoteattr(record['target'])}/>\n"
+    yield "  </graph>\n"
+    yield "</graphml>\n"
+
+
+def _iter_json(path: Path) -> Iterator[str]:
+    # Nodes are always written before edges, so a single pass is enough.
+    yield '{"nodes": ['
+    section = "nodes"
+    first = True
+    for record in iter_graph_records(path):
+        kind = record.pop("type")
+        if kind == "edge" and section == "nodes":
+            yield '], "edges": ['
+            section = "edges"
+            first = True
+        yield ("" if first else ", ") + json.dumps(record)
+        first = False
+    if section == "nodes":
+        yield '], "edges": ['
+    yield "]}\n"
+
+
+def _chunked(pieces: Iterable[str]) -> Iterator[bytes]:
+    buffer: list[str] = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= _CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
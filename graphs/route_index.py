@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+ROUTES_FILENAME = "routes.ndjson"
+
+_CALL_RE = re.compile(
+    r"^(?P<target>[\w.()]+?)\.(?P<verb>\w+)\(\s*(?:(?P<quote>['\"`])(?P<path>.*?)(?P=quote))?",
+    re.DOTALL,
+)
+_METHODS_KW_RE = re.compile(r"methods\s*=\s*[\[(](?P<methods>[^\])]*)[\])]")
+_JS_HANDLER_RE = re.compile(r",\s*(?P<handler>[A-Za-z_$][\w$.]*)\s*\)\s*;?\s*$")
+_HTTP_VERBS = {"get", "post", "put", "delete", "patch", "head", "options", "all"}
+_ROUTE_VERBS = {"route", "api_route"}
+
+
+@dataclass(frozen=True)
+class RouteEntry:
+    method: str
+    path: str
+    handler: str
+    file: str
+
+
+def parse_route(raw: str, file: str) -> Optional[RouteEntry]:
+    """Split a raw route string from the parsers into method, path and handler.
+
+    Python routes arrive as ``router.get("/items") -> list_items``; JavaScript
+    routes are the full call expression, e.g. ``app.get('/status', handler)``.
+    """
+    call_text, _, handler = raw.partition(" -> ")
+    match = _CALL_RE.match(call_text.strip())
+    if not match:
+        return None
+    verb = match.group("verb").lower()
+    if verb in _HTTP_VERBS:
+        methods = verb.upper()
+    elif verb in _ROUTE_VERBS:
+        kw = _METHODS_KW_RE.search(call_text)
+        if kw:
+            found = re.findall(r"\w+", kw.group("methods"))
+            methods = ",".join(m.upper() for m in found) or "GET"
+        else:
+            methods = "GET"
+    elif verb == "websocket":
+        methods = "WS"
+    else:
+        return None
+    path = match.group("path")
+    if path is None:
+        path = "<dynamic>"
+    if not handler:
+        js_handler = _JS_HANDLER_RE.search(call_text)
+        handler = js_handler.group("handler") if js_handler else "<anonymous>"
+    return RouteEntry(method=methods, path=path or "/", handler=handler.strip(), file=file)
+
+
+def _segments(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+@dataclass
+class _TrieNode:
+    prefix: str
+    children: Dict[str, "_TrieNode"] = field(default_factory=dict)
+    routes: List[RouteEntry] = field(default_factory=list)
+    count: int = 0
+
+
+class RouteTrie:
+    """Routes keyed by path segment, with per-subtree route counts."""
+
+    def __init__(self, routes: Iterable[RouteEntry] = ()) -> None:
+        self.root = _TrieNode(prefix="/")
+        for route in routes:
+            self.insert(route)
+
+    def __len__(self) -> int:
+        return self.root.count
+
+    def insert(self, route: RouteEntry) -> None:
+        node = self.root
+        node.count += 1
+        for segment in _segments(route.path):
+            child = node.children.get(segment)
+            if child is None:
+                child = _TrieNode(prefix=node.prefix.rstrip("/") + "/" + segment)
+                node.children[segment] = child
+            node = child
+            node.count += 1
+        node.routes.append(route)
+
+    def find(self, prefix: str) -> Optional[_TrieNode]:
+        node = self.root
+        for segment in _segments(prefix):
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def query(
+        self,
+        prefix: str = "/",
+        offset: int = 0,
+        limit: int = 100,
+        method: Optional[str] = None,
+    ) -> Tuple[int, List[RouteEntry]]:
+        """Return ``(total, page)`` for routes under ``prefix``, in path order."""
+        node = self.find(prefix)
+        if node is None:
+            return 0, []
+        if method:
+            wanted = method.upper()
+            matching = [r for r in _iter_routes(node) if wanted in r.method.split(",")]
+            return len(matching), matching[offset : offset + limit]
+        return node.count, list(_iter_page(node, offset, limit))
+
+    def aggregate(self, budget: int) -> List[Tuple[_TrieNode, bool]]:
+        """Pick at most ``budget`` trie nodes to display.
+
+        The largest subtrees are expanded first; every returned node is paired
+        with whether it is shown collapsed (standing in for its whole subtree).
+        """
+        expanded = {id(self.root)}
+        visible = list(self.root.children.values())
+        heap = [(-child.count, child.prefix, child) for child in visible]
+        heapq.heapify(heap)
+        while heap:
+            _, _, node = heapq.heappop(heap)
+            if not node.children or len(visible) + len(node.children) > budget:
+                continue
+            expanded.add(id(node))
+            for child in node.children.values():
+                visible.append(child)
+                heapq.heappush(heap, (-child.count, child.prefix, child))
+        return [(node, bool(node.children) and id(node) not in expanded) for node in visible[:budget]]
+
+
+def _iter_routes(node: _TrieNode) -> Iterator[RouteEntry]:
+    yield from sorted(node.routes, key=lambda r: (r.method, r.handler))
+    for key in sorted(node.children):
+        yield from _iter_routes(node.children[key])
+
+
+def _iter_page(node: _TrieNode, offset: int, limit: int) -> Iterator[RouteEntry]:
+    # Subtree counts let whole branches before ``offset`` be skipped unvisited.
+    remaining = limit
+    for route in sorted(node.routes, key=lambda r: (r.method, r.handler)):
+        if remaining <= 0:
+            return
+        if offset:
+            offset -= 1
+            continue
+        yield route
+        remaining -= 1
+    for key in sorted(node.children):
+        if remaining <= 0:
+            return
+        child = node.children[key]
+        if offset >= child.count:
+            offset -= child.count
+            continue
+        page = list(_iter_page(child, offset, remaining))
+        offset = 0
+        remaining -= len(page)
+        yield from page
+
+
+def render_routes_mermaid(trie: RouteTrie, budget: int) -> str:
+    lines = ["graph LR", "    Client((Client))"]
+    if not len(trie):
+        lines.append("    NoRoutes[No routes detected]")
+        return "\n".join(lines)
+    ids: Dict[int, str] = {id(trie.root): "Client"}
+    if trie.root.routes:
+        methods = ",".join(sorted({r.method for r in trie.root.routes}))
+        lines.append(f'    Client --> route_root["{_label(methods + " /")}"]')
+    for index, (node, collapsed) in enumerate(trie.aggregate(budget)):
+        node_id = f"route_{index}"
+        ids[id(node)] = node_id
+        parent_prefix = node.prefix.rsplit("/", 1)[0] or "/"
+        parent = trie.find(parent_prefix)
+        parent_id = ids.get(id(parent), "Client") if parent is not None else "Client"
+        if collapsed:
+            label = f"{node.prefix}/* ({node.count} routes)"
+        elif node.routes:
+            methods = ",".join(sorted({r.method for r in node.routes}))
+            label = f"{methods} {node.prefix}"
+        else:
+            label = node.prefix
+        lines.append(f'    {parent_id} --> {node_id}["{_label(label)}"]')
+    return "\n".join(lines)
+
+
+def _label(text: str) -> str:
+    return text.replace('"', "#quot;")
+
+
+def write_routes(routes: Iterable[RouteEntry], path: Path) -> None:
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        for route in routes:
+            handle.write(json.dumps(asdict(route)) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_routes(path: Path) -> Iterator[RouteEntry]:
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield RouteEntry(**json.loads(line))
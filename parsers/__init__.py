@@ -0,0 +1,23 @@
+"""Registry of the file types the analyzer parses.
+
+Kept free of Tree-sitter imports so that cloning code can use it to decide
+which blobs to download.
+"""
+
+PARSER_EXTENSIONS = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "javascript",
+    ".tsx": "javascript",
+}
+
+# Non-source files the analyzer reads besides parsed sources.
+AUXILIARY_FILES = ("README.md",)
+
+
+def sparse_checkout_patterns() -> list[str]:
+    """Non-cone sparse-checkout patterns covering every file the analyzer reads."""
+    patterns = [f"*{suffix}" for suffix in sorted(PARSER_EXTENSIONS)]
+    patterns.extend(f"/{name}" for name in AUXILIARY_FILES)
+    return patterns
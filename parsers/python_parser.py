@@ -49,18 +49,22 @@ def parse_python_file(path: str, content: str) -> PythonFileSummary:
         elif node.type == "class_definition":
             name = _node_text(node.child_by_field_name("name"), source)
             bases = []
-            inheritance = node.child_by_field_name("superclass")
+            inheritance = node.child_by_field_name("superclasses") or node.child_by_field_name("superclass")
             if inheritance is not None:
-                bases.append(_node_text(inheritance, source))
+                bases.append(_node_text(inheritance, source).strip("()"))
             classes.append(name)
             if any(base.lower().endswith("model") for base in bases) or "Base" in "".join(bases):
                 orm_models.append(name)
         elif node.type == "function_definition":
             name = _node_text(node.child_by_field_name("name"), source)
             functions.append(name)
-            decorators = [child for child in node.children if child.type == "decorator"]
+            # Decorators hang off the enclosing ``decorated_definition`` node.
+            parent = node.parent
+            decorators = []
+            if parent is not None and parent.type == "decorated_definition":
+                decorators = [child for child in parent.children if child.type == "decorator"]
             for decorator in decorators:
-                call = decorator.child_by_field_name("call")
+                call = next((child for child in decorator.named_children if child.type == "call"), None)
                 if call is None:
                     continue
                 call_text = _node_text(call, source)
@@ -1,27 +1,69 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import random
+import threading
+import time
 from collections import Counter
-from pathlib import Path
-from typing import Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 
 import networkx as nx
 
 from core.config import get_settings
-from graphs.build_dependency_graph import build_dependency_graph
+from graphs.build_dependency_graph import build_dependency_graph, limit_graph
 from graphs.c4_builder import build_c4_mermaid
+from graphs.graph_store import GRAPH_FILENAME, write_graph
+from graphs.route_index import (
+    ROUTES_FILENAME,
+    RouteEntry,
+    RouteTrie,
+    parse_route,
+    read_routes,
+    render_routes_mermaid,
+    write_routes,
+)
+from parsers import PARSER_EXTENSIONS
 from parsers.javascript_parser import JavaScriptFileSummary, parse_javascript_file
 from parsers.python_parser import PythonFileSummary, parse_python_file
-from services.git_clone import RepoMetadata, ensure_cloned, fetch_repo_metadata
+from services.archive_source import SourceFile, archive_name, file_digest, iter_archive
+from services.extractive_summary import find_entry_points, module_note, repo_bullets
+from services.git_clone import (
+    RepoMetadata,
+    ensure_cloned,
+    list_tracked_files,
+    mirror_path,
+    object_store_bytes,
+    release_clone,
+    worktree_bytes,
+)
 from services.llm import LocalLLM
+from services.llm_queue import INTERACTIVE
+from services.metrics import REGISTRY
+from services.ref_cache import resolve_repo_metadata
+from services.result_store import get_result_store
+from services.scheduler import get_scheduler
+from services.single_flight import SingleFlight
+from services.timings import collect_timings, current_rss_mb, current_timings, record, rss_delta, timed
+from services.tracing import collect_trace, current_trace, span
 
 LOGGER = logging.getLogger(__name__)
 settings = get_settings()
 
 random.seed(42)
 
+# Owner recorded for analyses of uploaded archives, which have no repository.
+ARCHIVE_OWNER = "archive"
+
+# Bump whenever the shape or content of results changes; it is part of the
+# ETag served for cached results.
+ANALYZER_VERSION = "5"
+
 
 class RepoInfo(dict):
     pass
@@ -46,65 +88,456 @@ class AnalysisResult(dict):
     limits: LimitsPayload
 
 
-CACHE_FILENAME = "result.json"
+class AnalysisProgress:
+    """Receives progress from a running analysis; the default ignores it.
+
+    Setting ``cancel`` (when a listener provides one) stops the git commands
+    of the analysis with :class:`~services.git_clone.GitCancelledError`.
+    """
+
+    cancel: Optional[threading.Event] = None
+
+    def stage(self, name: str, fraction: float) -> None:
+        pass
+
+    def partial(self, kind: str, name: str, payload: Any) -> None:
+        """A piece of the result is ready.
+
+        ``kind`` is ``"diagram"``, ``"summaries"``, ``"token"`` for a piece of
+        a summary that is still being written (``name`` is ``"high_level"`` or
+        the module), or ``"git"`` for a progress line of the clone (``name``
+        is ``"clone"``).
+        """
+
+
+NO_PROGRESS = AnalysisProgress()
+
+
+_STAGE_SECONDS = REGISTRY.histogram(
+    "repo_diagrammer_stage_seconds", "Time spent in each stage of analyses and summarizations.", ["phase", "stage"]
+)
+
+# One clone-and-parse pipeline per commit, across threads and worker processes.
+_single_flight: SingleFlight[AnalysisResult] = SingleFlight(settings.lock_dir)
+# Likewise one summarization per commit.
+_summary_flight: SingleFlight[SummaryPayload] = SingleFlight(settings.lock_dir)
+
+
+def find_cache_dir(sha: str) -> Optional[Path]:
+    return get_result_store().get_cache_dir(sha)
 
 
 def load_cached_result(sha: str) -> Optional[AnalysisResult]:
-    cache_path = settings.cache_root
-    for owner_dir in cache_path.iterdir():
-        sha_dir = owner_dir / sha
-        if sha_dir.exists():
-            result_path = sha_dir / CACHE_FILENAME
-            if result_path.exists():
-                with result_path.open("r", encoding="utf-8") as handle:
-                    data = json.load(handle)
-                return AnalysisResult(data)
+    data = get_result_store().get(sha)
+    if data is None:
+        return None
+    return AnalysisResult(data)
+
+
+def find_graph_path(sha: str) -> Optional[Path]:
+    sha_dir = find_cache_dir(sha)
+    if sha_dir is None:
+        return None
+    graph_path = sha_dir / GRAPH_FILENAME
+    return graph_path if graph_path.exists() else None
+
+
+def load_route_index(sha: str) -> Optional[RouteTrie]:
+    sha_dir = find_cache_dir(sha)
+    if sha_dir is None:
+        return None
+    routes_path = sha_dir / ROUTES_FILENAME
+    if not routes_path.exists():
+        return None
+    return _route_index_from_file(str(routes_path))
+
+
+@lru_cache(maxsize=32)
+def _route_index_from_file(path: str) -> RouteTrie:
+    # Stored routes for a commit never change, so parsed tries can be reused.
+    return RouteTrie(read_routes(Path(path)))
+
+
+def analyze_repository(
+    repo_url: str,
+    progress: AnalysisProgress = NO_PROGRESS,
+    priority: str = INTERACTIVE,
+) -> AnalysisResult:
+    with collect_timings():
+        progress.stage("resolving", 0.05)
+        with timed("resolve"):
+            metadata = resolve_repo_metadata(repo_url)
+        store = get_result_store()
+        cached = load_cached_result(metadata.sha)
+        if cached:
+            LOGGER.info("Returning cached result for %s", metadata.sha)
+            store.increment_stat("result_hits")
+            return cached
+        store.increment_stat("result_misses")
+        return _single_flight.do(
+            metadata.sha,
+            lambda: _analyze_once(
+                metadata, lambda: _clone_and_analyze(repo_url, metadata, progress, priority), progress
+            ),
+        )
+
+
+def analyze_repository_with_summaries(
+    repo_url: str,
+    progress: AnalysisProgress = NO_PROGRESS,
+    priority: str = INTERACTIVE,
+) -> AnalysisResult:
+    """:func:`analyze_repository`, then its deferred summaries, for clients that want both."""
+    result = analyze_repository(repo_url, progress, priority)
+    summaries = get_summaries(result["repo"]["sha"], progress, priority)
+    if summaries is not None:
+        result = AnalysisResult(result, summaries=summaries)
+    return result
+
+
+def get_summaries(
+    sha: str,
+    progress: AnalysisProgress = NO_PROGRESS,
+    priority: str = INTERACTIVE,
+    budget: Optional[float] = None,
+) -> Optional[SummaryPayload]:
+    """Summaries of an analysed commit, written on first request and then stored.
+
+    Returns ``None`` for commits that have not been analysed. The LLM gets
+    ``budget`` seconds (the configured summary budget by default); after that
+    extractive summaries, stated from the extracted facts, are returned with
+    status ``"extractive"`` while the LLM keeps writing in the background.
+    Once its summaries are stored they replace the extractive ones.
+    """
+    stored = _stored_summaries(sha)
+    if stored is not None:
+        return stored
+    row = get_result_store().get_summaries(sha)
+    if row is None:
+        return None
+    budget = settings.summary_budget_seconds if budget is None else budget
+    listener = progress if progress is NO_PROGRESS else _DetachableProgress(progress)
+    try:
+        return _summary_task(sha, listener, priority).result(timeout=budget)
+    except FutureTimeoutError:
+        if isinstance(listener, _DetachableProgress):
+            listener.detach()
+        LOGGER.info("Summaries of %s took over %.1fs; returning extractive summaries", sha, budget)
+        summaries = _extractive_summaries(row[0])
+        progress.partial("summaries", "summaries", summaries)
+        return summaries
+
+
+class _DetachableProgress(AnalysisProgress):
+    """Forwards progress until the caller stops waiting for it."""
+
+    def __init__(self, target: AnalysisProgress) -> None:
+        self.target = target
+        self.attached = True
+
+    def detach(self) -> None:
+        self.attached = False
+
+    def stage(self, name: str, fraction: float) -> None:
+        if self.attached:
+            self.target.stage(name, fraction)
+
+    def partial(self, kind: str, name: str, payload: Any) -> None:
+        if self.attached:
+            self.target.partial(kind, name, payload)
+
+
+# In-process summarization per commit; it outlives callers whose budget ran out.
+_summary_tasks: Dict[str, "Future[SummaryPayload]"] = {}
+_summary_tasks_lock = threading.Lock()
+
+
+def _summary_task(sha: str, progress: AnalysisProgress, priority: str) -> "Future[SummaryPayload]":
+    with _summary_tasks_lock:
+        future = _summary_tasks.get(sha)
+        if future is None:
+            future = _summary_tasks[sha] = Future()
+            threading.Thread(
+                target=_run_summary_task,
+                args=(sha, future, progress, priority, current_trace() is not None),
+                name=f"summaries-{sha[:12]}",
+                daemon=True,
+            ).start()
+    return future
+
+
+def _run_summary_task(
+    sha: str,
+    future: "Future[SummaryPayload]",
+    progress: AnalysisProgress,
+    priority: str,
+    traced: bool = False,
+) -> None:
+    try:
+        with collect_trace(traced):
+            summaries = _summary_flight.do(f"{sha}.summaries", lambda: _summarize_once(sha, progress, priority))
+        future.set_result(summaries)
+    except BaseException as exc:
+        future.set_exception(exc)
+    finally:
+        with _summary_tasks_lock:
+            _summary_tasks.pop(sha, None)
+
+
+def _stored_summaries(sha: str) -> Optional[SummaryPayload]:
+    row = get_result_store().get_summaries(sha)
+    if row is not None:
+        _, summaries = row
+        return SummaryPayload(summaries) if summaries is not None else None
+    # Results from before summaries were deferred carry them inline.
+    result = load_cached_result(sha)
+    summaries = result.get("summaries") if result else None
+    if summaries and "status" not in summaries:
+        return SummaryPayload(summaries, status="done")
     return None
 
 
-def analyze_repository(repo_url: str) -> AnalysisResult:
-    metadata = fetch_repo_metadata(repo_url)
+def _summarize_once(sha: str, progress: AnalysisProgress, priority: str) -> SummaryPayload:
+    # Runs under the per-SHA lock: another worker may have finished meanwhile.
+    stored = _stored_summaries(sha)
+    if stored is not None:
+        return stored
+    inputs, _ = get_result_store().get_summaries(sha)
+    progress.stage("summarizing", 0.7)
+    with collect_timings() as timings:
+        summaries = _summaries(inputs, progress, priority)
+    summaries["timings"] = timings.as_dict()
+    _report_timings(sha, "summaries", summaries["timings"])
+    _write_trace(sha, "summaries")
+    if summaries["status"] == "done":
+        get_result_store().put_summaries(sha, summaries)
+    progress.partial("summaries", "summaries", summaries)
+    return summaries
+
+
+def _pending_summaries(sha: str) -> SummaryPayload:
+    return SummaryPayload(
+        {"status": "pending", "href": f"/api/summaries/{sha}", "high_level": [], "focus_modules": []}
+    )
+
+
+def analyze_archive(
+    archive_path: Path,
+    filename: str,
+    digest: Optional[str] = None,
+    progress: AnalysisProgress = NO_PROGRESS,
+    priority: str = INTERACTIVE,
+) -> AnalysisResult:
+    """Analyze a zip or tar archive in place; results are keyed by its SHA-256."""
+    with collect_timings():
+        progress.stage("hashing", 0.05)
+        with timed("hash") as counts:
+            digest = digest or file_digest(archive_path)
+            counts["bytes"] = archive_path.stat().st_size
+        metadata = RepoMetadata(owner=ARCHIVE_OWNER, name=archive_name(filename), default_branch="", sha=digest)
+        store = get_result_store()
+        cached = load_cached_result(digest)
+        if cached:
+            LOGGER.info("Returning cached result for archive %s", digest)
+            store.increment_stat("result_hits")
+            return cached
+        store.increment_stat("result_misses")
+        return _single_flight.do(
+            digest,
+            lambda: _analyze_once(
+                metadata, lambda: _analyze_sources(iter_archive(archive_path), metadata, progress, priority), progress
+            ),
+        )
+
+
+def _analyze_once(
+    metadata: RepoMetadata,
+    run: Callable[[], AnalysisResult],
+    progress: AnalysisProgress,
+) -> AnalysisResult:
+    # Runs under the per-SHA lock: another worker may have finished meanwhile.
     cached = load_cached_result(metadata.sha)
     if cached:
-        LOGGER.info("Returning cached result for %s", metadata.sha)
+        LOGGER.info("Another worker already analysed %s", metadata.sha)
         return cached
 
-    repo_path = ensure_cloned(repo_url, metadata)
-    log_path = settings.log_dir / f"{metadata.sha}.log"
-    handler = logging.FileHandler(log_path)
-    handler.setLevel(logging.INFO)
-    LOGGER.addHandler(handler)
+    progress.stage("queued", 0.08)
+    with get_scheduler().slot(metadata.owner, metadata.name):
+        metadata.cache_dir.mkdir(parents=True, exist_ok=True)
+        log_path = settings.log_dir / f"{metadata.sha}.log"
+        handler = logging.FileHandler(log_path)
+        handler.setLevel(logging.INFO)
+        LOGGER.addHandler(handler)
+        try:
+            result = run()
+        finally:
+            LOGGER.removeHandler(handler)
+            handler.close()
+
+    timings = current_timings()
+    if timings is not None:
+        result["timings"] = timings.as_dict()
+    with timed("cache_write"):
+        get_result_store().put(
+            metadata.sha,
+            metadata.owner,
+            metadata.name,
+            metadata.cache_dir,
+            result,
+            analyzer_version=ANALYZER_VERSION,
+        )
+    if timings is not None:
+        # The stored copy was encoded before the write it would report; this one includes it.
+        result["timings"] = timings.as_dict()
+        _report_timings(metadata.sha, "analysis", result["timings"])
+    _write_trace(metadata.sha, "analysis")
+
+    return AnalysisResult(result)
+
+
+def _report_timings(sha: str, phase: str, timings: Dict[str, Any]) -> None:
+    # One JSON object per line, so slow analyses can be picked out of the logs later.
+    LOGGER.info("timings %s", json.dumps({"sha": sha, "phase": phase, **timings}, separators=(",", ":")))
+    _STAGE_SECONDS.observe(timings["total_seconds"], phase=phase, stage="total")
+    for stage, entry in timings["stages"].items():
+        if stage.startswith("llm:") and stage not in ("llm:batch", "llm:high_level"):
+            stage = "llm:module"  # one series for all modules
+        _STAGE_SECONDS.observe(entry["seconds"], phase=phase, stage=stage)
 
+
+def _write_trace(sha: str, phase: str) -> None:
+    trace = current_trace()
+    if trace is None:
+        return
+    suffix = "trace.json" if phase == "analysis" else f"{phase}.trace.json"
+    path = settings.log_dir / f"{sha}.{suffix}"
+    try:
+        trace.write(path)
+    except OSError as exc:
+        LOGGER.warning("Could not write trace %s: %s", path, exc)
+        return
+    LOGGER.info("Wrote %s trace of %s to %s", phase, sha, path)
+
+
+def _clone_and_analyze(
+    repo_url: str,
+    metadata: RepoMetadata,
+    progress: AnalysisProgress,
+    priority: str = INTERACTIVE,
+) -> AnalysisResult:
+    store = get_result_store()
+    mirror = mirror_path(metadata)
+    clone_hit = mirror.exists()
+    store.increment_stat("clone_hits" if clone_hit else "clone_misses")
+    # Marked as used before the fetch, so the janitor doesn't pick an old mirror while it runs.
+    store.track_clone(mirror.parent.name, mirror)
+    progress.stage("cloning", 0.1)
+    mirror_bytes = object_store_bytes(mirror)
+    with timed("clone"):
+        repo_path = ensure_cloned(
+            repo_url, metadata, lambda line: progress.partial("git", "clone", line), progress.cancel
+        )
+    store.track_clone(mirror.parent.name, mirror)
     try:
-        result = _analyze_path(repo_path, metadata)
+        transfer = {
+            "bytes_transferred": max(object_store_bytes(mirror) - mirror_bytes, 0),
+            "bytes_written": worktree_bytes(repo_path),
+        }
+        # Measured outside the timed block so the sizing doesn't count as clone time.
+        record("clone", 0.0, bytes=transfer["bytes_transferred"], bytes_written=transfer["bytes_written"])
+        result = _analyze_path(repo_path, metadata, progress, priority)
+        result["limits"].update(transfer)
     finally:
-        LOGGER.removeHandler(handler)
-        handler.close()
+        with timed("release"):
+            release_clone(metadata)
+    return result
 
-    cache_dir = metadata.cache_dir
-    (cache_dir).mkdir(parents=True, exist_ok=True)
-    result_path = cache_dir / CACHE_FILENAME
-    with result_path.open("w", encoding="utf-8") as handle:
-        json.dump(result, handle, indent=2)
 
-    return AnalysisResult(result)
+def _iter_checkout(repo_path: Path) -> Iterator[SourceFile]:
+    seen = set()
+    for path in sorted(repo_path.rglob("*")):
+        if path.is_dir() or ".git" in path.relative_to(repo_path).parts:
+            continue
+        rel_path = path.relative_to(repo_path).as_posix()
+        seen.add(rel_path)
+        yield rel_path, path.read_bytes
+    # A sparse checkout leaves unparsed files out of the working tree; list
+    # them from the commit's tree so language stats cover the whole repository.
+    for rel_path in list_tracked_files(repo_path):
+        if rel_path not in seen:
+            yield rel_path, None
 
 
-def _analyze_path(repo_path: Path, metadata: RepoMetadata) -> AnalysisResult:
+def _analyze_path(
+    repo_path: Path,
+    metadata: RepoMetadata,
+    progress: AnalysisProgress = NO_PROGRESS,
+    priority: str = INTERACTIVE,
+) -> AnalysisResult:
+    return _analyze_sources(_iter_checkout(repo_path), metadata, progress, priority)
+
+
+def _analyze_sources(
+    sources: Iterable[SourceFile],
+    metadata: RepoMetadata,
+    progress: AnalysisProgress = NO_PROGRESS,
+    priority: str = INTERACTIVE,
+) -> AnalysisResult:
+    progress.stage("parsing", 0.3)
     python_summaries: List[PythonFileSummary] = []
     js_summaries: List[JavaScriptFileSummary] = []
     languages = Counter()
-    readme_overview = ""
+    content_hashes: Dict[str, str] = {}
+    readme_text = None
+
+    walk_started = time.monotonic()
+    rss_started = current_rss_mb()
+    spent = 0.0  # reading and parsing, timed on their own
+    with span("walk") as walk:
+        for rel_path, load in sources:
+            suffix = PurePosixPath(rel_path).suffix.lower()
+            language = PARSER_EXTENSIONS.get(suffix)
+            languages[language or suffix.lstrip(".") or "other"] += 1
+            if load is None or (language is None and rel_path != "README.md"):
+                continue
+            started = time.monotonic()
+            data = load()
+            elapsed = time.monotonic() - started
+            record("read", elapsed, files=1, bytes=len(data))
+            spent += elapsed
+            try:
+                text = data.decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+            content_hashes[rel_path] = hashlib.sha1(data).hexdigest()
+            started = time.monotonic()
+            if language == "python":
+                python_summaries.append(parse_python_file(rel_path, text))
+            elif language == "javascript":
+                js_summaries.append(parse_javascript_file(rel_path, text))
+            else:
+                readme_text = text
+            if language is not None:
+                elapsed = time.monotonic() - started
+                record(f"parse:{language}", elapsed, files=1, bytes=len(data))
+                spent += elapsed
+        walk["files"] = sum(languages.values())
+    timings = current_timings()
+    if timings is not None:
+        # Reading and parsing are stages of their own; only in the trace do they nest inside the walk.
+        timings.add(
+            "walk", time.monotonic() - walk_started - spent, files=walk["files"], **rss_delta(rss_started)
+        )
 
     # README-aware overview (optional, best-effort)
-    readme_path = repo_path / "README.md"
-    if readme_path.exists():
-        try:
-            md = readme_path.read_text(encoding="utf-8")
+    readme_overview = ""
+    headings: List[str] = []
+    with timed("mermaid:readme_overview"):
+        if readme_text:
             # naive headings extraction: lines starting with '# ' or '## '
             headings = [
                 line.lstrip("# ").strip()
-                for line in md.splitlines()
+                for line in readme_text.splitlines()
                 if line.startswith("# ")
                 or line.startswith("## ")
             ][:8]  # cap for readability
@@ -114,43 +547,48 @@ def _analyze_path(repo_path: Path, metadata: RepoMetadata) -> AnalysisResult:
                     node = f"Comp{i}"
                     lines.append(f"    Overview --> {node}[{h}]")
                 readme_overview = "\n".join(lines)
-        except Exception:
-            readme_overview = ""
 
-    for path in sorted(repo_path.rglob("*")):
-        if path.is_dir():
-            continue
-        rel_path = path.relative_to(repo_path).as_posix()
-        suffix = path.suffix.lower()
-        try:
-            text = path.read_text(encoding="utf-8")
-        except UnicodeDecodeError:
-            continue
-        if suffix == ".py":
-            summary = parse_python_file(rel_path, text)
-            python_summaries.append(summary)
-            languages["python"] += 1
-        elif suffix in {".js", ".jsx", ".ts", ".tsx"}:
-            summary = parse_javascript_file(rel_path, text)
-            js_summaries.append(summary)
-            languages["javascript"] += 1
-        else:
-            languages[suffix.lstrip(".") or "other"] += 1
-
-    dep_graph = build_dependency_graph(python_summaries, js_summaries, settings.max_nodes)
-    dependency_mermaid = _graph_to_mermaid(dep_graph)
-    c4_mermaid, module_structure = build_c4_mermaid(python_summaries, js_summaries)
-    routes_mermaid = _routes_mermaid(python_summaries, js_summaries)
-    db_mermaid = _db_mermaid(python_summaries)
+    progress.stage("diagrams", 0.5)
+    # Cheapest and most useful diagrams first, so streaming clients see them early.
+    with timed("mermaid:c4_modules"):
+        c4_mermaid, module_structure = build_c4_mermaid(python_summaries, js_summaries)
+    progress.partial("diagram", "c4_modules_mermaid", c4_mermaid)
+    with timed("graph_build") as counts:
+        full_graph = build_dependency_graph(python_summaries, js_summaries, max_nodes=None)
+        write_graph(full_graph, metadata.cache_dir / GRAPH_FILENAME)
+        dep_graph = limit_graph(full_graph, settings.max_nodes)
+        counts.update(nodes=full_graph.number_of_nodes(), edges=full_graph.number_of_edges())
+    with timed("mermaid:dependencies"):
+        dependency_mermaid = _graph_to_mermaid(dep_graph)
+    progress.partial("diagram", "dependencies_mermaid", dependency_mermaid)
+    with timed("route_index") as counts:
+        route_entries = _route_entries(python_summaries, js_summaries)
+        write_routes(route_entries, metadata.cache_dir / ROUTES_FILENAME)
+        counts["routes"] = len(route_entries)
+    with timed("mermaid:routes"):
+        routes_mermaid = render_routes_mermaid(RouteTrie(route_entries), settings.max_nodes)
+    progress.partial("diagram", "routes_mermaid", routes_mermaid)
+    with timed("mermaid:db"):
+        db_mermaid = _db_mermaid(python_summaries)
+    progress.partial("diagram", "db_mermaid", db_mermaid)
+    if not readme_overview:
+        readme_overview = "graph TD\n    Overview[System Overview]\n    Empty[No README headings detected]"
+    progress.partial("diagram", "readme_overview_mermaid", readme_overview)
 
     languages_percent = _language_percentages(languages)
 
-    summaries = _summaries(metadata, python_summaries, js_summaries, dep_graph)
+    # Summaries wait on the LLM, so they are written later, on request (see get_summaries).
+    summary_inputs = _summary_inputs(
+        metadata, python_summaries, js_summaries, dep_graph, content_hashes, route_entries, headings
+    )
+    with timed("summary_inputs_write"):
+        get_result_store().put_summary_inputs(metadata.sha, summary_inputs)
 
     limits = {
         "file_count_scanned": sum(languages.values()),
         "files_sampled_for_llm": min(settings.max_files_for_llm, len(python_summaries) + len(js_summaries)),
         "max_nodes": settings.max_nodes,
+        "route_count": len(route_entries),
     }
 
     result: AnalysisResult = AnalysisResult(
@@ -167,9 +605,9 @@ def _analyze_path(repo_path: Path, metadata: RepoMetadata) -> AnalysisResult:
                 "routes_mermaid": routes_mermaid,
                 "db_mermaid": db_mermaid,
                 # new optional readme-based overview
-                "readme_overview_mermaid": readme_overview or "graph TD\n    Overview[System Overview]\n    Empty[No README headings detected]",
+                "readme_overview_mermaid": readme_overview,
             },
-            "summaries": summaries,
+            "summaries": _pending_summaries(metadata.sha),
             "modules": module_structure,
             "limits": limits,
         }
@@ -192,25 +630,17 @@ def _safe_id(value: str) -> str:
     return value.replace("/", "_").replace(".", "_").replace("-", "_")
 
 
-def _routes_mermaid(
+def _route_entries(
     python_summaries: List[PythonFileSummary],
     js_summaries: List[JavaScriptFileSummary],
-) -> str:
-    lines = ["graph TD"]
-    nodes_added = False
-    for summary in python_summaries:
-        for route in summary.routes:
-            node_id = _safe_id(route)
-            lines.append(f"    Client((Client)) --> {node_id}[{route}]")
-            nodes_added = True
-    for summary in js_summaries:
+) -> List[RouteEntry]:
+    entries: List[RouteEntry] = []
+    for summary in [*python_summaries, *js_summaries]:
         for route in summary.routes:
-            node_id = _safe_id(route)
-            lines.append(f"    Client((Client)) --> {node_id}[{route}]")
-            nodes_added = True
-    if not nodes_added:
-        lines.append("    NoRoutes[No routes detected]")
-    return "\n".join(lines)
+            entry = parse_route(route, summary.path)
+            if entry is not None:
+                entries.append(entry)
+    return entries
 
 
 def _db_mermaid(python_summaries: List[PythonFileSummary]) -> str:
@@ -233,26 +663,160 @@ def _language_percentages(counter: Counter[str]) -> Dict[str, int]:
     return {lang: int((count / total) * 100) for lang, count in counter.items()}
 
 
-def _summaries(
+def _token_sink(progress: AnalysisProgress, name: str) -> Optional[Callable[[str], None]]:
+    # Only stream completions when someone is listening.
+    if progress is NO_PROGRESS:
+        return None
+    return lambda text: progress.partial("token", name, text)
+
+
+def _summary_inputs(
     metadata: RepoMetadata,
     python_summaries: List[PythonFileSummary],
     js_summaries: List[JavaScriptFileSummary],
     dep_graph: nx.DiGraph,
-) -> SummaryPayload:
-    llm = LocalLLM()
-    focus_modules: List[Dict[str, str]] = []
-    centrality = nx.degree_centrality(dep_graph) if dep_graph.number_of_nodes() else {}
-    # consider only repo files (nodes with a 'language' attribute)
-    file_nodes = [n for n in dep_graph.nodes if dep_graph.nodes[n].get("language")]
-    ranked = [(n, centrality.get(n, 0.0)) for n in file_nodes]
-    ranked.sort(key=lambda item: item[1], reverse=True)
+    content_hashes: Optional[Dict[str, str]] = None,
+    route_entries: Iterable[RouteEntry] = (),
+    readme_headings: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """Everything :func:`_summaries` needs, small enough to store until summaries are requested.
+
+    ``facts`` feed the extractive summaries used when the LLM does not answer.
+    """
+    content_hashes = content_hashes or {}
+    with timed("centrality"):
+        centrality = nx.degree_centrality(dep_graph) if dep_graph.number_of_nodes() else {}
+        # consider only repo files (nodes with a 'language' attribute)
+        file_nodes = [n for n in dep_graph.nodes if dep_graph.nodes[n].get("language")]
+        ranked = [(n, centrality.get(n, 0.0)) for n in file_nodes]
+        ranked.sort(key=lambda item: item[1], reverse=True)
     top_modules = ranked[:3]
+    repo_context = (
+        f"Repository {metadata.owner}/{metadata.name} with {len(python_summaries)} Python files "
+        f"and {len(js_summaries)} JavaScript files."
+    )
+    route_entries = list(route_entries)
+    route_files = Counter(entry.file for entry in route_entries)
+    orm_models = sorted({model for summary in python_summaries for model in summary.orm_models})
+    facts = {
+        "repo": f"{metadata.owner}/{metadata.name}",
+        "file_counts": {"python": len(python_summaries), "javascript": len(js_summaries)},
+        "entry_points": find_entry_points(summary.path for summary in [*python_summaries, *js_summaries]),
+        "route_count": len(route_entries),
+        "module_routes": {module: route_files[module] for module, _ in top_modules if route_files[module]},
+        "orm_models": orm_models[:10],
+        "readme_headings": list(readme_headings)[:8],
+        "degrees": {module: [dep_graph.in_degree(module), dep_graph.out_degree(module)] for module, _ in top_modules},
+    }
+    return {
+        "repo_context": repo_context,
+        "modules": [[module, score, content_hashes.get(module, "")] for module, score in top_modules],
+        "facts": facts,
+    }
+
+
+def _extractive_summaries(inputs: Dict[str, Any]) -> SummaryPayload:
+    """Summaries stated from the extracted facts alone: instant, for when the LLM has not answered."""
+    facts = inputs.get("facts", {})
+    modules = [(module, score) for module, score, _ in inputs["modules"]]
+    return SummaryPayload(
+        {
+            "status": "extractive",
+            "high_level": repo_bullets(facts, [module for module, _ in modules]),
+            "focus_modules": [
+                {"module": module, "why": f"degree centrality {score:.2f}", "notes": module_note(module, score, facts)}
+                for module, score in modules
+            ],
+        }
+    )
+
+
+def _repo_content_key(inputs: Dict[str, Any]) -> str:
+    """Cache key of the repository summary: what it describes, not counts that drift with every added file."""
+    facts = inputs.get("facts", {})
+    described = {
+        "repo": facts.get("repo", inputs["repo_context"]),
+        "modules": [[module, content_hash] for module, _, content_hash in inputs["modules"]],
+        "entry_points": facts.get("entry_points", []),
+        "readme_headings": facts.get("readme_headings", []),
+        "orm_models": facts.get("orm_models", []),
+    }
+    return hashlib.sha256(json.dumps(described, sort_keys=True).encode("utf-8")).hexdigest()
+
 
-    for module, score in top_modules:
-        context = f"Module {module} has centrality {score:.2f}."
-        description = llm.summarize_module(module, context)
+def _summaries(
+    inputs: Dict[str, Any],
+    progress: AnalysisProgress = NO_PROGRESS,
+    priority: str = INTERACTIVE,
+) -> SummaryPayload:
+    # Cached by content, so unchanged modules keep their notes across commits.
+    # Prompts queue for a process-wide LLM slot until the deadline.
+    llm = LocalLLM(
+        cache=get_result_store(),
+        priority=priority,
+        deadline=time.monotonic() + settings.llm_queue_timeout_seconds,
+    )
+    focus_modules: List[Dict[str, str]] = []
+    top_modules = [(module, score) for module, score, _ in inputs["modules"]]
+    facts = inputs.get("facts", {})
+    repo_context = inputs["repo_context"]
+    repo_key = _repo_content_key(inputs)
+    module_prompts = [
+        (module, f"Module {module} has centrality {score:.2f}.", content_hash)
+        for module, score, content_hash in inputs["modules"]
+    ]
+    high_level: List[str] = []
+    notes: Dict[str, str] = {}
+    # LLM calls run on pool threads, outside the context that holds the timings and trace.
+    timings = current_timings()
+    trace = current_trace()
+
+    def timed_call(name: str, call: Callable[..., Any], *args: Any) -> Any:
+        started = time.monotonic()
+        try:
+            return call(*args)
+        finally:
+            if timings is not None:
+                timings.add(f"llm:{name}", time.monotonic() - started, calls=1)
+            if trace is not None:
+                trace.add(f"llm:{name}", started, time.monotonic() - started)
+
+    # A listener wants tokens as they arrive, which one JSON reply can't give; it gets a streamed prompt each.
+    if settings.llm_batch and module_prompts and progress is NO_PROGRESS:
+        # One structured call for everything; only what fails to parse is asked again below.
+        high_level, notes = timed_call("batch", llm.summarize_batch, repo_context, module_prompts, repo_key)
+
+    # The remaining prompts are independent: run them side by side, bounded by the LLM concurrency limit.
+    missing = [prompt for prompt in module_prompts if prompt[0] not in notes]
+    with ThreadPoolExecutor(max_workers=max(settings.llm_concurrency, 1), thread_name_prefix="llm") as pool:
+        high_level_future = None
+        if not high_level:
+            high_level_future = pool.submit(
+                timed_call,
+                "high_level",
+                llm.summarize_repo,
+                repo_context,
+                _token_sink(progress, "high_level"),
+                repo_key,
+            )
+        for (module, _, _), note in zip(
+            missing,
+            pool.map(
+                lambda prompt: timed_call(
+                    prompt[0], llm.summarize_module, *prompt, _token_sink(progress, prompt[0])
+                ),
+                missing,
+            ),
+        ):
+            if note:
+                notes[module] = note
+        if high_level_future is not None:
+            high_level = high_level_future.result()
+    descriptions = [notes.get(module) for module, _ in top_modules]
+
+    for (module, score), description in zip(top_modules, descriptions):
         # sanitize weird LLM outputs
-        safe_notes = (description or "LLM unavailable").strip()
+        safe_notes = (description or module_note(module, score, facts)).strip()
         bad_starts = ("I can't", "I cannot", "I'm not", "cannot help", "can't help")
         if safe_notes.lower().startswith(bad_starts):
             safe_notes = "Entry point / important utility per graph centrality."
@@ -262,15 +826,10 @@ def _summaries(
             "notes": safe_notes,
         })
 
-    repo_context = (
-        f"Repository {metadata.owner}/{metadata.name} with {len(python_summaries)} Python files "
-        f"and {len(js_summaries)} JavaScript files."
-    )
-    high_level = llm.summarize_repo(repo_context)
+    # Anything missing is filled in from extracted facts and retried on the next
+    # request (answers that did arrive are cached).
+    status = "done" if high_level and len(notes) == len(top_modules) else "extractive"
     if not high_level:
-        high_level = [
-            "Summaries unavailable (LLM offline).",
-            "Diagrams and static analysis are still provided.",
-        ]
+        high_level = repo_bullets(facts, [module for module, _ in top_modules])
 
-    return SummaryPayload({"high_level": high_level, "focus_modules": focus_modules})
\ No newline at end of file
+    return SummaryPayload({"status": status, "high_level": high_level, "focus_modules": focus_modules})
\ No newline at end of file
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import lzma
+import re
+import tarfile
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from parsers import AUXILIARY_FILES, PARSER_EXTENSIONS
+
+# Parsed members larger than this are skipped rather than decompressed.
+MAX_MEMBER_BYTES = 5 * 1024 * 1024
+
+ARCHIVE_SUFFIXES = (".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar", ".zip")
+
+_CORRUPT_ARCHIVE_ERRORS = (
+    tarfile.TarError,
+    zipfile.BadZipFile,
+    gzip.BadGzipFile,
+    lzma.LZMAError,
+    zlib.error,
+    EOFError,
+)
+
+# ``(path relative to the archive root, loader)``; the loader is ``None`` for
+# members whose contents the analyzer does not need.
+SourceFile = Tuple[str, Optional[Callable[[], bytes]]]
+
+
+def file_digest(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_name(filename: str) -> str:
+    """Display name for an archive: the file name without its archive suffix."""
+    name = PurePosixPath(filename.replace("\\", "/")).name
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    return re.sub(r"[^\w.-]", "_", name) or "archive"
+
+
+def is_wanted(rel_path: str) -> bool:
+    """Whether the analyzer reads this member's contents (decided from the name alone)."""
+    return PurePosixPath(rel_path).suffix.lower() in PARSER_EXTENSIONS or rel_path in AUXILIARY_FILES
+
+
+def iter_archive(path: Path) -> Iterator[SourceFile]:
+    """Members of a zip or tar archive, without extracting anything to disk.
+
+    A single top-level directory shared by every member (as in release
+    archives) is stripped from the paths. Loaders are only valid until the
+    iterator advances.
+    """
+    if zipfile.is_zipfile(path):
+        members = _iter_zip(path)
+    elif tarfile.is_tarfile(path):
+        members = _iter_tar(path)
+    else:
+        raise ValueError("Unsupported archive: expected a .zip or .tar(.gz|.bz2|.xz) file")
+    try:
+        yield from members
+    except _CORRUPT_ARCHIVE_ERRORS as exc:
+        raise ValueError(f"Corrupt archive: {exc}") from exc
+
+
+def _iter_zip(path: Path) -> Iterator[SourceFile]:
+    with zipfile.ZipFile(path) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        strip = _common_root([info.filename for info in members])
+        for info in members:
+            rel_path = info.filename[strip:]
+            if not rel_path:
+                continue
+            if not is_wanted(rel_path) or info.file_size > MAX_MEMBER_BYTES:
+                yield rel_path, None
+                continue
+            yield rel_path, _checked(lambda info=info: archive.read(info))
+
+
+def _iter_tar(path: Path) -> Iterator[SourceFile]:
+    # Read as streams: seeking back to a member of a compressed tar restarts
+    # decompression from the beginning, so each pass decompresses once. The
+    # first pass only collects names, for the shared root to strip.
+    with tarfile.open(path, "r|*") as archive:
+        strip = _common_root([member.name for member in archive if member.isfile()])
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            rel_path = member.name[strip:]
+            if not rel_path:
+                continue
+            if not is_wanted(rel_path) or member.size > MAX_MEMBER_BYTES:
+                yield rel_path, None
+                continue
+            # Only the member the stream is at can be read, hence loaders expire as the iterator advances.
+            yield rel_path, _checked(lambda member=member: _read_tar_member(archive, member))
+
+
+def _checked(read: Callable[[], bytes]) -> Callable[[], bytes]:
+    def load() -> bytes:
+        try:
+            return read()
+        except _CORRUPT_ARCHIVE_ERRORS as exc:
+            raise ValueError(f"Corrupt archive: {exc}") from exc
+
+    return load
+
+
+def _read_tar_member(archive: tarfile.TarFile, member: tarfile.TarInfo) -> bytes:
+    handle = archive.extractfile(member)
+    return handle.read() if handle is not None else b""
+
+
+def _common_root(names: List[str]) -> int:
+    """Length of the ``top/`` prefix shared by every name, or 0."""
+    roots = {name.split("/", 1)[0] for name in names}
+    if len(roots) != 1 or not all("/" in name for name in names):
+        return 0
+    return len(roots.pop()) + 1
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from core.config import get_settings
+from services.git_clone import CLONE_DIRNAME, MIRROR_DIRNAME, mirror_lock_path
+from services.result_store import ResultStore, get_result_store
+from services.single_flight import FileLock, flight_lock_path
+
+LOGGER = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def directory_size(path: Path) -> int:
+    total = 0
+    stack = [str(path)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            continue
+    return total
+
+
+def _remove_tree(path: Path) -> None:
+    def _on_error(func, target, _exc_info) -> None:
+        # Git marks pack files read-only, which blocks deletion on Windows.
+        os.chmod(target, 0o700)
+        func(target)
+
+    if path.exists():
+        shutil.rmtree(path, onerror=_on_error)
+
+
+class CacheJanitor:
+    """Keeps clones and stored results within their disk budgets.
+
+    Clones are large and cheap to recreate, so the least recently used ones are
+    evicted first; results are only evicted once they exceed their own, much
+    smaller, budget.
+    """
+
+    def __init__(
+        self,
+        store: ResultStore,
+        cache_root: Path,
+        clone_budget_bytes: int,
+        result_budget_bytes: int,
+        llm_budget_bytes: int = 64 * MB,
+        min_idle_seconds: float = 600.0,
+        lock_dir: Optional[Path] = None,
+    ) -> None:
+        self.store = store
+        self.cache_root = cache_root
+        self.lock_dir = lock_dir or cache_root / "locks"
+        self.clone_budget_bytes = clone_budget_bytes
+        self.result_budget_bytes = result_budget_bytes
+        self.llm_budget_bytes = llm_budget_bytes
+        self.min_idle_seconds = min_idle_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def discover_clones(self) -> None:
+        """Register mirrors and old per-commit clones on disk that predate access tracking."""
+        for mirror in self.cache_root.glob(f"*/{MIRROR_DIRNAME}"):
+            if mirror.is_dir():
+                self.store.register_clone(mirror.parent.name, mirror, mirror.stat().st_mtime)
+        for repo_path in self.cache_root.glob(f"*/*/{CLONE_DIRNAME}"):
+            # Worktrees of a mirror have a ``.git`` file and are removed after each analysis.
+            if (repo_path / ".git").is_dir():
+                self.store.register_clone(repo_path.parent.name, repo_path, repo_path.stat().st_mtime)
+
+    def run_once(self) -> Dict[str, int]:
+        self.discover_clones()
+        evicted_clones = self._evict_clones()
+        evicted_results = self._evict_results()
+        evicted_llm = self._evict_llm_responses()
+        if evicted_clones or evicted_results or evicted_llm:
+            LOGGER.info(
+                "Cache janitor evicted %d clones, %d results and %d LLM responses",
+                evicted_clones,
+                evicted_results,
+                evicted_llm,
+            )
+        return {"clones": evicted_clones, "results": evicted_results, "llm": evicted_llm}
+
+    def _evict_clones(self) -> int:
+        clones = []
+        total = 0
+        for key, path, size, last_access in self.store.clones_lru():
+            if not Path(path).exists():
+                self.store.delete_clone(key)
+                continue
+            if size is None:
+                size = directory_size(Path(path))
+                self.store.set_clone_size(key, size)
+            clones.append((key, path, size, last_access))
+            total += size
+
+        evicted = 0
+        now = time.time()
+        for key, path, size, last_access in clones:
+            if total <= self.clone_budget_bytes:
+                break
+            if now - last_access < self.min_idle_seconds or _has_worktrees(Path(path)):
+                continue  # likely still being analysed
+            lock = None
+            if Path(path).name == MIRROR_DIRNAME:
+                # Held while the mirror is fetched or checked out, which can outlast the idle time.
+                lock = FileLock(mirror_lock_path(self.lock_dir, key))
+                if not lock.acquire(timeout=0):
+                    continue
+            removed = False
+            try:
+                if _has_worktrees(Path(path)):
+                    continue  # checked out since it was listed
+                LOGGER.info("Evicting clone %s (%d bytes)", path, size)
+                _remove_tree(Path(path))
+                self.store.delete_clone(key)
+                removed = True
+            finally:
+                if lock is not None and removed:
+                    lock.remove()  # the next clone of the repository creates a new one
+                elif lock is not None:
+                    lock.release()
+            self.store.increment_stat("clone_evictions")
+            total -= size
+            evicted += 1
+        return evicted
+
+    def _evict_results(self) -> int:
+        total = self.store.results_size()
+        evicted = 0
+        for sha, cache_dir, size in self.store.results_lru():
+            if total <= self.result_budget_bytes:
+                break
+            # Held while the commit is analysed; its lock file goes with the result.
+            lock = FileLock(flight_lock_path(self.lock_dir, sha))
+            if not lock.acquire(timeout=0):
+                continue
+            try:
+                self.store.delete_result(sha)
+                # Stored graphs and route indexes belong to the result; drop them too.
+                _remove_tree(Path(cache_dir))
+                summaries_lock = FileLock(flight_lock_path(self.lock_dir, f"{sha}.summaries"))
+                if summaries_lock.acquire(timeout=0):
+                    summaries_lock.remove()
+            finally:
+                lock.remove()
+            self.store.increment_stat("result_evictions")
+            total -= size
+            evicted += 1
+        return evicted
+
+    def _evict_llm_responses(self) -> int:
+        total = self.store.llm_responses_size()
+        evicted = 0
+        for key, size in self.store.llm_responses_lru():
+            if total <= self.llm_budget_bytes:
+                break
+            self.store.delete_llm_response(key)
+            self.store.increment_stat("llm_evictions")
+            total -= size
+            evicted += 1
+        return evicted
+
+    def usage(self) -> Dict[str, Any]:
+        stats = self.store.stats()
+        clones = self.store.clones_lru()
+        return {
+            "clones": {
+                "bytes": sum(size or 0 for _, _, size, _ in clones),
+                "budget_bytes": self.clone_budget_bytes,
+                "count": len(clones),
+                **_ratio(stats, "clone"),
+                "evictions": stats.get("clone_evictions", 0),
+            },
+            "results": {
+                "bytes": self.store.results_size(),
+                "budget_bytes": self.result_budget_bytes,
+                **_ratio(stats, "result"),
+                "evictions": stats.get("result_evictions", 0),
+            },
+            "llm": {
+                "bytes": self.store.llm_responses_size(),
+                "budget_bytes": self.llm_budget_bytes,
+                **_ratio(stats, "llm"),
+                "evictions": stats.get("llm_evictions", 0),
+            },
+            "refs": {
+                **_ratio(stats, "ref"),
+                "stale_hits": stats.get("ref_stale_hits", 0),
+            },
+        }
+
+    def start(self, interval_seconds: float) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._loop, args=(interval_seconds,), name="cache-janitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self, interval_seconds: float) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:  # pragma: no cover - keep the janitor alive
+                LOGGER.exception("Cache janitor run failed")
+            self._stop.wait(interval_seconds)
+
+
+def _has_worktrees(git_dir: Path) -> bool:
+    worktrees = git_dir / "worktrees"
+    return worktrees.is_dir() and any(worktrees.iterdir())
+
+
+def _ratio(stats: Dict[str, int], prefix: str) -> Dict[str, Any]:
+    hits = stats.get(f"{prefix}_hits", 0)
+    misses = stats.get(f"{prefix}_misses", 0)
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": round(hits / lookups, 4) if lookups else None}
+
+
+_JANITOR: Optional[CacheJanitor] = None
+
+
+def get_cache_janitor() -> CacheJanitor:
+    global _JANITOR
+    if _JANITOR is None:
+        settings = get_settings()
+        _JANITOR = CacheJanitor(
+            get_result_store(),
+            settings.cache_root,
+            clone_budget_bytes=settings.clone_cache_budget_mb * MB,
+            result_budget_bytes=settings.result_cache_budget_mb * MB,
+            llm_budget_bytes=settings.llm_cache_budget_mb * MB,
+            lock_dir=settings.lock_dir,
+        )
+    return _JANITOR
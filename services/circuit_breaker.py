@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+
+
+class CircuitBreaker:
+    """Skips calls to a dependency that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    :meth:`allow` returns ``False`` straight away. While open, ``probe`` is
+    called every ``probe_interval`` seconds in a background thread; the first
+    successful probe closes the circuit again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        probe: Callable[[], bool],
+        failure_threshold: int = 3,
+        probe_interval: float = 5.0,
+        window: int = 100,
+    ) -> None:
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.opened_at: Optional[float] = None
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+
+    def allow(self) -> bool:
+        with self._lock:
+            return self.state == CLOSED
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.total_successes += 1
+            self._latencies.append(latency)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def latency_percentile(self, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Latency of recent successful calls, or ``None`` with fewer than ``min_samples`` of them."""
+        with self._lock:
+            if len(self._latencies) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failures": self.total_failures,
+                "successes": self.total_successes,
+                "opened_at": self.opened_at,
+                "latency_p50_seconds": round(p50, 3) if p50 is not None else None,
+                "latency_p95_seconds": round(p95, 3) if p95 is not None else None,
+            }
+
+    def _open(self) -> None:
+        # Called with the lock held.
+        LOGGER.warning("Circuit %s opened after %d consecutive failures", self.name, self.consecutive_failures)
+        self.state = OPEN
+        self.opened_at = time.time()
+        if self._prober is None:
+            self._prober = threading.Thread(target=self._probe_until_closed, name=f"probe-{self.name}", daemon=True)
+            self._prober.start()
+
+    def _probe_until_closed(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                healthy = self.probe()
+            except Exception:  # a probe must never kill the prober
+                healthy = False
+            if healthy:
+                with self._lock:
+                    self.state = CLOSED
+                    self.consecutive_failures = 0
+                    self.opened_at = None
+                    self._prober = None
+                LOGGER.info("Circuit %s closed", self.name)
+                return
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from pathlib import PurePosixPath
+from typing import Any, Dict, Iterable, List
+
+# File names that usually start a program or serve an app.
+ENTRY_POINT_NAMES = frozenset(
+    {
+        "__main__.py",
+        "main.py",
+        "app.py",
+        "server.py",
+        "manage.py",
+        "wsgi.py",
+        "asgi.py",
+        "cli.py",
+        "index.js",
+        "main.js",
+        "server.js",
+        "app.js",
+        "index.ts",
+        "main.ts",
+        "server.ts",
+        "app.ts",
+    }
+)
+
+
+def find_entry_points(paths: Iterable[str], limit: int = 5) -> List[str]:
+    """Likely entry points among ``paths``, shallowest first."""
+    found = [path for path in paths if PurePosixPath(path).name in ENTRY_POINT_NAMES]
+    found.sort(key=lambda path: (path.count("/"), path))
+    return found[:limit]
+
+
+def repo_bullets(facts: Dict[str, Any], modules: List[str]) -> List[str]:
+    """Up to five bullets stated from extracted facts alone, for when the LLM has not answered.
+
+    ``modules`` are the most connected files, most connected first.
+    """
+    counts = facts.get("file_counts", {})
+    bullets = [
+        f"{facts.get('repo', 'The repository')} has {counts.get('python', 0)} Python and "
+        f"{counts.get('javascript', 0)} JavaScript files."
+    ]
+    headings = facts.get("readme_headings") or []
+    if headings:
+        bullets.append(f"The README covers: {', '.join(headings[:5])}.")
+    entry_points = facts.get("entry_points") or []
+    if entry_points:
+        bullets.append(f"Likely entry points: {', '.join(entry_points[:3])}.")
+    if modules:
+        bullets.append(f"Most connected modules: {', '.join(modules[:3])}; start reading there.")
+    route_count = facts.get("route_count", 0)
+    if route_count:
+        bullets.append(f"Defines {route_count} HTTP route{'s' if route_count != 1 else ''}.")
+    models = facts.get("orm_models") or []
+    if models:
+        bullets.append(f"Data models: {', '.join(models[:5])}.")
+    return bullets[:5]
+
+
+def module_note(module: str, score: float, facts: Dict[str, Any]) -> str:
+    """One sentence on ``module``'s place in the dependency graph."""
+    role = "Entry point" if module in (facts.get("entry_points") or []) else "Module"
+    imported_by, imports = (facts.get("degrees") or {}).get(module, (0, 0))
+    note = f"{role} imported by {imported_by} and importing {imports} other modules (centrality {score:.2f})"
+    routes = (facts.get("module_routes") or {}).get(module, 0)
+    if routes:
+        note += f"; defines {routes} route{'s' if routes != 1 else ''}"
+    return note + "."
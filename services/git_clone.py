@@ -1,16 +1,29 @@
 from __future__ import annotations
 
 import logging
+import os
 import re
+import shutil
+import signal
 import subprocess
+import threading
+import time
+from collections import deque
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import IO, Callable, Deque, Generator, List, Optional, Sequence, Tuple
 
 from core.config import get_settings
+from parsers import sparse_checkout_patterns
+from services.metrics import REGISTRY
+from services.single_flight import CallCancelled, FileLock, FileSemaphore
+from services.tracing import add_span
 
 LOGGER = logging.getLogger(__name__)
 
+CLONE_DIRNAME = "repo"
+MIRROR_DIRNAME = "mirror.git"
+
 GIT_URL_RE = re.compile(r"^https://github.com/(?P<owner>[\w.-]+)/(?P<repo>[\w.-]+?)(?:\.git)?/?$")
 
 
@@ -31,22 +44,155 @@ class GitNotInstalledError(FileNotFoundError):
     pass
 
 
-def _run_git(*args: str, cwd: Optional[Path] = None) -> str:
+class GitTimeoutError(TimeoutError):
+    pass
+
+
+class GitCancelledError(CallCancelled):
+    pass
+
+
+_GIT_MISSING = "Git executable not found. Please install Git and ensure it is in PATH."
+
+# How often a running git is checked against its deadline and cancellation.
+_POLL_SECONDS = 0.1
+# Lines of stderr kept for the error message of a failed command.
+_STDERR_LINES = 100
+
+_GIT_SECONDS = REGISTRY.histogram("repo_diagrammer_git_seconds", "Wall time of git subprocesses.", ["command"])
+_GIT_RUNNING = REGISTRY.gauge("repo_diagrammer_git_processes", "Git subprocesses currently running.")
+
+
+def _git_command(args: Sequence[str]) -> str:
+    """The git subcommand in ``args``, skipping ``-C <path>`` and other global options."""
+    rest = list(args)
+    while rest and rest[0].startswith("-"):
+        rest = rest[2:] if rest[0] == "-C" else rest[1:]
+    return rest[0] if rest else "git"
+
+
+def _git_slots() -> FileSemaphore:
+    settings = get_settings()
+    return FileSemaphore(settings.lock_dir, "git", settings.git_max_processes)
+
+
+def _process_group_kwargs() -> dict:
+    # Git forks helpers (git-remote-https, index-pack); put them in their own
+    # process group so a timeout or cancellation can kill all of them.
+    if os.name == "nt":  # pragma: no cover - Windows
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _kill_process_group(pid: int) -> None:
+    try:
+        if os.name == "nt":  # pragma: no cover - Windows
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True)
+        else:
+            os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _read_stdout(stream: IO[bytes], chunks: List[bytes]) -> None:
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        chunks.append(chunk)
+
+
+def _read_stderr(stream: IO[bytes], lines: Deque[str], on_progress: Optional[Callable[[str], None]]) -> None:
+    # Progress meters redraw their line with "\r"; only lines ended by "\n" are kept for errors.
+    pending = b""
+    for chunk in iter(lambda: stream.read1(4096), b""):
+        pending += chunk
+        while True:
+            ends = [index for index in (pending.find(b"\r"), pending.find(b"\n")) if index >= 0]
+            if not ends:
+                break
+            end = min(ends)
+            line = pending[:end].decode("utf-8", "replace").strip()
+            if line and pending[end : end + 1] == b"\n":
+                lines.append(line)
+            pending = pending[end + 1 :]
+            if line and on_progress is not None:
+                try:
+                    on_progress(line)
+                except Exception:  # pragma: no cover - a listener must not stall the pipe
+                    LOGGER.exception("Git progress listener failed")
+    line = pending.decode("utf-8", "replace").strip()
+    if line:
+        lines.append(line)
+
+
+def _run_git(
+    *args: str,
+    cwd: Optional[Path] = None,
+    timeout: Optional[float] = None,
+    on_progress: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """Run git and return its stripped stdout.
+
+    ``on_progress`` receives each line git writes to stderr as it arrives,
+    including the redrawn lines of ``--progress`` meters. Once ``timeout``
+    passes or ``cancel`` is set, git and the helpers it forked are killed.
+    """
+    timeout = timeout or get_settings().git_timeout_seconds
+    command = _git_command(args)
+    if cancel is not None and cancel.is_set():
+        raise GitCancelledError(f"git {command} was cancelled")
+    slot = _git_slots().acquire()
+    started = time.monotonic()
+    _GIT_RUNNING.inc()
     try:
-        completed = subprocess.run(
-            ["git", *args],
-            cwd=str(cwd) if cwd else None,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-    except FileNotFoundError as exc:  # pragma: no cover
-        raise GitNotInstalledError("Git executable not found. Please install Git and ensure it is in PATH.") from exc
-    except subprocess.CalledProcessError as exc:
-        LOGGER.error("Git command failed: %s", exc.stderr.strip())
-        raise ValueError(exc.stderr.strip()) from exc
-    return completed.stdout.strip()
+        try:
+            process = subprocess.Popen(
+                ["git", *args],
+                cwd=str(cwd) if cwd else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                **_process_group_kwargs(),
+            )
+        except FileNotFoundError as exc:  # pragma: no cover
+            raise GitNotInstalledError(_GIT_MISSING) from exc
+        stdout: List[bytes] = []
+        stderr: Deque[str] = deque(maxlen=_STDERR_LINES)
+        readers = [
+            threading.Thread(target=_read_stdout, args=(process.stdout, stdout), daemon=True),
+            threading.Thread(target=_read_stderr, args=(process.stderr, stderr, on_progress), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            deadline = started + timeout
+            while process.poll() is None:
+                if cancel is not None and cancel.is_set():
+                    raise GitCancelledError(f"git {command} was cancelled")
+                if time.monotonic() >= deadline:
+                    LOGGER.error("Git command timed out after %ss: git %s", timeout, command)
+                    raise GitTimeoutError(f"git {command} timed out after {timeout:g}s")
+                try:
+                    process.wait(timeout=_POLL_SECONDS)
+                except subprocess.TimeoutExpired:
+                    pass
+        except BaseException:
+            _kill_process_group(process.pid)
+            process.wait()
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+            process.stdout.close()
+            process.stderr.close()
+    finally:
+        _GIT_RUNNING.dec()
+        _GIT_SECONDS.observe(time.monotonic() - started, command=command)
+        add_span(f"git {command}", started, time.monotonic() - started)
+        slot.release()
+    if process.returncode != 0:
+        message = "\n".join(stderr)
+        LOGGER.error("Git command failed: %s", message)
+        raise ValueError(message)
+    return b"".join(stdout).decode("utf-8", "replace").strip()
 
 
 def parse_repo_url(repo_url: str) -> tuple[str, str]:
@@ -56,9 +202,8 @@ def parse_repo_url(repo_url: str) -> tuple[str, str]:
     return match.group("owner"), match.group("repo")
 
 
-def fetch_repo_metadata(repo_url: str) -> RepoMetadata:
-    owner, name = parse_repo_url(repo_url)
-    symref = _run_git("ls-remote", "--symref", repo_url, "HEAD")
+def _parse_symref(symref: str) -> Tuple[str, str]:
+    """Return ``(default branch, head sha)`` from ``git ls-remote --symref <url> HEAD``."""
     default_branch = "main"
     head_sha = ""
     for line in symref.splitlines():
@@ -66,30 +211,182 @@ def fetch_repo_metadata(repo_url: str) -> RepoMetadata:
             # Example line: "ref: refs/heads/main\tHEAD"
             # Extract branch from the "refs/heads/<branch>" token
             tokens = line.split()
-            if len(tokens) >= 2 and "refs/heads/" in tokens[1]:
-                default_branch = tokens[1].split("/")[-1]
+            if len(tokens) >= 2 and tokens[1].startswith("refs/heads/"):
+                default_branch = tokens[1][len("refs/heads/") :]
         elif "HEAD" in line and "ref:" not in line:
             head_sha = line.split()[0]
+    return default_branch, head_sha
+
+
+def fetch_repo_metadata(repo_url: str) -> RepoMetadata:
+    owner, name = parse_repo_url(repo_url)
+    timeout = get_settings().git_ls_remote_timeout_seconds
+    symref = _run_git("ls-remote", "--symref", repo_url, "HEAD", timeout=timeout)
+    default_branch, head_sha = _parse_symref(symref)
     if not head_sha:
-        head_sha = _run_git("ls-remote", repo_url, default_branch).split()[0]
+        head_sha = _run_git("ls-remote", repo_url, default_branch, timeout=timeout).split()[0]
     return RepoMetadata(owner=owner, name=name, default_branch=default_branch, sha=head_sha)
 
 
-def ensure_cloned(repo_url: str, metadata: RepoMetadata) -> Path:
-    cache_dir = metadata.cache_dir
-    repo_path = cache_dir / "repo"
-    if repo_path.exists():
-        LOGGER.info("Using cached clone at %s", repo_path)
-        return repo_path
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    LOGGER.info("Cloning %s into %s", repo_url, repo_path)
-    _run_git(
-        "clone",
-        "--depth",
-        "1",
-        "--branch",
-        metadata.default_branch,
-        repo_url,
-        str(repo_path),
-    )
+def mirror_path(metadata: RepoMetadata) -> Path:
+    """Bare, shallow mirror shared by every analysed commit of a repository."""
+    return metadata.cache_dir.parent / MIRROR_DIRNAME
+
+
+def mirror_lock_path(lock_dir: Path, key: str) -> Path:
+    """Lock held while the mirror keyed ``<owner>_<repo>`` is fetched, checked out or removed."""
+    return lock_dir / f"mirror-{key}.lock"
+
+
+def _mirror_lock(metadata: RepoMetadata) -> FileLock:
+    return FileLock(mirror_lock_path(get_settings().lock_dir, f"{metadata.owner}_{metadata.name}"))
+
+
+def _checkout_plan(repo_url: str, metadata: RepoMetadata, repo_path: Path) -> Generator[List[str], str, None]:
+    """Git invocations that check ``metadata.sha`` out at ``repo_path``.
+
+    Yields argument lists; the driver runs each one and sends back its output,
+    or throws its error into the plan. The mirror is created on first use and
+    updated with a shallow fetch afterwards; the commit gets its own worktree.
+    """
+    settings = get_settings()
+    sparse = settings.clone_mode == "sparse"
+    mirror = mirror_path(metadata)
+    branch = metadata.default_branch
+    if not mirror.exists():
+        staging = _staging_path(mirror)
+        _discard(staging)
+        # A partial mirror falls back to a complete one when the server does not support filters.
+        filters = [[f"--filter={settings.clone_filter}"], []] if sparse else [[]]
+        for index, flags in enumerate(filters):
+            try:
+                yield ["clone", "--bare", "--progress", "--depth", "1", "--branch", branch, *flags, repo_url, str(staging)]
+            except ValueError as exc:
+                _discard(staging)
+                if index == len(filters) - 1:
+                    raise
+                LOGGER.warning("Partial clone of %s failed (%s); retrying without a filter", repo_url, exc)
+                continue
+            except BaseException:
+                _discard(staging)
+                raise
+            break
+        os.replace(staging, mirror)
+    else:
+        refspec = f"+refs/heads/{branch}:refs/heads/{branch}"
+        yield ["-C", str(mirror), "fetch", "--progress", "--depth", "1", "origin", refspec]
+    if (yield ["-C", str(mirror), "rev-parse", f"refs/heads/{branch}"]) != metadata.sha:
+        # The branch moved since the ref was resolved; ask for the commit itself.
+        yield ["-C", str(mirror), "fetch", "--progress", "--depth", "1", "origin", metadata.sha]
+
+    # Left behind by a crashed analysis (or an older, per-commit clone).
+    _discard(repo_path)
+    yield ["-C", str(mirror), "worktree", "prune"]
+    yield ["-C", str(mirror), "worktree", "add", "--no-checkout", "--detach", str(repo_path), metadata.sha]
+    try:
+        if sparse:
+            # Only the paths the analyzer reads are checked out, so only their blobs are downloaded.
+            try:
+                yield ["-C", str(repo_path), "sparse-checkout", "set", "--no-cone", *sparse_checkout_patterns()]
+            except ValueError as exc:
+                LOGGER.warning("Sparse checkout of %s failed (%s); checking out every file", repo_url, exc)
+        yield ["-C", str(repo_path), "checkout", "-q", "--detach", metadata.sha]
+    except BaseException:
+        _discard(repo_path)
+        raise
+
+
+def list_tracked_files(repo_path: Path) -> List[str]:
+    """Every path in the checked-out commit, including ones outside the sparse checkout."""
+    if not (repo_path / ".git").exists():
+        return []
+    return _run_git("-C", str(repo_path), "ls-tree", "-r", "--name-only", "HEAD").splitlines()
+
+
+def object_store_bytes(git_dir: Path) -> int:
+    """Approximate size of the object store of the repository at ``git_dir`` (0 if missing)."""
+    if not git_dir.exists():
+        return 0
+    counts = {}
+    for line in _run_git("-C", str(git_dir), "count-objects", "-v").splitlines():
+        key, _, value = line.partition(":")
+        if value.strip().isdigit():
+            counts[key.strip()] = int(value)
+    return (counts.get("size", 0) + counts.get("size-pack", 0)) * 1024
+
+
+def worktree_bytes(repo_path: Path) -> int:
+    written = 0
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [name for name in dirs if name != ".git"]
+        for name in files:
+            if name == ".git":  # a worktree's link to its mirror
+                continue
+            try:
+                written += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return written
+
+
+def _staging_path(repo_path: Path) -> Path:
+    # Clone next to the final location and rename on success, so a killed or
+    # failed clone never looks like a usable cached one.
+    return repo_path.with_name(repo_path.name + ".partial")
+
+
+def _discard(path: Path) -> None:
+    if path.exists():
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _drive(
+    plan: Generator[List[str], str, None],
+    on_progress: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> None:
+    timeout = get_settings().git_clone_timeout_seconds
+    try:
+        args = next(plan)
+        while True:
+            try:
+                output = _run_git(*args, timeout=timeout, on_progress=on_progress, cancel=cancel)
+            except Exception as exc:
+                args = plan.throw(exc)
+            else:
+                args = plan.send(output)
+    except StopIteration:
+        return
+
+
+def ensure_cloned(
+    repo_url: str,
+    metadata: RepoMetadata,
+    on_progress: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Path:
+    """Check ``metadata.sha`` out into a worktree of the repository's mirror.
+
+    ``on_progress`` receives git's progress lines; setting ``cancel`` stops the
+    checkout with :class:`GitCancelledError`. Call :func:`release_clone` once
+    the checkout is no longer needed.
+    """
+    repo_path = metadata.cache_dir / CLONE_DIRNAME
+    metadata.cache_dir.mkdir(parents=True, exist_ok=True)
+    LOGGER.info("Checking out %s@%s into %s", repo_url, metadata.sha, repo_path)
+    with _mirror_lock(metadata):
+        _drive(_checkout_plan(repo_url, metadata, repo_path), on_progress, cancel)
     return repo_path
+
+
+def release_clone(metadata: RepoMetadata) -> None:
+    """Remove the worktree created by :func:`ensure_cloned`; the mirror is kept."""
+    repo_path = metadata.cache_dir / CLONE_DIRNAME
+    mirror = mirror_path(metadata)
+    with _mirror_lock(metadata):
+        try:
+            _run_git("-C", str(mirror), "worktree", "remove", "--force", str(repo_path))
+        except ValueError:
+            _discard(repo_path)
+            if mirror.exists():
+                _run_git("-C", str(mirror), "worktree", "prune")
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from services.analyze import AnalysisProgress, AnalysisResult, analyze_repository_with_summaries
+from services.llm_queue import INTERACTIVE
+from services.scheduler import AdmissionError, get_scheduler
+from services.single_flight import CallCancelled
+from services.tracing import collect_trace
+
+LOGGER = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("done", "failed", "cancelled")
+
+# Only useful while a job runs: the summaries and done events carry the full text.
+TRANSIENT_EVENTS = ("token", "git")
+# Repeated by the done event, which carries the whole result.
+RESULT_EVENTS = ("diagram", "summaries")
+
+# Finished jobs are forgotten this long after they end, so clients can still replay them for a while.
+FINISHED_JOB_TTL = 3600.0
+
+# Git redraws its progress meters many times a second; jobs pass on one line per interval.
+GIT_PROGRESS_INTERVAL = 0.5
+
+
+@dataclass
+class JobEvent:
+    id: int
+    type: str
+    data: Dict[str, Any]
+
+
+@dataclass
+class Job:
+    id: str
+    repo_url: str
+    priority: str = INTERACTIVE
+    trace: bool = False
+    status: str = "queued"
+    stage: str = "queued"
+    progress: float = 0.0
+    sha: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    events: List[JobEvent] = field(default_factory=list)
+    last_event_id: int = 0
+    cancel: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "repo_url": self.repo_url,
+            "priority": self.priority,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "sha": self.sha,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "events": f"/api/jobs/{self.id}/events",
+            "result": f"/api/cache/{self.sha}" if self.status == "done" else None,
+        }
+
+
+class _JobProgress(AnalysisProgress):
+    def __init__(self, manager: "JobManager", job: Job) -> None:
+        self.manager = manager
+        self.job = job
+        self.cancel = job.cancel
+        self._git_emitted = 0.0
+
+    def stage(self, name: str, fraction: float) -> None:
+        self.manager._update(self.job, stage=name, progress=fraction)
+        self.manager._emit(self.job, "stage", {"stage": name, "progress": fraction})
+
+    def partial(self, kind: str, name: str, payload: Any) -> None:
+        if kind == "git":
+            now = time.monotonic()
+            if now - self._git_emitted < GIT_PROGRESS_INTERVAL:
+                return
+            self._git_emitted = now
+        self.manager._emit(self.job, kind, {"name": name, "value": payload})
+
+
+class JobManager:
+    """Runs analyses in the background and records their progress as events.
+
+    Jobs live in this process only; with several uvicorn workers, clients
+    must poll the worker that accepted the job (sticky sessions).
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str, AnalysisProgress, str], AnalysisResult],
+        max_workers: int,
+        max_jobs: int = 1000,
+        finished_ttl: float = FINISHED_JOB_TTL,
+    ) -> None:
+        self.runner = runner
+        self.max_jobs = max_jobs
+        self.finished_ttl = finished_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, repo_url: str, priority: str = INTERACTIVE, trace: bool = False) -> Job:
+        job = Job(id=uuid.uuid4().hex, repo_url=repo_url, priority=priority, trace=trace)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._emit(job, "stage", {"stage": "queued", "progress": 0.0})
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Ask the job to stop; a running clone is killed, later stages are not interrupted."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel.set()
+        return job
+
+    def events_since(self, job: Job, last_id: int) -> List[JobEvent]:
+        with self._lock:
+            return [event for event in job.events if event.id > last_id]
+
+    def _run(self, job: Job) -> None:
+        self._update(job, status="running")
+        try:
+            if job.cancel.is_set():
+                raise CallCancelled("cancelled before it started")
+            with collect_trace(job.trace):
+                result = self.runner(job.repo_url, _JobProgress(self, job), job.priority)
+        except CallCancelled as exc:
+            LOGGER.info("Job %s cancelled: %s", job.id, exc)
+            self._finish(job, "cancelled", {"error": str(exc)}, error=str(exc))
+            return
+        except Exception as exc:
+            if not isinstance(exc, (ValueError, AdmissionError)):
+                LOGGER.exception("Job %s failed", job.id)
+            error = str(exc) or exc.__class__.__name__
+            failure: Dict[str, Any] = {"error": error}
+            if isinstance(exc, AdmissionError):
+                failure["retry_after"] = exc.retry_after
+            self._finish(job, "failed", failure, error=error)
+            return
+        self._finish(job, "done", {"result": dict(result)}, stage="done", progress=1.0, sha=result["repo"]["sha"])
+
+    def _update(self, job: Job, **changes: Any) -> None:
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.updated_at = time.time()
+
+    def _emit(self, job: Job, kind: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            job.last_event_id += 1
+            job.events.append(JobEvent(id=job.last_event_id, type=kind, data=data))
+
+    def _finish(self, job: Job, status: str, data: Dict[str, Any], **changes: Any) -> None:
+        # One step, so a client that sees the job finished also sees its last event,
+        # and never the events compaction drops.
+        with self._lock:
+            job.status = status
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.updated_at = time.time()
+            job.last_event_id += 1
+            job.events.append(JobEvent(id=job.last_event_id, type=status, data=data))
+            # Finished jobs are kept for replay; drop what replaying them doesn't need.
+            # Event ids are kept, so Last-Event-ID still resumes after the right event.
+            dropped = TRANSIENT_EVENTS + RESULT_EVENTS if status == "done" else TRANSIENT_EVENTS
+            job.events = [event for event in job.events if event.type not in dropped]
+
+    def _prune(self) -> None:
+        # Called with the lock held: forget expired jobs, then the oldest finished ones.
+        expired = time.time() - self.finished_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < expired]:
+            del self._jobs[job_id]
+        while len(self._jobs) > self.max_jobs:
+            oldest = next((job_id for job_id, job in self._jobs.items() if job.finished), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
+
+
+_MANAGER: Optional[JobManager] = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if _MANAGER is None:
+            # Every job either runs or waits in a scheduler lane, so this is enough threads.
+            # Jobs stream summaries to their clients, so they write them straight away.
+            _MANAGER = JobManager(analyze_repository_with_summaries, max_workers=get_scheduler().capacity)
+    return _MANAGER
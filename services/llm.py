@@ -1,41 +1,323 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
-from typing import List
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from core.config import get_settings
+from services.circuit_breaker import CircuitBreaker
+from services.llm_queue import INTERACTIVE, LLMQueueTimeout, get_llm_queue
+from services.result_store import ResultStore
 
 LOGGER = logging.getLogger(__name__)
 
+# Bump whenever a prompt template changes, so cached responses to the old
+# prompt are not reused.
+PROMPT_VERSION = "1"
+
+# Receives each piece of a streamed completion as it arrives.
+TokenCallback = Callable[[str], None]
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+# Hedging waits for this many successful calls to an endpoint before trusting its p95.
+HEDGE_MIN_SAMPLES = 20
+
+
+def _session() -> requests.Session:
+    """Process-wide session, so prompts reuse pooled keep-alive connections."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            settings = get_settings()
+            pool_size = max(settings.llm_concurrency, 1) * 2
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max(len(settings.ollama_endpoints), 1), pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSION = session
+    return _SESSION
+
+
+def _probe(base_url: str) -> bool:
+    try:
+        return _session().get(f"{base_url}/api/tags", timeout=2).status_code == 200
+    except requests.RequestException:
+        return False
+
+
+class LLMEndpoint:
+    """One Ollama server: its circuit breaker and the prompts currently sent to it."""
+
+    def __init__(self, base_url: str) -> None:
+        settings = get_settings()
+        self.base_url = base_url
+        self.generate_url = base_url + "/api/generate"
+        self.breaker = CircuitBreaker(
+            base_url,
+            probe=lambda: _probe(base_url),
+            failure_threshold=settings.llm_breaker_failures,
+            probe_interval=settings.llm_probe_interval_seconds,
+        )
+        self.outstanding = 0
+        self.hedges = 0
+        self.last_chosen = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with _ENDPOINTS_LOCK:
+            load = {"outstanding": self.outstanding, "hedges": self.hedges}
+        return {**self.breaker.snapshot(), **load}
+
+
+_ENDPOINTS: Dict[str, LLMEndpoint] = {}
+_ENDPOINTS_LOCK = threading.Lock()
+
+
+def get_endpoint(base_url: str) -> LLMEndpoint:
+    """The endpoint state shared by every client of the Ollama server at ``base_url``."""
+    base_url = base_url.rstrip("/")
+    with _ENDPOINTS_LOCK:
+        endpoint = _ENDPOINTS.get(base_url)
+        if endpoint is None:
+            endpoint = _ENDPOINTS[base_url] = LLMEndpoint(base_url)
+    return endpoint
+
+
+def get_breaker(base_url: str) -> CircuitBreaker:
+    """The circuit breaker shared by every client of the Ollama server at ``base_url``."""
+    return get_endpoint(base_url).breaker
+
+
+def _choose(endpoints: Sequence[LLMEndpoint], exclude: Sequence[LLMEndpoint] = ()) -> Optional[LLMEndpoint]:
+    """Reserve the healthy endpoint with the fewest prompts in flight (least recently chosen on ties)."""
+    with _ENDPOINTS_LOCK:
+        healthy = [endpoint for endpoint in endpoints if endpoint not in exclude and endpoint.breaker.allow()]
+        if not healthy:
+            return None
+        chosen = min(healthy, key=lambda endpoint: (endpoint.outstanding, endpoint.last_chosen))
+        chosen.outstanding += 1
+        chosen.last_chosen = time.monotonic()
+    return chosen
+
+
+def _release(endpoint: LLMEndpoint) -> None:
+    with _ENDPOINTS_LOCK:
+        endpoint.outstanding -= 1
+
+
+def llm_health() -> Dict[str, Any]:
+    for base_url in get_settings().ollama_endpoints:
+        get_endpoint(base_url)
+    with _ENDPOINTS_LOCK:
+        endpoints = dict(_ENDPOINTS)
+    return {base_url: endpoint.snapshot() for base_url, endpoint in endpoints.items()}
+
+
+def _ignore_token(piece: str) -> None:
+    pass
+
 
 class LocalLLM:
-    def __init__(self) -> None:
+    """Client for one or more Ollama servers.
+
+    ``endpoint`` is a base URL or a list of them (defaults to the configured
+    endpoints). Each prompt goes to the healthy endpoint with the fewest
+    prompts in flight, and a non-streamed prompt that fails is retried on the
+    next one. With ``hedge``, a non-streamed prompt still unanswered after its
+    endpoint's p95 latency is also sent to a second endpoint; the first answer
+    wins and the other request is cancelled.
+    """
+
+    def __init__(
+        self,
+        endpoint: str | Sequence[str] | None = None,
+        model: Optional[str] = None,
+        cache: Optional[ResultStore] = None,
+        priority: str = INTERACTIVE,
+        deadline: Optional[float] = None,
+        hedge: Optional[bool] = None,
+    ) -> None:
         settings = get_settings()
-        self.endpoint = settings.ollama_endpoint.rstrip("/") + "/api/generate"
-        self.model = settings.llm_model
+        self.cache = cache
+        self.priority = priority
+        self.deadline = deadline
+        base_urls = [endpoint] if isinstance(endpoint, str) else list(endpoint or settings.ollama_endpoints)
+        self.endpoints = [get_endpoint(base_url) for base_url in base_urls]
+        self.hedge = settings.llm_hedge if hedge is None else hedge
+        self.model = model or settings.llm_model
+        self.keep_alive = settings.llm_keep_alive
+        self.timeout = settings.llm_timeout_seconds
+
+    def warm_up(self, timeout: float = 300) -> bool:
+        """Load the model into memory (an empty prompt) so the first real prompt doesn't wait for it."""
+        return all([self._warm_up(endpoint, timeout) for endpoint in self.endpoints])
+
+    def _warm_up(self, endpoint: LLMEndpoint, timeout: float) -> bool:
+        try:
+            response = _session().post(
+                endpoint.generate_url,
+                json={"model": self.model, "keep_alive": self.keep_alive},
+                timeout=timeout,
+            )
+        except requests.RequestException as exc:
+            LOGGER.warning("LLM warm-up of %s failed: %s", endpoint.base_url, exc)
+            return False
+        if response.status_code != 200:
+            LOGGER.warning("LLM warm-up of %s responded with status %s", endpoint.base_url, response.status_code)
+            return False
+        LOGGER.info("LLM model %s loaded on %s", self.model, endpoint.base_url)
+        return True
 
-    def _generate(self, prompt: str) -> str | None:
-        payload = {
+    def _generate(
+        self,
+        prompt: str,
+        on_token: Optional[TokenCallback] = None,
+        response_format: Optional[str] = None,
+        num_predict: int = 256,
+    ) -> str | None:
+        """Complete ``prompt``; with ``on_token``, stream the completion and report each piece as it arrives."""
+        payload: Dict[str, Any] = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": on_token is not None,
+            # Keep the model resident between analyses instead of reloading it.
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": 0.2,
                 "top_p": 0.9,
-                "num_predict": 256
+                "num_predict": num_predict
             }
         }
+        if response_format:
+            payload["format"] = response_format
         try:
-            response = requests.post(self.endpoint, json=payload, timeout=30)
+            with get_llm_queue().slot(self.priority, self.deadline):
+                return self._post(payload, on_token)
+        except LLMQueueTimeout as exc:
+            LOGGER.warning("Skipping LLM prompt: %s", exc)
+            return None
+
+    def _post(self, payload: Dict[str, Any], on_token: Optional[TokenCallback]) -> str | None:
+        tried: List[LLMEndpoint] = []
+        while True:
+            endpoint = _choose(self.endpoints, exclude=tried)
+            if endpoint is None:
+                if not tried:
+                    # Every server has been failing; don't wait on them until a probe succeeds.
+                    LOGGER.debug("LLM circuits open, skipping prompt")
+                return None
+            tried.append(endpoint)
+            hedge_after = self._hedge_delay(endpoint) if on_token is None else None
+            if hedge_after is not None:
+                text = self._hedged(endpoint, payload, hedge_after, tried)
+            else:
+                try:
+                    text = self._send(endpoint, payload, on_token)
+                finally:
+                    _release(endpoint)
+            # Streamed pieces were already reported, so only whole answers are retried elsewhere.
+            if text is not None or on_token is not None:
+                return text
+
+    def _hedge_delay(self, endpoint: LLMEndpoint) -> Optional[float]:
+        if not self.hedge or len(self.endpoints) < 2:
+            return None
+        return endpoint.breaker.latency_percentile(95, min_samples=HEDGE_MIN_SAMPLES)
+
+    def _hedged(
+        self,
+        primary: LLMEndpoint,
+        payload: Dict[str, Any],
+        hedge_after: float,
+        tried: List[LLMEndpoint],
+    ) -> str | None:
+        """Send to ``primary`` (already reserved), racing a second endpoint once ``hedge_after`` passes.
+
+        ``None`` when every attempt failed; the endpoints used are added to ``tried``
+        so the caller can fail over to the rest. A primary that fails before the
+        hedge is due returns straight away rather than waiting for it.
+        """
+        # Streamed internally so the losing request can be abandoned between chunks.
+        payload = dict(payload, stream=True)
+        results: "queue.Queue[str | None]" = queue.Queue()
+        cancelled = threading.Event()
+
+        def attempt(endpoint: LLMEndpoint) -> None:
+            text = None
+            try:
+                text = self._send(endpoint, payload, _ignore_token, cancelled)
+            finally:
+                _release(endpoint)
+                results.put(text)
+
+        threading.Thread(target=attempt, args=(primary,), name="llm-attempt", daemon=True).start()
+        try:
+            return results.get(timeout=hedge_after)
+        except queue.Empty:
+            pass
+        pending = 1
+        secondary = _choose(self.endpoints, exclude=tried)
+        if secondary is not None:
+            tried.append(secondary)
+            LOGGER.info(
+                "LLM prompt to %s exceeded its p95 latency (%.1fs), hedging to %s",
+                primary.base_url,
+                hedge_after,
+                secondary.base_url,
+            )
+            with _ENDPOINTS_LOCK:
+                secondary.hedges += 1
+            threading.Thread(target=attempt, args=(secondary,), name="llm-hedge", daemon=True).start()
+            pending += 1
+        try:
+            for _ in range(pending):
+                text = results.get()
+                if text is not None:
+                    return text
+            return None
+        finally:
+            cancelled.set()
+
+    def _send(
+        self,
+        endpoint: LLMEndpoint,
+        payload: Dict[str, Any],
+        on_token: Optional[TokenCallback],
+        cancelled: Optional[threading.Event] = None,
+    ) -> str | None:
+        started = time.monotonic()
+        stream = bool(payload["stream"])
+        try:
+            # When streaming, the timeout bounds the wait for each chunk rather than the whole completion.
+            response = _session().post(endpoint.generate_url, json=payload, timeout=self.timeout, stream=stream)
         except requests.RequestException as exc:
-            LOGGER.warning("LLM unavailable: %s", exc)
+            LOGGER.warning("LLM %s unavailable: %s", endpoint.base_url, exc)
+            endpoint.breaker.record_failure()
             return None
         if response.status_code != 200:
-            LOGGER.warning("LLM responded with status %s", response.status_code)
+            LOGGER.warning("LLM %s responded with status %s", endpoint.base_url, response.status_code)
+            response.close()
+            endpoint.breaker.record_failure()
             return None
+        if stream:
+            text = self._read_stream(response, on_token or _ignore_token, cancelled)
+            if cancelled is not None and cancelled.is_set():
+                # Lost a hedged race; that says nothing about the endpoint's health.
+                return None
+            if text is None:
+                endpoint.breaker.record_failure()
+            else:
+                endpoint.breaker.record_success(time.monotonic() - started)
+            return text
+        endpoint.breaker.record_success(time.monotonic() - started)
         try:
             data = response.json()
         except json.JSONDecodeError:
@@ -43,7 +325,72 @@ class LocalLLM:
             return None
         return data.get("response")
 
-    def summarize_repo(self, context: str) -> List[str]:
+    def _read_stream(
+        self,
+        response: requests.Response,
+        on_token: TokenCallback,
+        cancelled: Optional[threading.Event] = None,
+    ) -> str | None:
+        # Ollama streams one JSON object per line, the last one with "done": true.
+        # Closing the response early makes Ollama stop generating.
+        pieces: List[str] = []
+        try:
+            with response:
+                for line in response.iter_lines():
+                    if cancelled is not None and cancelled.is_set():
+                        return None
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    piece = chunk.get("response", "")
+                    if piece:
+                        pieces.append(piece)
+                        on_token(piece)
+                    if chunk.get("done"):
+                        return "".join(pieces)
+        except (requests.RequestException, json.JSONDecodeError) as exc:
+            LOGGER.warning("LLM stream interrupted: %s", exc)
+            return None
+        LOGGER.warning("LLM stream ended before completion")
+        return None
+
+    def _cached_generate(
+        self,
+        prompt: str,
+        content_key: str = "",
+        on_token: Optional[TokenCallback] = None,
+        **options: Any,
+    ) -> str | None:
+        """``_generate`` through the persistent response cache, when one is configured.
+
+        Answers are keyed on the model, :data:`PROMPT_VERSION` and the prompt.
+        A ``content_key`` replaces the prompt: it names the content the answer
+        is about (e.g. the module path and a hash of its source), so context
+        that drifts with the rest of the repository, like centrality scores,
+        doesn't invalidate it while edits to the content do.
+        """
+        if self.cache is None:
+            return self._generate(prompt, on_token, **options)
+        parts = (self.model, PROMPT_VERSION, content_key or prompt, json.dumps(options, sort_keys=True))
+        key = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+        cached = self.cache.get_llm_response(key)
+        if cached is not None:
+            self.cache.increment_stat("llm_hits")
+            if on_token is not None:
+                on_token(cached)
+            return cached
+        self.cache.increment_stat("llm_misses")
+        response = self._generate(prompt, on_token, **options)
+        if response:
+            self.cache.put_llm_response(key, self.model, response)
+        return response
+
+    def summarize_repo(
+        self,
+        context: str,
+        on_token: Optional[TokenCallback] = None,
+        content_key: str = "",
+    ) -> List[str]:
         # prompt = (
         #     "Summarise the following repository context into concise bullet points for a newcomer. "
         #     "Focus on overall purpose, main components, and how to start exploring.\n" + context
@@ -59,13 +406,19 @@ class LocalLLM:
         )
 
 
-        response = self._generate(prompt)
+        response = self._cached_generate(prompt, content_key and f"repo\0{content_key}", on_token)
         if not response:
             return []
         bullets = [line.strip("- ") for line in response.splitlines() if line.strip()]
         return bullets[:5]
 
-    def summarize_module(self, module: str, context: str) -> str | None:
+    def summarize_module(
+        self,
+        module: str,
+        context: str,
+        content_hash: str = "",
+        on_token: Optional[TokenCallback] = None,
+    ) -> str | None:
         # prompt = (
         #     f"Given the following context about module {module}, explain briefly why it is important "
         #     "and what responsibilities it has.\n" + context
@@ -79,7 +432,82 @@ class LocalLLM:
             f"Context:\n{context}\n\nNote:"
         )
 
-        response = self._generate(prompt)
+        response = self._cached_generate(prompt, content_hash and f"module\0{module}\0{content_hash}", on_token)
         if not response:
             return None
         return response.strip()
+
+    def summarize_batch(
+        self,
+        repo_context: str,
+        modules: Sequence[Tuple[str, str, str]],
+        content_key: str = "",
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """Repository bullets and notes for ``(module, context, content hash)`` entries in one call.
+
+        ``content_key`` is the repository's, as for :meth:`summarize_repo`.
+
+        Asks for JSON output and keeps whatever parses: bullets may be empty and
+        modules may be missing, for the caller to request individually.
+        """
+        module_lines = "\n".join(f"- `{module}`: {context}" for module, context, _ in modules)
+        prompt = (
+            "You are a terse technical writer. Reply with ONLY a JSON object of the form\n"
+            '{"high_level": ["bullet", ...], "modules": {"<module>": "note", ...}}\n'
+            "- high_level: 3-5 short bullets for a newcomer engineer: project purpose, main components, "
+            "and first file(s) to open.\n"
+            "- modules: for every module listed below, 1-2 sentences on why it matters and its responsibilities; "
+            "if context is thin, say 'Entry point' or 'Utility module'.\n"
+            "- Exclude: moral judgments, refusals, safety warnings, speculation.\n\n"
+            f"Repository context:\n{repo_context}\n\nModules:\n{module_lines}\n\nJSON:"
+        )
+        if content_key and all(content_hash for _, _, content_hash in modules):
+            content_key = "\0".join(
+                ["batch", content_key, *(f"{module}\0{content_hash}" for module, _, content_hash in modules)]
+            )
+        else:
+            content_key = ""
+        response = self._cached_generate(
+            prompt, content_key, response_format="json", num_predict=192 + 128 * len(modules)
+        )
+        if not response:
+            return [], {}
+        return _parse_batch(response, [module for module, _, _ in modules])
+
+
+def _parse_batch(text: str, modules: Sequence[str]) -> Tuple[List[str], Dict[str, str]]:
+    data = _loads_object(text)
+    if data is None:
+        LOGGER.warning("Could not parse batched LLM response")
+        return [], {}
+    raw_bullets = data.get("high_level")
+    bullets = []
+    if isinstance(raw_bullets, list):
+        bullets = [item.strip().lstrip("-* ").strip() for item in raw_bullets if isinstance(item, str) and item.strip()]
+    raw_notes = data.get("modules")
+    if isinstance(raw_notes, list):  # [{"module": ..., "note": ...}, ...]
+        raw_notes = {
+            entry.get("module"): entry.get("note") or entry.get("notes")
+            for entry in raw_notes
+            if isinstance(entry, dict)
+        }
+    notes = {}
+    if isinstance(raw_notes, dict):
+        for module in modules:
+            note = raw_notes.get(module, raw_notes.get(f"`{module}`"))
+            if isinstance(note, str) and note.strip():
+                notes[module] = note.strip()
+    return bullets[:5], notes
+
+
+def _loads_object(text: str) -> Optional[Dict[str, Any]]:
+    # Models sometimes wrap JSON in code fences or add a sentence around it.
+    candidates = [text, text[text.find("{") : text.rfind("}") + 1]]
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
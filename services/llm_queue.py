@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import get_settings
+from services.metrics import REGISTRY
+from services.single_flight import FileLock, FileSemaphore
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Lower ranks are served first.
+PRIORITY_RANK = {INTERACTIVE: 0, BACKGROUND: 1}
+
+_WAIT_SECONDS = REGISTRY.histogram(
+    "repo_diagrammer_llm_queue_wait_seconds", "Time prompts waited for an LLM slot.", ["priority"]
+)
+_TIMEOUTS = REGISTRY.counter(
+    "repo_diagrammer_llm_queue_timeouts_total", "Prompts skipped because no LLM slot freed up in time.", ["priority"]
+)
+
+
+class LLMQueueTimeout(TimeoutError):
+    """The prompt's deadline passed while it was waiting for an LLM slot."""
+
+
+class LLMQueue:
+    """Caps the prompts in flight to the LLM across every analysis in the process.
+
+    Waiting prompts are admitted by priority, then in arrival order. With
+    ``node_slots`` a slot must also be taken from a node-wide
+    :class:`FileSemaphore`, which caps prompts across worker processes too
+    (priorities are only honoured within a process).
+    """
+
+    def __init__(self, max_concurrency: int, node_slots: Optional[FileSemaphore] = None) -> None:
+        self.max_concurrency = max(max_concurrency, 1)
+        self.node_slots = node_slots
+        self.running = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self._avg_wait = 0.0
+        self._max_wait = 0.0
+        self._heap: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def slot(self, priority: str = INTERACTIVE, deadline: Optional[float] = None) -> "_LLMSlot":
+        """Context manager holding one slot; ``deadline`` is a ``time.monotonic()`` value."""
+        return _LLMSlot(self, priority, deadline)
+
+    def acquire(self, priority: str, deadline: Optional[float]) -> Optional[FileLock]:
+        entry = (PRIORITY_RANK[priority], next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            while self._heap[0] != entry or self.running >= self.max_concurrency:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._heap.remove(entry)
+                    heapq.heapify(self._heap)
+                    self.timeouts += 1
+                    self._cond.notify_all()
+                    _TIMEOUTS.inc(priority=priority)
+                    raise LLMQueueTimeout(f"No LLM slot within the deadline ({len(self._heap)} prompts waiting)")
+                self._cond.wait(remaining)
+            heapq.heappop(self._heap)
+            self.running += 1
+            self._cond.notify_all()
+
+        node_lock = None
+        if self.node_slots is not None:
+            node_lock = self.node_slots.try_acquire()
+            while node_lock is None:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self._release_local()
+                    with self._cond:
+                        self.timeouts += 1
+                    _TIMEOUTS.inc(priority=priority)
+                    raise LLMQueueTimeout("No node-wide LLM slot within the deadline")
+                time.sleep(0.05)
+                node_lock = self.node_slots.try_acquire()
+
+        waited = time.monotonic() - started
+        _WAIT_SECONDS.observe(waited, priority=priority)
+        with self._cond:
+            self.admitted += 1
+            self._avg_wait = waited if self.admitted == 1 else 0.8 * self._avg_wait + 0.2 * waited
+            self._max_wait = max(self._max_wait, waited)
+        return node_lock
+
+    def release(self, node_lock: Optional[FileLock]) -> None:
+        if node_lock is not None:
+            node_lock.release()
+        self._release_local()
+
+    def _release_local(self) -> None:
+        with self._cond:
+            self.running -= 1
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            waiting = {name: 0 for name in PRIORITY_RANK}
+            ranks = {rank: name for name, rank in PRIORITY_RANK.items()}
+            for rank, _ in self._heap:
+                waiting[ranks[rank]] += 1
+            return {
+                "running": self.running,
+                "waiting": waiting,
+                "max_concurrency": self.max_concurrency,
+                "admitted": self.admitted,
+                "timeouts": self.timeouts,
+                "avg_wait_seconds": round(self._avg_wait, 3),
+                "max_wait_seconds": round(self._max_wait, 3),
+            }
+
+
+class _LLMSlot:
+    def __init__(self, queue: LLMQueue, priority: str, deadline: Optional[float]) -> None:
+        self.queue = queue
+        self.priority = priority
+        self.deadline = deadline
+        self._node_lock: Optional[FileLock] = None
+
+    def __enter__(self) -> LLMQueue:
+        self._node_lock = self.queue.acquire(self.priority, self.deadline)
+        return self.queue
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.queue.release(self._node_lock)
+
+
+_QUEUE: Optional[LLMQueue] = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_llm_queue() -> LLMQueue:
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            settings = get_settings()
+            node_slots = None
+            if settings.llm_queue_scope == "node":
+                node_slots = FileSemaphore(settings.lock_dir, "llm", settings.llm_concurrency)
+            _QUEUE = LLMQueue(settings.llm_concurrency, node_slots)
+    return _QUEUE
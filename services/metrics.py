@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services.single_flight import FileLock
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds; covers a fast cache hit up to a slow clone or LLM call.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# How often each process publishes its values to the shared directory.
+FLUSH_INTERVAL = 1.0
+# Gauges of a process that has not published for this long are dropped (it has exited).
+STALE_AFTER = 10 * FLUSH_INTERVAL
+# After this long its counters and histograms are folded into the accumulator file and its
+# own file is deleted. Until then a process that only stalled can still pick up where it was.
+RETENTION = 3600.0
+# Counter and histogram totals of processes that have exited; never a gauge.
+ACCUMULATOR = "_accumulated.json"
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        """``(label values, value)`` pairs recorded so far."""
+
+    def family(self) -> Dict[str, Any]:
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "labels": list(self.labels),
+            "samples": [[list(key), value] for key, value in self.samples()],
+        }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(_Metric):
+    """A value per process; across processes the live values are summed.
+
+    With ``sample`` the value is read from it (a mapping of label values to
+    values) whenever the process publishes, instead of being set.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        sample: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.sample = sample
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        if self.sample is not None:
+            try:
+                return [(tuple(str(value) for value in key), value) for key, value in self.sample().items()]
+            except Exception:  # a broken sampler must not break publishing
+                LOGGER.exception("Sampling gauge %s failed", self.name)
+                return []
+        with self._lock:
+            return list(self._values.items())
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [count per bucket (the last is +Inf), sum].
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return [(key, {"counts": list(counts), "sum": total}) for key, (counts, total) in self._values.items()]
+
+    def family(self) -> Dict[str, Any]:
+        return {**super().family(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    """The metrics of this process, published to a directory shared by every worker.
+
+    Each process writes its own snapshot file (at most every
+    :data:`FLUSH_INTERVAL` seconds, from a background thread) and the process
+    answering a scrape merges them all: counters and histograms are summed over
+    every file, gauges over processes that are still publishing. A process
+    that stops folds its counters and histograms into :data:`ACCUMULATOR`
+    and removes its file; so is the file of a process that died, after
+    :data:`RETENTION`. Merged totals therefore never go backwards when
+    workers are recycled (as with prometheus_client's multiprocess mode).
+    File names carry a per-start nonce, so a reused pid never takes over a
+    dead process' file. Without a directory only this process' values are
+    reported.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.directory: Optional[Path] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._nonce = uuid.uuid4().hex[:8]
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        sample: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> Gauge:
+        return self._register(Gauge(name, help, labels, sample))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def families(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.family() for metric in metrics}
+
+    def start(self, directory: Path) -> None:
+        """Publish to ``directory`` from now on."""
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._publish_loop, name="metrics", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.directory is not None:
+            with self._directory_lock():
+                self._fold([self.families()])
+                self._path().unlink(missing_ok=True)
+
+    def _directory_lock(self) -> FileLock:
+        # Scrapes read the files while exiting processes fold theirs away; neither may see the other half done.
+        return FileLock(self.directory / "metrics.lock")
+
+    def _fold(self, exited: List[Dict[str, Dict[str, Any]]]) -> None:
+        """Add the counters and histograms of exited processes to the accumulator; call with the lock held."""
+        path = self.directory / ACCUMULATOR
+        accumulated = _read_families(path) or {}
+        for families in exited:
+            _merge(accumulated, families, live=False)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(accumulated, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def _path(self) -> Path:
+        return self.directory / f"{socket.gethostname()}-{os.getpid()}-{self._nonce}.json"
+
+    def publish(self) -> None:
+        if self.directory is None:
+            return
+        path = self._path()
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(self.families(), separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            LOGGER.warning("Could not publish metrics: %s", exc)
+
+    def _publish_loop(self) -> None:
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self.publish()
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """Families merged over every process publishing to the directory."""
+        if self.directory is None:
+            return self.families()
+        self.publish()
+        merged: Dict[str, Dict[str, Any]] = {}
+        with self._directory_lock():
+            _merge(merged, _read_families(self.directory / ACCUMULATOR) or {}, live=False)
+            expired: List[Tuple[Path, Dict[str, Dict[str, Any]]]] = []
+            now = time.time()
+            for path in sorted(self.directory.glob("*.json")):
+                if path.name == ACCUMULATOR:
+                    continue
+                try:
+                    age = now - path.stat().st_mtime
+                except OSError:
+                    continue  # removed meanwhile
+                families = _read_families(path)
+                if families is None:
+                    continue
+                _merge(merged, families, live=age < STALE_AFTER)
+                if age > RETENTION:
+                    expired.append((path, families))
+            if expired:
+                self._fold([families for _, families in expired])
+                for path, _ in expired:
+                    path.unlink(missing_ok=True)
+        return merged
+
+    def render(self, extra: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """Prometheus text exposition of :meth:`collect`, plus ``extra`` families."""
+        families = self.collect()
+        families.update(extra or {})
+        return render_families(families)
+
+
+def _read_families(path: Path) -> Optional[Dict[str, Dict[str, Any]]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None  # not there (yet)
+
+
+def _merge(merged: Dict[str, Dict[str, Any]], families: Dict[str, Dict[str, Any]], live: bool) -> None:
+    for name, family in families.items():
+        if family["type"] == "gauge" and not live:
+            continue
+        target = merged.setdefault(name, {**family, "samples": []})
+        index = {tuple(key): position for position, (key, _) in enumerate(target["samples"])}
+        for key, value in family["samples"]:
+            position = index.get(tuple(key))
+            if position is None:
+                index[tuple(key)] = len(target["samples"])
+                target["samples"].append([key, value])
+            elif family["type"] == "histogram":
+                current = target["samples"][position][1]
+                if len(current["counts"]) != len(value["counts"]):
+                    continue  # bucket layout changed between releases
+                target["samples"][position][1] = {
+                    "counts": [a + b for a, b in zip(current["counts"], value["counts"])],
+                    "sum": current["sum"] + value["sum"],
+                }
+            else:
+                target["samples"][position][1] += value
+
+
+def render_families(families: Dict[str, Dict[str, Any]]) -> str:
+    lines: List[str] = []
+    for name, family in sorted(families.items()):
+        lines.append(f"# HELP {name} {_escape_help(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        labels = family["labels"]
+        for key, value in sorted(family["samples"], key=lambda sample: sample[0]):
+            pairs = list(zip(labels, key))
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip([*family["buckets"], math.inf], value["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _number(bound)
+                lines.append(f"{name}_bucket{_labels([*pairs, ('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(pairs)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape_label(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
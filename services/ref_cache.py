@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from core.config import get_settings
+from services.git_clone import RepoMetadata, fetch_repo_metadata, parse_repo_url
+from services.result_store import ResultStore, get_result_store
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _Entry:
+    metadata: RepoMetadata
+    fetched_at: float
+
+
+class RefCache:
+    """Caches ``owner/repo -> (default branch, head sha)`` lookups.
+
+    Entries younger than ``ttl_seconds`` are returned as-is. Older entries,
+    up to ``ttl_seconds + stale_seconds``, are still returned immediately while
+    a background refresh runs. Concurrent lookups for the same repository
+    share one ``git ls-remote``.
+    """
+
+    def __init__(
+        self,
+        resolver: Callable[[str], RepoMetadata],
+        store: ResultStore,
+        ttl_seconds: float,
+        stale_seconds: float,
+    ) -> None:
+        self.resolver = resolver
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, repo_url: str) -> RepoMetadata:
+        key = parse_repo_url(repo_url)
+        entry = self._lookup(key)
+        age = time.time() - entry.fetched_at if entry else None
+        if entry is not None and age < self.ttl_seconds:
+            self.store.increment_stat("ref_hits")
+            return entry.metadata
+        if entry is not None and age < self.ttl_seconds + self.stale_seconds:
+            self.store.increment_stat("ref_stale_hits")
+            self._resolve(key, repo_url, background=True)
+            return entry.metadata
+        self.store.increment_stat("ref_misses")
+        return self._resolve(key, repo_url).result()
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        row = self.store.get_ref(*key)
+        if row is None:
+            return None
+        default_branch, sha, fetched_at = row
+        entry = _Entry(RepoMetadata(owner=key[0], name=key[1], default_branch=default_branch, sha=sha), fetched_at)
+        self._entries[key] = entry
+        return entry
+
+    def _resolve(self, key: Tuple[str, str], repo_url: str, background: bool = False) -> Future:
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._inflight[key] = future
+        if background:
+            threading.Thread(
+                target=self._run, args=(key, repo_url, future), name=f"ref-refresh-{key[0]}/{key[1]}", daemon=True
+            ).start()
+        else:
+            self._run(key, repo_url, future)
+        return future
+
+    def _run(self, key: Tuple[str, str], repo_url: str, future: Future) -> None:
+        try:
+            metadata = self.resolver(repo_url)
+        except BaseException as exc:
+            LOGGER.warning("Ref lookup for %s/%s failed: %s", key[0], key[1], exc)
+            future.set_exception(exc)
+        else:
+            fetched_at = time.time()
+            self._entries[key] = _Entry(metadata, fetched_at)
+            future.set_result(metadata)
+            try:
+                self.store.put_ref(key[0], key[1], metadata.default_branch, metadata.sha, fetched_at)
+            except Exception:  # the in-memory entry is still valid
+                LOGGER.exception("Failed to persist ref for %s/%s", key[0], key[1])
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+_REF_CACHE: Optional[RefCache] = None
+_REF_CACHE_LOCK = threading.Lock()
+
+
+def get_ref_cache() -> RefCache:
+    global _REF_CACHE
+    with _REF_CACHE_LOCK:
+        if _REF_CACHE is None:
+            settings = get_settings()
+            _REF_CACHE = RefCache(
+                fetch_repo_metadata,
+                get_result_store(),
+                ttl_seconds=settings.ref_cache_ttl_seconds,
+                stale_seconds=settings.ref_cache_stale_seconds,
+            )
+    return _REF_CACHE
+
+
+def resolve_repo_metadata(repo_url: str) -> RepoMetadata:
+    return get_ref_cache().get(repo_url)
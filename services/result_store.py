@@ -0,0 +1,459 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import get_settings
+
+LOGGER = logging.getLogger(__name__)
+
+LEGACY_RESULT_FILENAME = "result.json"
+LEGACY_ANALYZER_VERSION = "0"
+
+# Access times and stat increments are buffered in memory and written this long after the
+# first one, so cache hits stay reads instead of serialized SQLite writes.
+FLUSH_INTERVAL = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    sha TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    cache_dir TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_repo ON results (owner, repo, created_at);
+CREATE TABLE IF NOT EXISTS clones (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size_bytes INTEGER,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_clones_access ON clones (last_access);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    owner TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    default_branch TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (owner, repo)
+);
+CREATE TABLE IF NOT EXISTS llm_responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_responses_access ON llm_responses (last_access);
+CREATE TABLE IF NOT EXISTS summaries (
+    sha TEXT PRIMARY KEY,
+    inputs TEXT NOT NULL,
+    summaries TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release of the schema: (table, column, definition).
+_MIGRATIONS = (
+    ("results", "last_access", "REAL NOT NULL DEFAULT 0"),
+    ("results", "encoding", "TEXT NOT NULL DEFAULT 'identity'"),
+    ("results", "analyzer_version", f"TEXT NOT NULL DEFAULT '{LEGACY_ANALYZER_VERSION}'"),
+    ("results", "file_count", "INTEGER"),
+)
+
+# Columns renamed since: (table, old name, new name).
+_RENAMES = (
+    # Mirrors are keyed ``<owner>_<repo>``, not by commit.
+    ("clones", "sha", "key"),
+)
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    """A result exactly as stored: compact JSON, usually gzip-compressed."""
+
+    sha: str
+    payload: bytes
+    encoding: str
+    analyzer_version: str
+
+    def decoded_bytes(self) -> bytes:
+        if self.encoding == "gzip":
+            return gzip.decompress(self.payload)
+        return self.payload
+
+
+def _file_count(result: Dict[str, Any]) -> Optional[int]:
+    return result.get("limits", {}).get("file_count_scanned")
+
+
+def _encode_payload(result: Dict[str, Any]) -> bytes:
+    raw = json.dumps(result, separators=(",", ":")).encode("utf-8")
+    # mtime=0 keeps the blob byte-identical for identical results.
+    return gzip.compress(raw, compresslevel=6, mtime=0)
+
+
+class ResultStore:
+    """Analysis results indexed by commit SHA and by owner/repo.
+
+    Backed by SQLite in WAL mode so several uvicorn workers can read while one
+    writes; every write is a single transaction, so readers never observe a
+    partial result.
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = db_path
+        self._local = threading.local()
+        self._pending_lock = threading.Lock()
+        self._pending_access: Dict[Tuple[str, str], float] = {}
+        self._pending_stats: Dict[str, int] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        is_new = not db_path.exists()
+        self._connection().executescript(_SCHEMA)
+        self._migrate()
+        if is_new:
+            self._import_legacy_results(db_path.parent)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self._connection())
+
+    def _migrate(self) -> None:
+        conn = self._connection()
+        for table, column, definition in _MIGRATIONS:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError:  # another worker migrated first
+                    continue
+                if column == "file_count":
+                    self._backfill_file_counts()
+        for table, old, new in _RENAMES:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if old in existing:
+                try:
+                    conn.execute(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}")
+                except sqlite3.OperationalError:  # another worker migrated first
+                    pass
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_access ON results (last_access)")
+
+    def _backfill_file_counts(self) -> None:
+        conn = self._connection()
+        rows = conn.execute("SELECT sha, payload, encoding FROM results").fetchall()
+        for sha, payload, encoding in rows:
+            payload = payload.encode("utf-8") if isinstance(payload, str) else payload
+            result = json.loads(StoredResult(sha, payload, encoding, LEGACY_ANALYZER_VERSION).decoded_bytes())
+            file_count = _file_count(result)
+            if file_count is not None:
+                conn.execute("UPDATE results SET file_count = ? WHERE sha = ?", (file_count, sha))
+
+    def get_blob(self, sha: str) -> Optional[StoredResult]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT payload, encoding, analyzer_version FROM results WHERE sha = ?", (sha,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._touch("results", sha)
+        payload = row[0].encode("utf-8") if isinstance(row[0], str) else row[0]
+        return StoredResult(sha=sha, payload=payload, encoding=row[1], analyzer_version=row[2])
+
+    def get(self, sha: str) -> Optional[Dict[str, Any]]:
+        stored = self.get_blob(sha)
+        if stored is None:
+            return None
+        return json.loads(stored.decoded_bytes())
+
+    def get_cache_dir(self, sha: str) -> Optional[Path]:
+        row = self._connection().execute("SELECT cache_dir FROM results WHERE sha = ?", (sha,)).fetchone()
+        return Path(row[0]) if row else None
+
+    def latest_for_repo(self, owner: str, repo: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        row = self._connection().execute(
+            "SELECT sha FROM results WHERE owner = ? AND repo = ? ORDER BY created_at DESC LIMIT 1",
+            (owner, repo),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], self.get(row[0])
+
+    def latest_file_count(self, owner: str, repo: str) -> Optional[int]:
+        """Files scanned by the repository's latest analysis, without loading the result."""
+        row = self._connection().execute(
+            "SELECT file_count FROM results WHERE owner = ? AND repo = ? ORDER BY created_at DESC LIMIT 1",
+            (owner, repo),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(
+        self,
+        sha: str,
+        owner: str,
+        repo: str,
+        cache_dir: Path,
+        result: Dict[str, Any],
+        analyzer_version: str = LEGACY_ANALYZER_VERSION,
+    ) -> None:
+        payload = _encode_payload(result)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(sha, owner, repo, cache_dir, payload, encoding, analyzer_version, file_count, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, 'gzip', ?, ?, ?, ?)",
+                (
+                    sha,
+                    owner,
+                    repo,
+                    str(cache_dir),
+                    sqlite3.Binary(payload),
+                    analyzer_version,
+                    _file_count(result),
+                    now,
+                    now,
+                ),
+            )
+
+    def delete_result(self, sha: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM results WHERE sha = ?", (sha,))
+            conn.execute("DELETE FROM summaries WHERE sha = ?", (sha,))
+
+    def results_lru(self) -> List[Tuple[str, str, int]]:
+        """``(sha, cache_dir, payload size)`` for every result, least recently used first."""
+        self.flush()
+        return self._connection().execute(
+            "SELECT sha, cache_dir, length(payload) FROM results ORDER BY last_access ASC, rowid ASC"
+        ).fetchall()
+
+    def results_size(self) -> int:
+        row = self._connection().execute("SELECT COALESCE(SUM(length(payload)), 0) FROM results").fetchone()
+        return int(row[0])
+
+    def track_clone(self, key: str, path: Path) -> None:
+        """Record that the clone at ``path`` was just used; its size is measured (again) later.
+
+        ``key`` is ``<owner>_<repo>`` for shared mirrors, which grow with every fetch.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO clones (key, path, size_bytes, last_access) VALUES (?, ?, NULL, ?) "
+                "ON CONFLICT(key) DO UPDATE SET path = excluded.path, size_bytes = NULL, "
+                "last_access = excluded.last_access",
+                (key, str(path), time.time()),
+            )
+
+    def register_clone(self, key: str, path: Path, last_access: float) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO clones (key, path, size_bytes, last_access) VALUES (?, ?, NULL, ?)",
+                (key, str(path), last_access),
+            )
+
+    def set_clone_size(self, key: str, size_bytes: int) -> None:
+        with self._transaction() as conn:
+            conn.execute("UPDATE clones SET size_bytes = ? WHERE key = ?", (size_bytes, key))
+
+    def delete_clone(self, key: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM clones WHERE key = ?", (key,))
+
+    def clones_lru(self) -> List[Tuple[str, str, Optional[int], float]]:
+        """``(key, path, size, last access)`` for every clone, least recently used first."""
+        return self._connection().execute(
+            "SELECT key, path, size_bytes, last_access FROM clones ORDER BY last_access ASC, rowid ASC"
+        ).fetchall()
+
+    def clone_size(self, key: str) -> Optional[int]:
+        """Measured size of the repository's mirror, keyed ``<owner>_<repo>``."""
+        row = self._connection().execute("SELECT size_bytes FROM clones WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def get_ref(self, owner: str, repo: str) -> Optional[Tuple[str, str, float]]:
+        """``(default branch, head sha, fetched at)`` last resolved for a repository."""
+        return self._connection().execute(
+            "SELECT default_branch, sha, fetched_at FROM refs WHERE owner = ? AND repo = ?", (owner, repo)
+        ).fetchone()
+
+    def put_ref(self, owner: str, repo: str, default_branch: str, sha: str, fetched_at: float) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO refs (owner, repo, default_branch, sha, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (owner, repo, default_branch, sha, fetched_at),
+            )
+
+    def get_llm_response(self, key: str) -> Optional[str]:
+        conn = self._connection()
+        row = conn.execute("SELECT response FROM llm_responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._touch("llm_responses", key)
+        return row[0]
+
+    def put_llm_response(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+
+    def delete_llm_response(self, key: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+
+    def llm_responses_lru(self) -> List[Tuple[str, int]]:
+        """``(key, response size)`` for every cached LLM response, least recently used first."""
+        self.flush()
+        return self._connection().execute(
+            "SELECT key, length(CAST(response AS BLOB)) FROM llm_responses ORDER BY last_access ASC, rowid ASC"
+        ).fetchall()
+
+    def llm_responses_size(self) -> int:
+        row = self._connection().execute(
+            "SELECT COALESCE(SUM(length(CAST(response AS BLOB))), 0) FROM llm_responses"
+        ).fetchone()
+        return int(row[0])
+
+    def put_summary_inputs(self, sha: str, inputs: Dict[str, Any]) -> None:
+        """Record what the deferred summaries of ``sha`` are written from; clears any earlier summaries."""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (sha, inputs, summaries, updated_at) VALUES (?, ?, NULL, ?)",
+                (sha, json.dumps(inputs, separators=(",", ":")), time.time()),
+            )
+
+    def get_summaries(self, sha: str) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """``(inputs, summaries)`` for ``sha``; summaries are ``None`` until they have been written."""
+        row = self._connection().execute("SELECT inputs, summaries FROM summaries WHERE sha = ?", (sha,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), json.loads(row[1]) if row[1] is not None else None
+
+    def put_summaries(self, sha: str, summaries: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE summaries SET summaries = ?, updated_at = ? WHERE sha = ?",
+                (json.dumps(summaries, separators=(",", ":")), time.time(), sha),
+            )
+
+    def increment_stat(self, name: str, amount: int = 1) -> None:
+        with self._pending_lock:
+            self._pending_stats[name] = self._pending_stats.get(name, 0) + amount
+        self._schedule_flush()
+
+    def _touch(self, table: str, key: str) -> None:
+        with self._pending_lock:
+            self._pending_access[(table, key)] = time.time()
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        with self._pending_lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(FLUSH_INTERVAL, self._timed_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.name = "result-store-flush"
+            self._flush_timer.start()
+
+    def _timed_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            LOGGER.exception("Could not flush cache access times and stats to %s", self.db_path)
+
+    def flush(self) -> None:
+        """Write buffered access times and stat increments in one transaction."""
+        with self._pending_lock:
+            access, self._pending_access = self._pending_access, {}
+            stats, self._pending_stats = self._pending_stats, {}
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if not access and not stats:
+            return
+        with self._transaction() as conn:
+            for table in ("results", "llm_responses"):
+                column = "sha" if table == "results" else "key"
+                conn.executemany(
+                    # Never move an access time backwards (another worker may have flushed a later one).
+                    f"UPDATE {table} SET last_access = MAX(last_access, ?) WHERE {column} = ?",
+                    [(at, key) for (name, key), at in access.items() if name == table],
+                )
+            conn.executemany(
+                "INSERT INTO cache_stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(stats.items()),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        self.flush()
+        return dict(self._connection().execute("SELECT name, value FROM cache_stats").fetchall())
+
+    def _import_legacy_results(self, cache_root: Path) -> None:
+        """One-off import of ``<owner>_<repo>/<sha>/result.json`` files."""
+        imported = 0
+        for result_path in cache_root.glob(f"*/*/{LEGACY_RESULT_FILENAME}"):
+            try:
+                with result_path.open("r", encoding="utf-8") as handle:
+                    data = json.load(handle)
+                owner, _, repo = data["repo"]["name"].partition("/")
+                sha = data["repo"]["sha"]
+            except (OSError, ValueError, KeyError) as exc:
+                LOGGER.warning("Skipping unreadable cached result %s: %s", result_path, exc)
+                continue
+            self.put(sha, owner, repo, result_path.parent, data)
+            imported += 1
+        if imported:
+            LOGGER.info("Imported %d cached results into %s", imported, self.db_path)
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+_STORE: Optional[ResultStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_result_store() -> ResultStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ResultStore(get_settings().result_db)
+    return _STORE
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from core.config import get_settings
+from services.result_store import ResultStore, get_result_store
+
+LOGGER = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class AdmissionError(RuntimeError):
+    """The analysis queue is full; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Lane:
+    """A bounded pool of analysis slots with a bounded waiting queue."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._avg_seconds = 60.0
+        self._cond = threading.Condition()
+
+    def check(self) -> None:
+        with self._cond:
+            self._check_locked()
+
+    def _check_locked(self) -> None:
+        if self.running >= self.max_concurrency and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionError(f"The {self.name} analysis queue is full", self.retry_after())
+
+    def retry_after(self) -> int:
+        # Rough time until a queue position frees up.
+        backlog = (self.waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(backlog * self._avg_seconds))
+
+    def acquire(self) -> None:
+        with self._cond:
+            self._check_locked()
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.running < self.max_concurrency, self.queue_timeout)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.rejected += 1
+                raise AdmissionError(f"Timed out waiting in the {self.name} analysis queue", self.retry_after())
+            self.running += 1
+
+    def release(self, elapsed: float) -> None:
+        with self._cond:
+            self.running -= 1
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._cond.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "running": self.running,
+                "waiting": self.waiting,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "rejected": self.rejected,
+                "avg_seconds": round(self._avg_seconds, 2),
+            }
+
+
+class _Slot:
+    def __init__(self, lane: Lane) -> None:
+        self.lane = lane
+        self._started = 0.0
+
+    def __enter__(self) -> Lane:
+        self.lane.acquire()
+        self._started = time.monotonic()
+        return self.lane
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.lane.release(time.monotonic() - self._started)
+
+
+class AnalysisScheduler:
+    """Admission control in front of the clone-and-parse pipeline.
+
+    Repositories known to be large (by the file count of an earlier analysis
+    or the size of an earlier clone) go to the slow lane, so small repositories
+    never queue behind monorepos. Unknown repositories start in the fast lane.
+    """
+
+    def __init__(
+        self,
+        store: ResultStore,
+        fast: Lane,
+        slow: Lane,
+        slow_min_files: int,
+        slow_min_clone_bytes: int,
+    ) -> None:
+        self.store = store
+        self.fast = fast
+        self.slow = slow
+        self.slow_min_files = slow_min_files
+        self.slow_min_clone_bytes = slow_min_clone_bytes
+
+    @property
+    def capacity(self) -> int:
+        return sum(lane.max_concurrency + lane.max_queue for lane in (self.fast, self.slow))
+
+    def lane_for(self, owner: str, repo: str) -> Lane:
+        file_count = self.store.latest_file_count(owner, repo)
+        if file_count is not None:
+            return self.slow if file_count >= self.slow_min_files else self.fast
+        clone_bytes = self.store.clone_size(f"{owner}_{repo}")
+        if clone_bytes is not None and clone_bytes >= self.slow_min_clone_bytes:
+            return self.slow
+        return self.fast
+
+    def check(self, owner: str, repo: str) -> None:
+        """Raise :class:`AdmissionError` now if the repository's lane is full."""
+        self.lane_for(owner, repo).check()
+
+    def slot(self, owner: str, repo: str) -> _Slot:
+        """Context manager that waits for a slot in the repository's lane."""
+        lane = self.lane_for(owner, repo)
+        LOGGER.info("Scheduling %s/%s in the %s lane", owner, repo, lane.name)
+        return _Slot(lane)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"fast": self.fast.snapshot(), "slow": self.slow.snapshot()}
+
+
+_SCHEDULER: Optional[AnalysisScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> AnalysisScheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            settings = get_settings()
+            timeout = settings.analysis_queue_timeout_seconds
+            _SCHEDULER = AnalysisScheduler(
+                get_result_store(),
+                fast=Lane("fast", settings.analysis_fast_concurrency, settings.analysis_queue_size, timeout),
+                slow=Lane("slow", settings.analysis_slow_concurrency, settings.analysis_queue_size, timeout),
+                slow_min_files=settings.slow_lane_min_files,
+                slow_min_clone_bytes=settings.slow_lane_min_clone_mb * MB,
+            )
+    return _SCHEDULER
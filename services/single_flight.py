@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CallCancelled(Exception):
+    """The caller running a call gave up on it; the outcome says nothing about the work itself."""
+
+
+class FileLock:
+    """Exclusive advisory lock on ``path``, shared by every process on the node.
+
+    The file may be deleted with :meth:`remove` while the lock is held;
+    waiters then lock whichever file is at ``path`` by the time they get in.
+    """
+
+    def __init__(self, path: Path, poll_interval: float = 0.1) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if not self._lock(fd, deadline):
+                os.close(fd)
+                return False
+            if self._is_current(fd):
+                self._fd = fd
+                return True
+            # Removed by its previous holder while we waited; closing unlocks the stale file.
+            os.close(fd)
+
+    def _lock(self, fd: int, deadline: Optional[float]) -> bool:
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:  # pragma: no cover - Windows
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(self.poll_interval)
+                continue
+            return True
+
+    def _is_current(self, fd: int) -> bool:
+        if fcntl is None:  # pragma: no cover - Windows, where open files can't be deleted
+            return True
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        locked = os.fstat(fd)
+        return (locked.st_dev, locked.st_ino) == (current.st_dev, current.st_ino)
+
+    def remove(self) -> None:
+        """Delete the lock file, then release the lock; for locks on things that no longer exist."""
+        if self._fd is None:
+            return
+        try:
+            os.unlink(self.path)
+        except OSError:  # already gone, or open elsewhere on Windows
+            pass
+        self.release()
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:  # pragma: no cover - Windows
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class FileSemaphore:
+    """Node-wide counting semaphore built from ``slots`` lock files in ``lock_dir``."""
+
+    def __init__(self, lock_dir: Path, name: str, slots: int) -> None:
+        self.paths = [lock_dir / f"{name}.{index}.lock" for index in range(max(slots, 1))]
+
+    def try_acquire(self) -> Optional[FileLock]:
+        for path in self.paths:
+            lock = FileLock(path)
+            if lock.acquire(timeout=0):
+                return lock
+        return None
+
+    def acquire(self, poll_interval: float = 0.1) -> FileLock:
+        while True:
+            lock = self.try_acquire()
+            if lock is not None:
+                return lock
+            time.sleep(poll_interval)
+
+
+def flight_lock_path(lock_dir: Path, key: str) -> Path:
+    """Lock file :class:`SingleFlight` holds while the call for ``key`` runs."""
+    return lock_dir / f"{key}.lock"
+
+
+class SingleFlight(Generic[T]):
+    """Runs at most one call per key at a time.
+
+    Callers in the same process that arrive while a call is running wait for
+    its outcome instead of starting their own, unless it ends in
+    :class:`CallCancelled`: then one of them runs it again. Across processes
+    the call runs under a per-key :class:`FileLock` in ``lock_dir``, so work
+    that another worker already finished can be detected and reused.
+    """
+
+    def __init__(self, lock_dir: Path) -> None:
+        self.lock_dir = lock_dir
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._inflight[key] = future
+            if leader:
+                break
+            LOGGER.info("Joining in-flight work for %s", key)
+            try:
+                return future.result()
+            except CallCancelled:
+                LOGGER.info("In-flight work for %s was cancelled; running it here", key)
+
+        try:
+            with FileLock(flight_lock_path(self.lock_dir, key)):
+                result = fn()
+        except BaseException as exc:
+            with self._lock:
+                # Forgotten first, so waiters that retry after a cancellation find no stale call.
+                self._inflight.pop(key, None)
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
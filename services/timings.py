@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from services.tracing import add_span, current_trace
+
+_STATM = "/proc/self/statm"
+
+
+def current_rss_mb() -> Optional[float]:
+    """The process' resident set size now, or ``None`` where it can't be read (outside Linux)."""
+    try:
+        with open(_STATM, "rb") as handle:
+            resident_pages = int(handle.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def rss_delta(started_mb: Optional[float]) -> Dict[str, float]:
+    """``{"rss_delta_mb": ...}`` since ``started_mb`` (from :func:`current_rss_mb`), or nothing if unknown."""
+    now = current_rss_mb()
+    if started_mb is None or now is None:
+        return {}
+    return {"rss_delta_mb": round(now - started_mb, 1)}
+
+
+# Rounding of the reported stage fields that are not plain counts.
+_DIGITS = {"seconds": 4, "rss_delta_mb": 1}
+
+
+class Timings:
+    """Wall-clock seconds, counts and resident memory growth per stage of one analysis.
+
+    Stages recorded more than once (one per file read, one per LLM call, ...)
+    accumulate their seconds and counts. Stages timed as a block also get
+    ``rss_delta_mb``, how much the process' resident set grew (or shrank)
+    across it. It is process-wide, so analyses running side by side show up
+    in each other's deltas.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, **counts: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0})
+            entry["seconds"] += seconds
+            for key, value in counts.items():
+                entry[key] = entry.get(key, 0) + value
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, float]]:
+        """Time the block; counts put in the yielded dict are recorded with it."""
+        counts: Dict[str, float] = {}
+        rss_started = current_rss_mb()
+        started = time.monotonic()
+        try:
+            yield counts
+        finally:
+            self.add(name, time.monotonic() - started, **counts, **rss_delta(rss_started))
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                name: {key: round(value, _DIGITS[key]) if key in _DIGITS else value for key, value in entry.items()}
+                for name, entry in self.stages.items()
+            }
+        return {"total_seconds": round(time.monotonic() - self.started, 4), "stages": stages}
+
+
+# The timings of the analysis running in this context, if any.
+_CURRENT: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+def current_timings() -> Optional[Timings]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def collect_timings() -> Iterator[Timings]:
+    """Record the stages timed in this context (and not in threads it starts) into a new :class:`Timings`."""
+    timings = Timings()
+    token = _CURRENT.set(timings)
+    try:
+        yield timings
+    finally:
+        _CURRENT.reset(token)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[Dict[str, float]]:
+    """:meth:`Timings.stage` on the current timings, and a span on the current trace.
+
+    A no-op outside both :func:`collect_timings` and :func:`~services.tracing.collect_trace`.
+    """
+    timings = _CURRENT.get()
+    trace = current_trace()
+    if timings is None and trace is None:
+        yield {}
+        return
+    counts: Dict[str, float] = {}
+    rss_started = current_rss_mb() if timings is not None else None
+    started = time.monotonic()
+    try:
+        yield counts
+    finally:
+        seconds = time.monotonic() - started
+        if timings is not None:
+            timings.add(name, seconds, **counts, **rss_delta(rss_started))
+        if trace is not None:
+            trace.add(name, started, seconds, **counts)
+
+
+def record(name: str, seconds: float, **counts: float) -> None:
+    """Add a stage that has just finished; it is traced as ending now."""
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.add(name, seconds, **counts)
+    if seconds:  # zero only adds counts to a stage timed elsewhere
+        add_span(name, time.monotonic() - seconds, seconds, **counts)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Trace:
+    """Spans of one traced request, written as Chrome trace-event JSON.
+
+    Every span is a complete (``"ph": "X"``) event on the thread that
+    recorded it, so the parse loop, pool threads running LLM calls and git
+    subprocesses show up as separate tracks in Perfetto or ``chrome://tracing``.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, seconds: float, **args: Any) -> None:
+        """Record a span that began at ``started`` (``time.monotonic()``) and lasted ``seconds``."""
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": name.split(":", 1)[0],
+            "ph": "X",
+            "ts": round((started - self.started) * 1e6, 1),
+            "dur": round(seconds * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Trace the block; values put in the yielded dict become the span's ``args``."""
+        args: Dict[str, Any] = {}
+        started = time.monotonic()
+        try:
+            yield args
+        finally:
+            self.add(name, started, time.monotonic() - started, **args)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            names = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            events = sorted(self.events, key=lambda event: event["ts"])
+        return {"traceEvents": names + events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path) -> None:
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.as_dict(), separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+# The trace of the request running in this context, if it asked for one.
+_CURRENT: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def collect_trace(enabled: bool = True) -> Iterator[Optional[Trace]]:
+    """Record the spans traced in this context into a new :class:`Trace`; yields ``None`` when not ``enabled``."""
+    if not enabled:
+        yield None
+        return
+    trace = Trace()
+    token = _CURRENT.set(trace)
+    try:
+        yield trace
+    finally:
+        _CURRENT.reset(token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[Dict[str, Any]]:
+    """:meth:`Trace.span` on the current trace; a no-op outside :func:`collect_trace`."""
+    trace = _CURRENT.get()
+    if trace is None:
+        yield {}
+        return
+    with trace.span(name) as args:
+        yield args
+
+
+def add_span(name: str, started: float, seconds: float, **args: Any) -> None:
+    trace = _CURRENT.get()
+    if trace is not None:
+        trace.add(name, started, seconds, **args)
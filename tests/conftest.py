@@ -0,0 +1,34 @@
+import zipfile
+
+import pytest
+
+import services.analyze as analyze
+import services.git_clone as git_clone
+from services.result_store import ResultStore
+from services.single_flight import SingleFlight
+
+
+@pytest.fixture
+def analysis_store(tmp_path, monkeypatch):
+    """Analyses write their cache, logs, locks and results under ``tmp_path``; returns the result store."""
+    store = ResultStore(tmp_path / "results.sqlite3")
+    local = git_clone.get_settings().copy(
+        update={"cache_root": tmp_path / "cache", "log_dir": tmp_path, "lock_dir": tmp_path / "locks"}
+    )
+    monkeypatch.setattr(git_clone, "get_settings", lambda: local)
+    monkeypatch.setattr(analyze, "settings", local)
+    monkeypatch.setattr(analyze, "get_result_store", lambda: store)
+    monkeypatch.setattr(analyze, "_single_flight", SingleFlight(local.lock_dir))
+    monkeypatch.setattr(analyze, "_summary_flight", SingleFlight(local.lock_dir))
+    return store
+
+
+@pytest.fixture
+def demo_zip(tmp_path):
+    """A release-style archive: two Python modules and an image under ``demo/``."""
+    archive_path = tmp_path / "demo.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("demo/app.py", "import util\n")
+        archive.writestr("demo/util.py", "VALUE = 1\n")
+        archive.writestr("demo/logo.png", b"\x89PNG")
+    return archive_path
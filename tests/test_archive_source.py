@@ -0,0 +1,51 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from services.archive_source import archive_name, iter_archive
+
+FILES = {
+    "demo-1.0/README.md": b"# Demo\n",
+    "demo-1.0/pkg/app.py": b"import os\n",
+    "demo-1.0/assets/logo.png": b"\x89PNG" + b"\x00" * 64,
+}
+
+
+def _loaded(path):
+    return {rel_path: load() if load else None for rel_path, load in iter_archive(path)}
+
+
+def test_tar_members_are_read_in_place_and_filtered_by_name(tmp_path):
+    path = tmp_path / "demo.tar.gz"
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in FILES.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+    assert _loaded(path) == {"README.md": b"# Demo\n", "pkg/app.py": b"import os\n", "assets/logo.png": None}
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_zip_members_are_read_in_place(tmp_path):
+    path = tmp_path / "demo.zip"
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in FILES.items():
+            archive.writestr(name, data)
+        archive.writestr("other/top.py", b"x = 1\n")
+
+    loaded = _loaded(path)
+    # Two top-level directories: paths are kept as-is.
+    assert loaded["demo-1.0/pkg/app.py"] == b"import os\n"
+    assert loaded["other/top.py"] == b"x = 1\n"
+    assert loaded["demo-1.0/assets/logo.png"] is None
+
+
+def test_unsupported_archives_are_rejected(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("hello")
+    with pytest.raises(ValueError):
+        list(iter_archive(path))
+    assert archive_name("uploads/My Repo-2.1.tar.gz") == "My_Repo-2.1"
@@ -0,0 +1,108 @@
+import os
+
+from services.cache_janitor import CacheJanitor
+from services.git_clone import mirror_lock_path
+from services.result_store import ResultStore
+from services.single_flight import FileLock, flight_lock_path
+
+
+def _make_mirror(root, repo, size, age):
+    mirror = root / f"octo_{repo}" / "mirror.git"
+    mirror.mkdir(parents=True)
+    (mirror / "blob.bin").write_bytes(b"x" * size)
+    os.utime(mirror, (age, age))
+    return mirror
+
+
+def test_least_recently_used_clones_are_evicted_first(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    old = _make_mirror(tmp_path, "old", 600, age=1_000)
+    new = _make_mirror(tmp_path, "new", 600, age=2_000)
+    store.put("abc", "octo", "old", old.parent / "abc", {"repo": {}})
+    janitor = CacheJanitor(store, tmp_path, clone_budget_bytes=1_000, result_budget_bytes=10_000)
+
+    assert janitor.run_once() == {"clones": 1, "results": 0, "llm": 0}
+    assert not old.exists() and new.exists()
+    # The small result outlives its clone.
+    assert store.get("abc") == {"repo": {}}
+    assert janitor.usage()["clones"]["evictions"] == 1
+
+
+def test_mirrors_with_worktrees_are_kept(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    busy = _make_mirror(tmp_path, "busy", 600, age=1_000)
+    (busy / "worktrees" / "repo").mkdir(parents=True)
+    janitor = CacheJanitor(store, tmp_path, clone_budget_bytes=0, result_budget_bytes=10_000)
+
+    assert janitor.run_once()["clones"] == 0
+    assert busy.exists()
+
+
+def test_mirrors_being_fetched_are_kept(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    busy = _make_mirror(tmp_path, "busy", 600, age=1_000)
+    janitor = CacheJanitor(store, tmp_path, clone_budget_bytes=0, result_budget_bytes=10_000)
+    lock = FileLock(mirror_lock_path(janitor.lock_dir, "octo_busy"))
+    lock.acquire()
+    try:
+        assert janitor.run_once()["clones"] == 0
+        assert busy.exists()
+    finally:
+        lock.release()
+
+    assert janitor.run_once()["clones"] == 1
+    assert not busy.exists()
+    assert not mirror_lock_path(janitor.lock_dir, "octo_busy").exists()
+
+
+def test_results_are_evicted_over_budget(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    for sha in ("a", "b", "c"):
+        store.put(sha, "octo", "demo", tmp_path / sha, {"payload": os.urandom(64).hex()})
+    store.get("a")  # refresh "a" so "b" is now the least recently used
+    budget = store.results_size() - 1
+    janitor = CacheJanitor(store, tmp_path, clone_budget_bytes=0, result_budget_bytes=budget)
+
+    assert janitor.run_once()["results"] == 1
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+
+
+def test_results_being_analysed_are_kept_and_lock_files_removed_with_the_rest(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    for sha in ("a", "b"):
+        store.put(sha, "octo", "demo", tmp_path / sha, {"payload": os.urandom(64).hex()})
+    janitor = CacheJanitor(store, tmp_path, clone_budget_bytes=0, result_budget_bytes=0)
+    busy = FileLock(flight_lock_path(janitor.lock_dir, "a"))
+    busy.acquire()
+    summarized = FileLock(flight_lock_path(janitor.lock_dir, "b.summaries"))
+    summarized.acquire()
+    summarized.release()
+    try:
+        assert janitor.run_once()["results"] == 1
+    finally:
+        busy.release()
+
+    assert store.get("a") is not None and store.get("b") is None
+    assert sorted(path.name for path in janitor.lock_dir.iterdir()) == ["a.lock"]
+
+
+def test_hit_ratio_reporting(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.increment_stat("clone_hits", 3)
+    store.increment_stat("clone_misses")
+    usage = CacheJanitor(store, tmp_path, 1, 1).usage()
+    assert usage["clones"]["hit_ratio"] == 0.75
+    assert usage["results"]["hit_ratio"] is None
+
+
+def test_llm_responses_are_evicted_over_budget(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    for key in ("a", "b", "c"):
+        store.put_llm_response(key, "model", "x" * 100)
+    store.get_llm_response("a")
+    janitor = CacheJanitor(store, tmp_path, clone_budget_bytes=0, result_budget_bytes=0, llm_budget_bytes=200)
+
+    assert janitor.run_once()["llm"] == 1
+    assert store.get_llm_response("b") is None
+    assert janitor.usage()["llm"]["bytes"] == 200
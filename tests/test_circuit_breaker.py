@@ -0,0 +1,38 @@
+import socket
+import time
+
+from services.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from services.llm import LocalLLM
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_on_probe():
+    healthy = []
+    breaker = CircuitBreaker("test", probe=lambda: bool(healthy), failure_threshold=2, probe_interval=0.05)
+    breaker.record_failure()
+    breaker.record_success(0.5)
+    breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    healthy.append(True)
+    deadline = time.monotonic() + 2
+    while breaker.state != CLOSED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert breaker.allow()
+    assert breaker.snapshot()["latency_p95_seconds"] == 0.5
+
+
+def test_llm_calls_are_skipped_while_the_server_is_down():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    llm = LocalLLM(endpoint=f"http://127.0.0.1:{port}")
+    for _ in range(llm.endpoints[0].breaker.failure_threshold):
+        assert llm.summarize_module("app.py", "context") is None
+    assert llm.endpoints[0].breaker.state == OPEN
+
+    started = time.monotonic()
+    assert llm.summarize_repo("context") == []
+    assert time.monotonic() - started < 0.05
+    assert llm.endpoints[0].breaker.snapshot()["failures"] == llm.endpoints[0].breaker.failure_threshold
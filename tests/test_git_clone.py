@@ -0,0 +1,140 @@
+import os
+import stat
+import subprocess
+import threading
+import time
+
+import pytest
+
+import services.git_clone as git_clone
+from services.git_clone import GitCancelledError, GitTimeoutError, _parse_symref
+from services.single_flight import FileSemaphore
+
+
+@pytest.fixture(autouse=True)
+def _local_git_slots(tmp_path, monkeypatch):
+    monkeypatch.setattr(git_clone, "_git_slots", lambda: FileSemaphore(tmp_path / "locks", "git", 2))
+
+
+def test_parse_symref_handles_branches_with_slashes():
+    output = "ref: refs/heads/release/v2\tHEAD\n0123abcd\tHEAD\n"
+    assert _parse_symref(output) == ("release/v2", "0123abcd")
+    assert _parse_symref("") == ("main", "")
+
+
+def test_run_git_returns_output_and_raises_on_failure(tmp_path):
+    subprocess.run(["git", "init", "-q", str(tmp_path / "repo")], check=True)
+    assert git_clone._run_git("-C", str(tmp_path / "repo"), "rev-parse", "--git-dir", timeout=10) == ".git"
+    with pytest.raises(ValueError):
+        git_clone._run_git("-C", str(tmp_path / "repo"), "rev-parse", "HEAD~5", timeout=10)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="uses a POSIX shell script as a fake git")
+def test_run_git_kills_hung_git_on_deadline(tmp_path, monkeypatch):
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    fake_git = fake_bin / "git"
+    fake_git.write_text("#!/bin/sh\nsleep 30 &\nwait\n")
+    fake_git.chmod(fake_git.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{fake_bin}{os.pathsep}{os.environ['PATH']}")
+
+    started = time.monotonic()
+    with pytest.raises(GitTimeoutError, match="git fetch timed out"):
+        git_clone._run_git("-C", str(tmp_path), "fetch", "origin", timeout=0.3)
+    assert time.monotonic() - started < 5
+
+
+def _source_repo(path):
+    files = {
+        "README.md": "# Demo\n",
+        "pkg/app.py": "import os\n",
+        "web/index.ts": "export const x = 1;\n",
+        "assets/logo.bin": "x" * 4096,
+        "docs/guide.md": "# Guide\n",
+    }
+    for rel_path, text in files.items():
+        (path / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (path / rel_path).write_text(text)
+    git = ["git", "-C", str(path), "-c", "user.name=t", "-c", "user.email=t@example.com"]
+    subprocess.run(["git", "init", "-q", "-b", "main", str(path)], check=True)
+    subprocess.run([*git, "config", "uploadpack.allowFilter", "true"], check=True)
+    return files
+
+
+def _commit(path, message):
+    git = ["git", "-C", str(path), "-c", "user.name=t", "-c", "user.email=t@example.com"]
+    subprocess.run([*git, "add", "."], check=True)
+    subprocess.run([*git, "commit", "-q", "-m", message], check=True)
+    return subprocess.run([*git, "rev-parse", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def local_cache(tmp_path, monkeypatch):
+    settings = git_clone.get_settings().copy(update={"cache_root": tmp_path / "cache", "lock_dir": tmp_path / "locks"})
+    monkeypatch.setattr(git_clone, "get_settings", lambda: settings)
+    return settings
+
+
+def test_commits_are_checked_out_sparsely_from_a_shared_mirror(tmp_path, local_cache):
+    source = tmp_path / "source"
+    files = _source_repo(source)
+    first = _commit(source, "init")
+    url = source.as_uri()
+
+    metadata = git_clone.RepoMetadata(owner="o", name="r", default_branch="main", sha=first)
+    repo_path = git_clone.ensure_cloned(url, metadata)
+    written = sorted(
+        path.relative_to(repo_path).as_posix()
+        for path in repo_path.rglob("*")
+        if path.is_file() and ".git" not in path.relative_to(repo_path).parts
+    )
+    assert written == ["README.md", "pkg/app.py", "web/index.ts"]
+    assert sorted(git_clone.list_tracked_files(repo_path)) == sorted(files)
+    assert git_clone.worktree_bytes(repo_path) == sum(len(files[name]) for name in written)
+    git_clone.release_clone(metadata)
+    assert not repo_path.exists()
+
+    (source / "pkg" / "extra.py").write_text("import sys\n")
+    second = _commit(source, "more")
+    mirror = git_clone.mirror_path(metadata)
+    before = git_clone.object_store_bytes(mirror)
+    metadata = git_clone.RepoMetadata(owner="o", name="r", default_branch="main", sha=second)
+    repo_path = git_clone.ensure_cloned(url, metadata)
+    assert (repo_path / "pkg" / "extra.py").exists()
+    assert git_clone.object_store_bytes(mirror) > before
+    git_clone.release_clone(metadata)
+    # Only the mirror and the (now empty) per-commit directories remain.
+    assert sorted(path.name for path in mirror.parent.iterdir()) == sorted([mirror.name, first, second])
+    assert not list(mirror.parent.glob("*/repo"))
+
+
+@pytest.mark.skipif(os.name == "nt", reason="uses a POSIX shell script as a fake git")
+def test_run_git_streams_progress_and_stops_when_cancelled(tmp_path, monkeypatch):
+    fake_bin = tmp_path / "bin"
+    fake_bin.mkdir()
+    fake_git = fake_bin / "git"
+    fake_git.write_text(
+        "#!/bin/sh\n"
+        "printf 'Receiving objects:  50%%\\r' >&2\n"
+        "printf 'Receiving objects: 100%%, done.\\n' >&2\n"
+        "sleep 30 &\nwait\n"
+    )
+    fake_git.chmod(fake_git.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{fake_bin}{os.pathsep}{os.environ['PATH']}")
+
+    cancel = threading.Event()
+    lines = []
+
+    def on_progress(line):
+        lines.append(line)
+        if line.endswith("done."):
+            cancel.set()
+
+    started = time.monotonic()
+    with pytest.raises(GitCancelledError, match="git fetch was cancelled"):
+        git_clone._run_git("-C", str(tmp_path), "fetch", "origin", timeout=30, on_progress=on_progress, cancel=cancel)
+    assert time.monotonic() - started < 5
+    assert lines == ["Receiving objects:  50%", "Receiving objects: 100%, done."]
+    # Nothing is started once cancelled.
+    with pytest.raises(GitCancelledError):
+        git_clone._run_git("--version", cancel=cancel)
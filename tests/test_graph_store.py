@@ -0,0 +1,51 @@
+import json
+import xml.etree.ElementTree as ET
+
+import networkx as nx
+
+from graphs.graph_store import iter_export, iter_graph_records, write_graph
+
+
+def _sample_graph() -> nx.DiGraph:
+    graph = nx.DiGraph()
+    graph.add_node("app/main.py", language="python")
+    graph.add_node("src/<index>.js", language="javascript")
+    graph.add_edge("app/main.py", "fastapi")
+    graph.add_edge("src/<index>.js", "app/main.py")
+    return graph
+
+
+def test_write_graph_round_trips_records(tmp_path):
+    path = tmp_path / "graph.ndjson"
+    write_graph(_sample_graph(), path)
+    records = list(iter_graph_records(path))
+    assert [r["type"] for r in records] == ["node", "node", "node", "edge", "edge"]
+    assert {"type": "edge", "source": "app/main.py", "target": "fastapi"} in records
+
+
+def test_export_formats_are_well_formed(tmp_path):
+    path = tmp_path / "graph.ndjson"
+    write_graph(_sample_graph(), path)
+
+    as_json = json.loads(b"".join(iter_export(path, "json")))
+    assert len(as_json["nodes"]) == 3
+    assert len(as_json["edges"]) == 2
+
+    root = ET.fromstring(b"".join(iter_export(path, "graphml")))
+    ns = {"g": "http://graphml.graphdrawing.org/xmlns"}
+    assert len(root.findall(".//g:node", ns)) == 3
+    assert len(root.findall(".//g:edge", ns)) == 2
+
+    lines = b"".join(iter_export(path, "ndjson")).decode("utf-8").splitlines()
+    assert len(lines) == 5
+
+
+def test_json_export_of_graph_without_edges(tmp_path):
+    graph = nx.DiGraph()
+    graph.add_node("lonely.py", language="python")
+    path = tmp_path / "graph.ndjson"
+    write_graph(graph, path)
+    assert json.loads(b"".join(iter_export(path, "json"))) == {
+        "nodes": [{"id": "lonely.py", "language": "python"}],
+        "edges": [],
+    }
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from services.git_clone import GitCancelledError
+from services.jobs import JobManager
+
+
+def _wait_until_finished(manager, job, timeout=5.0):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+    return manager.events_since(job, 0)
+
+
+def test_job_records_stages_partials_and_result():
+    diagram_sent, finish = threading.Event(), threading.Event()
+
+    def runner(repo_url, progress, priority):
+        progress.stage("parsing", 0.3)
+        progress.partial("diagram", "c4_modules_mermaid", "graph TD")
+        diagram_sent.set()
+        finish.wait(5)
+        return {"repo": {"sha": "abc123"}, "diagrams": {"c4_modules_mermaid": "graph TD"}}
+
+    manager = JobManager(runner, max_workers=1)
+    job = manager.submit("https://github.com/octo/demo")
+    assert diagram_sent.wait(5)
+    events = manager.events_since(job, 0)
+    assert [event.type for event in events] == ["stage", "stage", "diagram"]
+    assert events[2].data == {"name": "c4_modules_mermaid", "value": "graph TD"}
+
+    finish.set()
+    events = _wait_until_finished(manager, job)
+    # The done event repeats the diagrams, so replays skip the partial ones.
+    assert [event.type for event in events] == ["stage", "stage", "done"]
+    assert events[-1].data["result"]["diagrams"] == {"c4_modules_mermaid": "graph TD"}
+    snapshot = manager.get(job.id).snapshot()
+    assert snapshot["status"] == "done"
+    assert snapshot["result"] == "/api/cache/abc123"
+    assert manager.events_since(job, 3)[0].type == "done"
+
+
+def test_streamed_events_are_dropped_once_the_job_finishes():
+    def runner(repo_url, progress, priority):
+        for piece in ("- Pur", "pose"):
+            progress.partial("token", "high_level", piece)
+        progress.partial("summaries", "summaries", {"high_level": ["Purpose"]})
+        return {"repo": {"sha": "abc123"}}
+
+    manager = JobManager(runner, max_workers=1)
+    job = manager.submit("https://github.com/octo/demo")
+    events = _wait_until_finished(manager, job)
+
+    assert [event.type for event in events] == ["stage", "done"]
+    # Ids are not reused, so a client that saw the tokens resumes at the result.
+    assert [event.id for event in events] == [1, 5]
+    assert [event.type for event in manager.events_since(job, 2)] == ["done"]
+
+
+def test_failed_job_reports_error():
+    def runner(repo_url, progress, priority):
+        raise ValueError("Only https://github.com/<owner>/<repo> URLs are supported")
+
+    manager = JobManager(runner, max_workers=1)
+    job = manager.submit("https://example.com/nope")
+    events = _wait_until_finished(manager, job)
+    assert job.status == "failed"
+    assert events[-1].type == "failed"
+    assert "URLs are supported" in job.error
+
+
+def test_cancelled_job_stops_its_clone():
+    started = threading.Event()
+
+    def runner(repo_url, progress, priority):
+        progress.partial("git", "clone", "Receiving objects:  10%")
+        started.set()
+        # Stands in for ensure_cloned, which polls the event while git runs.
+        progress.cancel.wait(5)
+        raise GitCancelledError("git clone was cancelled")
+
+    manager = JobManager(runner, max_workers=1)
+    job = manager.submit("https://github.com/octo/demo")
+    assert started.wait(5)
+    assert manager.cancel(job.id) is job
+    events = _wait_until_finished(manager, job)
+    assert job.status == "cancelled"
+    # Git progress is dropped with the tokens once the job is over.
+    assert [event.type for event in events] == ["stage", "cancelled"]
+    assert manager.cancel("missing") is None
+
+
+def test_finished_jobs_expire():
+    manager = JobManager(lambda repo_url, progress, priority: {"repo": {"sha": "abc123"}}, max_workers=1)
+    job = manager.submit("https://github.com/octo/demo")
+    _wait_until_finished(manager, job)
+    assert manager.get(job.id) is job
+
+    job.updated_at -= manager.finished_ttl + 1
+    assert manager.get(job.id) is None
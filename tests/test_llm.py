@@ -0,0 +1,296 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import networkx as nx
+import pytest
+
+import services.analyze as analyze
+from services.git_clone import RepoMetadata
+from services.llm import HEDGE_MIN_SAMPLES, LocalLLM
+from services.result_store import ResultStore
+
+
+class _OllamaStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.client_address[1], payload))
+        time.sleep(getattr(self.server, "delay", self.delay))
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for piece in ("- No", "te"):
+                self.wfile.write(json.dumps({"response": piece, "done": False}).encode() + b"\n")
+                self.wfile.flush()
+            self.wfile.write(json.dumps({"response": "", "done": True}).encode() + b"\n")
+            self.close_connection = True
+            return
+        body = json.dumps({"response": self.server.reply(payload)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OllamaStub)
+    server.requests = []
+    server.reply = lambda payload: "- Note"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def ollama():
+    server = _serve()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def second_ollama():
+    server = _serve()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _endpoint(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_prompts_reuse_one_connection_and_keep_the_model_loaded(ollama):
+    llm = LocalLLM(endpoint=_endpoint(ollama))
+    assert llm.warm_up()
+    for _ in range(3):
+        assert llm.summarize_module("app.py", "context") == "- Note"
+
+    ports = {port for port, _ in ollama.requests}
+    assert len(ports) == 1
+    warm_up, *prompts = [payload for _, payload in ollama.requests]
+    assert "prompt" not in warm_up and warm_up["keep_alive"] == llm.keep_alive
+    assert all(payload["keep_alive"] == llm.keep_alive for payload in prompts)
+
+
+def test_responses_are_cached_per_model_prompt_and_content(ollama, tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    llm = LocalLLM(endpoint=_endpoint(ollama), cache=store)
+    assert llm.summarize_module("app.py", "context", "hash-1") == "- Note"
+    # A new instance (e.g. the next commit's analysis) reuses the stored answer.
+    assert LocalLLM(endpoint=_endpoint(ollama), cache=store).summarize_module("app.py", "context", "hash-1") == "- Note"
+    assert len(ollama.requests) == 1
+
+    llm.summarize_module("app.py", "context", "hash-2")
+    other_model = LocalLLM(endpoint=_endpoint(ollama), model="other-model", cache=store)
+    other_model.summarize_module("app.py", "context", "hash-1")
+    assert len(ollama.requests) == 3
+    assert store.stats()["llm_hits"] == 1 and store.stats()["llm_misses"] == 3
+
+
+def test_streamed_tokens_are_forwarded_and_the_full_text_cached(ollama, tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    llm = LocalLLM(endpoint=_endpoint(ollama), cache=store)
+    tokens = []
+    assert llm.summarize_module("app.py", "context", "hash", on_token=tokens.append) == "- Note"
+    assert tokens == ["- No", "te"]
+    assert ollama.requests[0][1]["stream"] is True
+
+    # A cached answer arrives as a single piece.
+    tokens.clear()
+    assert llm.summarize_module("app.py", "context", "hash", on_token=tokens.append) == "- Note"
+    assert tokens == ["- Note"] and len(ollama.requests) == 1
+
+
+def test_prompts_go_to_the_least_busy_healthy_endpoint(ollama, second_ollama):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        down = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    ollama.delay = second_ollama.delay = 0.2
+    llm = LocalLLM(endpoint=[down, _endpoint(ollama), _endpoint(second_ollama)])
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        notes = list(pool.map(lambda _: llm.summarize_module("app.py", "context"), range(4)))
+
+    # Prompts that hit the dead server were retried on a live one.
+    assert notes == ["- Note"] * 4
+    assert len(ollama.requests) == 2 and len(second_ollama.requests) == 2
+    assert all(endpoint.outstanding == 0 for endpoint in llm.endpoints)
+
+
+def test_slow_prompts_are_hedged_and_the_loser_cancelled(ollama, second_ollama):
+    ollama.delay = 1.0
+    llm = LocalLLM(endpoint=[_endpoint(ollama), _endpoint(second_ollama)], hedge=True)
+    slow, fast = llm.endpoints
+    for _ in range(HEDGE_MIN_SAMPLES):
+        slow.breaker.record_success(0.1)
+
+    started = time.monotonic()
+    assert llm.summarize_module("app.py", "context") == "- Note"
+    assert time.monotonic() - started < 0.8
+    assert len(ollama.requests) == 1 and len(second_ollama.requests) == 1
+    assert all(payload["stream"] for _, payload in ollama.requests + second_ollama.requests)
+    assert fast.snapshot()["hedges"] == 1
+
+    deadline = time.monotonic() + 3
+    while slow.outstanding and time.monotonic() < deadline:
+        time.sleep(0.02)
+    # The abandoned request neither counts as a failure nor skews the latency window.
+    assert slow.outstanding == 0
+    assert slow.breaker.snapshot()["failures"] == 0
+    assert slow.breaker.snapshot()["successes"] == HEDGE_MIN_SAMPLES
+
+
+def test_hedged_prompts_fail_over_when_the_first_endpoint_fails_fast(ollama):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        down = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    llm = LocalLLM(endpoint=[down, _endpoint(ollama)], hedge=True)
+    failing, _ = llm.endpoints
+    for _ in range(HEDGE_MIN_SAMPLES):
+        failing.breaker.record_success(5.0)
+
+    started = time.monotonic()
+    assert llm.summarize_module("app.py", "context") == "- Note"
+    # Retried at once rather than after the 5s hedge delay.
+    assert time.monotonic() - started < 2
+    assert len(ollama.requests) == 1
+    assert failing.breaker.snapshot()["failures"] == 1
+
+
+@pytest.fixture
+def summarize(ollama, monkeypatch, tmp_path):
+    monkeypatch.setattr(analyze, "get_result_store", lambda: ResultStore(tmp_path / "results.sqlite3"))
+    monkeypatch.setattr(analyze, "LocalLLM", partial(LocalLLM, endpoint=_endpoint(ollama)))
+    graph = nx.DiGraph()
+    for name in ("a.py", "b.py", "c.py"):
+        graph.add_node(name, language="python")
+    graph.add_edges_from([("a.py", "b.py"), ("a.py", "c.py")])
+    metadata = RepoMetadata(owner="octo", name="demo", default_branch="main", sha="abc")
+    return lambda progress=analyze.NO_PROGRESS: analyze._summaries(
+        analyze._summary_inputs(metadata, [], [], graph), progress
+    )
+
+
+def test_cached_notes_survive_changes_elsewhere_in_the_repository(ollama, analysis_store, monkeypatch):
+    monkeypatch.setattr(analyze, "LocalLLM", partial(LocalLLM, endpoint=_endpoint(ollama)))
+    monkeypatch.setattr(analyze, "settings", analyze.settings.copy(update={"llm_batch": False}))
+
+    def inputs(python_files, score, b_hash):
+        return {
+            "repo_context": f"Repository octo/demo with {python_files} Python files and 0 JavaScript files.",
+            "modules": [["a.py", score, "hash-a"], ["b.py", score, b_hash]],
+            "facts": {"repo": "octo/demo", "entry_points": ["a.py"]},
+        }
+
+    analyze._summaries(inputs(2, 0.5, "hash-b"))
+    assert len(ollama.requests) == 3
+    # A file added elsewhere changes the counts and every centrality, not the notes.
+    analyze._summaries(inputs(3, 0.33, "hash-b"))
+    assert len(ollama.requests) == 3
+    # Editing b.py asks again for its note and for the repository bullets that name it.
+    analyze._summaries(inputs(3, 0.33, "hash-b2"))
+    assert len(ollama.requests) == 5
+
+
+@pytest.fixture
+def analysed(ollama, analysis_store, monkeypatch):
+    """Commit ``abc`` analysed into a temporary store, with the LLM pointed at the stub."""
+    monkeypatch.setattr(analyze, "LocalLLM", partial(LocalLLM, endpoint=_endpoint(ollama)))
+    metadata = RepoMetadata(owner="octo", name="demo", default_branch="main", sha="abc")
+    metadata.cache_dir.mkdir(parents=True)
+    sources = [
+        ("main.py", lambda: b"import b\n"),
+        ("b.py", lambda: b"VALUE = 1\n"),
+        ("README.md", lambda: b"# Demo\n## Usage\n"),
+    ]
+    return analyze._analyze_sources(iter(sources), metadata)
+
+
+def test_summaries_are_deferred_until_requested(ollama, analysed):
+    assert analysed["summaries"]["status"] == "pending"
+    assert analysed["summaries"]["href"] == "/api/summaries/abc"
+    assert analysed["diagrams"]["dependencies_mermaid"] and ollama.requests == []
+
+    summaries = analyze.get_summaries("abc")
+    assert summaries["status"] == "done" and summaries["high_level"] == ["Note"]
+    assert {module["module"] for module in summaries["focus_modules"]} == {"main.py", "b.py"}
+    prompts = len(ollama.requests)
+    assert analyze.get_summaries("abc") == summaries
+    assert len(ollama.requests) == prompts
+    assert analyze.get_summaries("unknown") is None
+
+
+def test_slow_llm_answers_are_replaced_by_extractive_summaries_then_upgraded(ollama, analysed):
+    ollama.delay = 0.5
+
+    started = time.monotonic()
+    summaries = analyze.get_summaries("abc", budget=0.1)
+    assert time.monotonic() - started < 0.4
+    assert summaries["status"] == "extractive"
+    assert summaries["high_level"][:3] == [
+        "octo/demo has 2 Python and 0 JavaScript files.",
+        "The README covers: Demo, Usage.",
+        "Likely entry points: main.py.",
+    ]
+    notes = {module["module"]: module["notes"] for module in summaries["focus_modules"]}
+    assert notes["main.py"].startswith("Entry point imported by 0 and importing 1 other modules")
+
+    # The LLM keeps going in the background and its answer replaces the fallback.
+    deadline = time.monotonic() + 5
+    while analyze.get_summaries("abc", budget=0)["status"] != "done" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert analyze.get_summaries("abc", budget=0)["high_level"] == ["Note"]
+
+
+def test_batched_summaries_fall_back_per_module_for_missing_entries(ollama, summarize):
+    batch = {"high_level": ["- Purpose", "Components"], "modules": {"a.py": "Entry point.", "b.py": ""}}
+    ollama.reply = lambda payload: "```json\n" + json.dumps(batch) + "\n```" if payload.get("format") else "Helper."
+
+    summaries = summarize()
+
+    assert summaries["high_level"] == ["Purpose", "Components"]
+    assert [module["notes"] for module in summaries["focus_modules"]] == ["Entry point.", "Helper.", "Helper."]
+    formats = [payload.get("format") for _, payload in ollama.requests]
+    assert formats.count("json") == 1 and len(formats) == 3
+
+
+def test_streamed_summaries_are_not_batched(ollama, summarize):
+    tokens = []
+
+    class Listener(analyze.AnalysisProgress):
+        def partial(self, kind, name, payload):
+            if kind == "token":
+                tokens.append(name)
+
+    summarize(Listener())
+
+    assert len(ollama.requests) == 4
+    assert all(payload["stream"] and "format" not in payload for _, payload in ollama.requests)
+    assert set(tokens) == {"high_level", "a.py", "b.py", "c.py"}
+
+
+def test_summaries_are_requested_concurrently(ollama, summarize, monkeypatch):
+    monkeypatch.setattr(analyze, "settings", analyze.settings.copy(update={"llm_batch": False}))
+    monkeypatch.setattr(_OllamaStub, "delay", 0.4)
+
+    started = time.monotonic()
+    summaries = summarize()
+    elapsed = time.monotonic() - started
+
+    assert len(ollama.requests) == 4
+    assert [module["module"] for module in summaries["focus_modules"]] == ["a.py", "b.py", "c.py"]
+    # Four 0.4s prompts, two at a time.
+    assert elapsed < 1.4
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from services.llm_queue import BACKGROUND, INTERACTIVE, LLMQueue, LLMQueueTimeout
+from services.single_flight import FileSemaphore
+
+
+def _run_in_thread(queue, priority, order, hold=0.0):
+    def work():
+        with queue.slot(priority):
+            order.append(priority)
+            time.sleep(hold)
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiting(queue, count):
+    deadline = time.monotonic() + 2
+    while sum(queue.snapshot()["waiting"].values()) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_interactive_prompts_go_ahead_of_background_ones():
+    queue = LLMQueue(max_concurrency=1)
+    order = []
+    with queue.slot(INTERACTIVE):
+        threads = [_run_in_thread(queue, BACKGROUND, order)]
+        _wait_for_waiting(queue, 1)
+        threads.append(_run_in_thread(queue, INTERACTIVE, order))
+        _wait_for_waiting(queue, 2)
+        assert queue.snapshot()["waiting"] == {INTERACTIVE: 1, BACKGROUND: 1}
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(2)
+
+    assert order == [INTERACTIVE, BACKGROUND]
+    snapshot = queue.snapshot()
+    assert snapshot["admitted"] == 3 and snapshot["running"] == 0
+    assert snapshot["max_wait_seconds"] >= 0.05
+
+
+def test_prompts_give_up_at_their_deadline():
+    queue = LLMQueue(max_concurrency=1)
+    with queue.slot():
+        with pytest.raises(LLMQueueTimeout):
+            with queue.slot(BACKGROUND, deadline=time.monotonic() + 0.05):
+                pass
+    assert queue.snapshot()["timeouts"] == 1
+    with queue.slot(deadline=time.monotonic() + 0.05):
+        assert queue.running == 1
+
+
+def test_node_slots_are_shared_between_queues(tmp_path):
+    # Two queues stand in for two worker processes.
+    first = LLMQueue(1, FileSemaphore(tmp_path, "llm", 1))
+    second = LLMQueue(1, FileSemaphore(tmp_path, "llm", 1))
+    with first.slot():
+        with pytest.raises(LLMQueueTimeout):
+            with second.slot(deadline=time.monotonic() + 0.1):
+                pass
+    assert second.running == 0
+    with second.slot(deadline=time.monotonic() + 0.1):
+        pass
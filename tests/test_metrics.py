@@ -0,0 +1,80 @@
+import os
+import time
+
+import services.metrics as metrics
+from services.metrics import MetricsRegistry, render_families
+
+
+def test_render_counters_gauges_and_cumulative_histogram_buckets():
+    registry = MetricsRegistry()
+    requests = registry.counter("demo_requests_total", "Requests served.", ["route"])
+    requests.inc(route="/api/cache/{sha}")
+    requests.inc(2, route="/api/cache/{sha}")
+    registry.gauge("demo_running", "Running now.", sample=lambda: {(): 3})
+    seconds = registry.histogram("demo_seconds", "Time taken.", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 7):
+        seconds.observe(value, stage="clone")
+
+    text = registry.render()
+
+    assert '# TYPE demo_requests_total counter' in text
+    assert 'demo_requests_total{route="/api/cache/{sha}"} 3' in text
+    assert "demo_running 3" in text
+    assert 'demo_seconds_bucket{stage="clone",le="0.1"} 2' in text
+    assert 'demo_seconds_bucket{stage="clone",le="1"} 3' in text
+    assert 'demo_seconds_bucket{stage="clone",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{stage="clone"} 4' in text
+    assert 'demo_seconds_sum{stage="clone"} 7.65' in text
+
+
+def test_registering_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter("demo_total", "Demo.") is registry.counter("demo_total", "Demo.")
+
+
+def test_processes_sharing_a_directory_are_merged(tmp_path):
+    first, second = MetricsRegistry(), MetricsRegistry()
+    first.directory = second.directory = tmp_path
+    for registry, amount in ((first, 1), (second, 2)):
+        registry.counter("demo_total", "Demo.", ["cache"]).inc(amount, cache="result")
+        registry.gauge("demo_running", "Running now.").set(amount)
+        registry.histogram("demo_seconds", "Time taken.", buckets=(1,)).observe(amount)
+    # Same pid here, but each registry start has its own file.
+    second.publish()
+
+    families = first.collect()
+
+    assert families["demo_total"]["samples"] == [[["result"], 3]]
+    assert families["demo_running"]["samples"] == [[[], 3]]
+    assert families["demo_seconds"]["samples"] == [[[], {"counts": [1, 1], "sum": 3.0}]]
+
+    # An exited process keeps contributing its counters, not its gauges.
+    stale = time.time() - metrics.STALE_AFTER - 1
+    os.utime(second._path(), (stale, stale))
+    families = first.collect()
+    assert families["demo_total"]["samples"] == [[["result"], 3]]
+    assert families["demo_running"]["samples"] == [[[], 1]]
+
+    # Long dead, its totals move to the accumulator and its file goes.
+    expired = time.time() - metrics.RETENTION - 1
+    os.utime(second._path(), (expired, expired))
+    assert first.collect()["demo_total"]["samples"] == [[["result"], 3]]
+    assert not second._path().exists()
+
+    # A stopping process does the same, so a new worker's scrape still sees every total.
+    first.stop()
+    assert [path.name for path in tmp_path.glob("*.json")] == [metrics.ACCUMULATOR]
+    third = MetricsRegistry()
+    third.directory = tmp_path
+    third.counter("demo_total", "Demo.", ["cache"]).inc(cache="result")
+    families = third.collect()
+    assert families["demo_total"]["samples"] == [[["result"], 4]]
+    assert families["demo_seconds"]["samples"] == [[[], {"counts": [1, 1], "sum": 3.0}]]
+    assert "demo_running" not in families
+
+
+def test_label_values_are_escaped():
+    text = render_families(
+        {"demo_total": {"type": "counter", "help": "Demo.", "labels": ["path"], "samples": [[['a"b\\c'], 1]]}}
+    )
+    assert 'demo_total{path="a\\"b\\\\c"} 1' in text
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from services.git_clone import RepoMetadata
+from services.ref_cache import RefCache
+from services.result_store import ResultStore
+
+URL = "https://github.com/octo/demo"
+
+
+class FakeResolver:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.calls = 0
+        self.delay = delay
+        self.sha = "sha-1"
+
+    def __call__(self, repo_url: str) -> RepoMetadata:
+        self.calls += 1
+        time.sleep(self.delay)
+        return RepoMetadata(owner="octo", name="demo", default_branch="main", sha=self.sha)
+
+
+def test_fresh_entries_skip_the_resolver(tmp_path):
+    resolver = FakeResolver()
+    cache = RefCache(resolver, ResultStore(tmp_path / "db.sqlite3"), ttl_seconds=60, stale_seconds=60)
+    assert cache.get(URL).sha == "sha-1"
+    assert cache.get(URL).sha == "sha-1"
+    assert resolver.calls == 1
+
+
+def test_entries_survive_restart_via_store(tmp_path):
+    store = ResultStore(tmp_path / "db.sqlite3")
+    RefCache(FakeResolver(), store, ttl_seconds=60, stale_seconds=0).get(URL)
+    resolver = FakeResolver()
+    assert RefCache(resolver, store, ttl_seconds=60, stale_seconds=0).get(URL).sha == "sha-1"
+    assert resolver.calls == 0
+
+
+def test_stale_entry_is_served_while_refreshing(tmp_path):
+    resolver = FakeResolver()
+    cache = RefCache(resolver, ResultStore(tmp_path / "db.sqlite3"), ttl_seconds=0, stale_seconds=60)
+    cache.get(URL)
+    resolver.sha = "sha-2"
+    assert cache.get(URL).sha == "sha-1"
+    deadline = time.time() + 5
+    while cache._entries[("octo", "demo")].metadata.sha != "sha-2" and time.time() < deadline:
+        time.sleep(0.01)
+    assert resolver.calls == 2
+    assert cache.get(URL).sha == "sha-2"
+
+
+def test_concurrent_misses_coalesce(tmp_path):
+    resolver = FakeResolver(delay=0.2)
+    cache = RefCache(resolver, ResultStore(tmp_path / "db.sqlite3"), ttl_seconds=60, stale_seconds=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(URL))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert resolver.calls == 1
+    assert {result.sha for result in results} == {"sha-1"}
@@ -0,0 +1,126 @@
+import json
+import sqlite3
+import threading
+import time
+
+import services.result_store as result_store
+from services.result_store import ResultStore
+
+
+def _result(sha: str, name: str = "octo/demo") -> dict:
+    return {"repo": {"name": name, "sha": sha}, "limits": {"file_count_scanned": 3}}
+
+
+def test_put_and_lookup_by_sha_and_repo(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.put("a1", "octo", "demo", tmp_path / "octo_demo" / "a1", _result("a1"))
+    store.put("b2", "octo", "demo", tmp_path / "octo_demo" / "b2", _result("b2"))
+    assert store.get("a1") == _result("a1")
+    assert store.get("missing") is None
+    assert store.get_cache_dir("b2") == tmp_path / "octo_demo" / "b2"
+    sha, latest = store.latest_for_repo("octo", "demo")
+    assert sha == "b2" and latest == _result("b2")
+
+
+def test_legacy_result_files_are_imported_once(tmp_path):
+    legacy_dir = tmp_path / "octo_demo" / "c3"
+    legacy_dir.mkdir(parents=True)
+    (legacy_dir / "result.json").write_text(json.dumps(_result("c3")), encoding="utf-8")
+    store = ResultStore(tmp_path / "results.sqlite3")
+    assert store.get("c3") == _result("c3")
+    assert store.get_cache_dir("c3") == legacy_dir
+
+
+def test_concurrent_writers_do_not_conflict(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+
+    def write(index: int) -> None:
+        for n in range(20):
+            sha = f"{index}-{n}"
+            store.put(sha, "octo", "demo", tmp_path, _result(sha))
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(store.get(f"{i}-19") for i in range(4))
+
+
+def test_results_are_stored_compact_and_gzipped(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.put("d4", "octo", "demo", tmp_path, _result("d4"), analyzer_version="7")
+    stored = store.get_blob("d4")
+    assert stored.encoding == "gzip"
+    assert stored.analyzer_version == "7"
+    assert stored.payload[:2] == b"\x1f\x8b"
+    assert stored.decoded_bytes() == json.dumps(_result("d4"), separators=(",", ":")).encode("utf-8")
+
+
+def test_hits_are_buffered_and_flushed_for_eviction_order(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.put("old", "octo", "demo", tmp_path, _result("old"))
+    store.put("new", "octo", "demo", tmp_path, _result("new"))
+    other = sqlite3.connect(tmp_path / "results.sqlite3")
+    before = other.execute("SELECT last_access FROM results WHERE sha = 'old'").fetchone()
+
+    store.get("old")
+    store.increment_stat("result_hits")
+    # Nothing written yet: the hit stayed a read.
+    assert other.execute("SELECT last_access FROM results WHERE sha = 'old'").fetchone() == before
+    assert other.execute("SELECT COUNT(*) FROM cache_stats").fetchone() == (0,)
+
+    assert [sha for sha, _, _ in store.results_lru()] == ["new", "old"]
+    assert store.stats() == {"result_hits": 1}
+
+
+def test_buffered_hits_are_flushed_on_a_timer(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "FLUSH_INTERVAL", 0.05)
+    store = ResultStore(tmp_path / "results.sqlite3")
+    other = sqlite3.connect(tmp_path / "results.sqlite3")
+
+    # A single hit, with no call after it, still reaches the database.
+    store.increment_stat("result_hits")
+    deadline = time.monotonic() + 5
+    while other.execute("SELECT COUNT(*) FROM cache_stats").fetchone() == (0,) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert other.execute("SELECT name, value FROM cache_stats").fetchall() == [("result_hits", 1)]
+
+
+def test_file_counts_are_read_without_loading_results(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.put("a1", "octo", "demo", tmp_path, _result("a1"))
+    assert store.latest_file_count("octo", "demo") == 3
+    assert store.latest_file_count("octo", "other") is None
+
+    # Databases from before the column get it filled in from the stored results.
+    conn = sqlite3.connect(tmp_path / "results.sqlite3")
+    conn.execute("ALTER TABLE results DROP COLUMN file_count")
+    conn.commit()
+    conn.close()
+    assert ResultStore(tmp_path / "results.sqlite3").latest_file_count("octo", "demo") == 3
+
+
+def test_mirrors_are_remeasured_after_each_use(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    mirror = tmp_path / "octo_demo" / "mirror.git"
+    store.track_clone("octo_demo", mirror)
+    store.set_clone_size("octo_demo", 100)
+    assert store.clone_size("octo_demo") == 100
+
+    # A fetch may have grown the mirror, so its size is unknown until the janitor measures it.
+    store.track_clone("octo_demo", mirror)
+    assert store.clone_size("octo_demo") is None
+    assert [key for key, _, _, _ in store.clones_lru()] == ["octo_demo"]
+
+
+def test_clones_keyed_by_sha_are_migrated(tmp_path):
+    conn = sqlite3.connect(tmp_path / "results.sqlite3")
+    conn.execute("CREATE TABLE clones (sha TEXT PRIMARY KEY, path TEXT, size_bytes INTEGER, last_access REAL)")
+    conn.execute("INSERT INTO clones VALUES ('octo_demo', '/tmp/mirror.git', 5, 1.0)")
+    conn.commit()
+    conn.close()
+    store = ResultStore(tmp_path / "results.sqlite3")
+    assert store.clone_size("octo_demo") == 5
+    store.delete_clone("octo_demo")
+    assert store.clones_lru() == []
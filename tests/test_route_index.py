@@ -0,0 +1,41 @@
+from graphs.route_index import RouteEntry, RouteTrie, parse_route, render_routes_mermaid
+
+
+def test_parse_route_handles_python_and_javascript_shapes():
+    assert parse_route('router.get("/items/{item_id}") -> read_item', "api.py") == RouteEntry(
+        method="GET", path="/items/{item_id}", handler="read_item", file="api.py"
+    )
+    flask = parse_route('app.route("/login", methods=["GET", "POST"]) -> login', "views.py")
+    assert flask.method == "GET,POST"
+    js = parse_route("app.post('/users', auth, createUser)", "server.js")
+    assert (js.method, js.path, js.handler) == ("POST", "/users", "createUser")
+    arrow = parse_route("app.get('/status', (req, res) => res.send('ok'))", "server.js")
+    assert arrow.handler == "<anonymous>"
+    assert parse_route("app.listen(3000)", "server.js") is None
+
+
+def _many_routes() -> RouteTrie:
+    routes = [RouteEntry("GET", f"/api/users/{i}", f"user_{i}", "u.py") for i in range(50)]
+    routes += [RouteEntry("POST", f"/api/orders/{i}", f"order_{i}", "o.py") for i in range(30)]
+    routes.append(RouteEntry("GET", "/health", "health", "app.py"))
+    return RouteTrie(routes)
+
+
+def test_query_paginates_within_prefix():
+    trie = _many_routes()
+    assert len(trie) == 81
+    total, page = trie.query("/api/users", offset=10, limit=5)
+    assert total == 50
+    assert len(page) == 5
+    every = trie.query("/api/users", offset=0, limit=100)[1]
+    assert page == every[10:15]
+    total, page = trie.query("/", method="post", limit=3)
+    assert total == 30 and all(route.method == "POST" for route in page)
+    assert trie.query("/missing") == (0, [])
+
+
+def test_mermaid_respects_node_budget():
+    diagram = render_routes_mermaid(_many_routes(), budget=6)
+    edges = [line for line in diagram.splitlines() if "-->" in line]
+    assert len(edges) <= 6
+    assert "(50 routes)" in diagram
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from services.result_store import ResultStore
+from services.scheduler import AdmissionError, AnalysisScheduler, Lane
+
+
+def _scheduler(tmp_path, **lane_overrides):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    options = {"max_concurrency": 1, "max_queue": 1, "queue_timeout": 5}
+    options.update(lane_overrides)
+    return store, AnalysisScheduler(
+        store,
+        fast=Lane("fast", **options),
+        slow=Lane("slow", **options),
+        slow_min_files=100,
+        slow_min_clone_bytes=10_000,
+    )
+
+
+def test_lane_selection_uses_previous_size(tmp_path):
+    store, scheduler = _scheduler(tmp_path)
+    assert scheduler.lane_for("octo", "new") is scheduler.fast
+    store.put("a", "octo", "mono", tmp_path, {"limits": {"file_count_scanned": 5000}})
+    assert scheduler.lane_for("octo", "mono") is scheduler.slow
+    store.track_clone("octo_big", tmp_path / "octo_big" / "mirror.git")
+    store.set_clone_size("octo_big", 50_000)
+    assert scheduler.lane_for("octo", "big") is scheduler.slow
+    # Only that repository's mirror counts, not one whose name starts the same.
+    assert scheduler.lane_for("octo", "bi") is scheduler.fast
+
+
+def test_full_queue_is_rejected_with_retry_after(tmp_path):
+    _, scheduler = _scheduler(tmp_path)
+    release = threading.Event()
+
+    def occupy():
+        with scheduler.slot("octo", "demo"):
+            release.wait(5)
+
+    running = threading.Thread(target=occupy)
+    queued = threading.Thread(target=occupy)
+    running.start()
+    while scheduler.fast.running < 1:
+        time.sleep(0.01)
+    queued.start()
+    while scheduler.fast.waiting < 1:
+        time.sleep(0.01)
+
+    with pytest.raises(AdmissionError) as excinfo:
+        scheduler.check("octo", "demo")
+    assert excinfo.value.retry_after >= 1
+    # The slow lane is unaffected by the fast lane's backlog.
+    scheduler.slow.check()
+
+    release.set()
+    running.join()
+    queued.join()
+    assert scheduler.snapshot()["fast"]["rejected"] == 1
+
+
+def test_queue_timeout(tmp_path):
+    _, scheduler = _scheduler(tmp_path, queue_timeout=0.05)
+    with scheduler.slot("octo", "demo"):
+        waiter_error = []
+
+        def wait():
+            try:
+                with scheduler.slot("octo", "demo"):
+                    pass
+            except AdmissionError as exc:
+                waiter_error.append(exc)
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        thread.join()
+    assert waiter_error
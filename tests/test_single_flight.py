@@ -0,0 +1,95 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from services.single_flight import CallCancelled, FileLock, SingleFlight
+
+
+def test_concurrent_callers_share_one_execution(tmp_path):
+    flight = SingleFlight(tmp_path)
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return "done"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("abc", work))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ["done"] * 8
+    assert flight.do("abc", lambda: "again") == "again"
+
+
+def test_failures_propagate_to_waiters(tmp_path):
+    flight = SingleFlight(tmp_path)
+    try:
+        flight.do("abc", lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+    else:  # pragma: no cover
+        raise AssertionError("expected the error to propagate")
+    assert not flight._inflight
+
+
+def _hold_lock(path, ready, release):
+    with FileLock(path):
+        ready.set()
+        release.wait(5)
+
+
+def test_file_lock_excludes_other_processes(tmp_path):
+    path = tmp_path / "abc.lock"
+    ready, release = multiprocessing.Event(), multiprocessing.Event()
+    holder = multiprocessing.Process(target=_hold_lock, args=(path, ready, release))
+    holder.start()
+    try:
+        assert ready.wait(5)
+        assert FileLock(path).acquire(timeout=0.2) is False
+    finally:
+        release.set()
+        holder.join(5)
+    lock = FileLock(path)
+    assert lock.acquire(timeout=1)
+    lock.release()
+
+
+def test_waiters_run_the_call_themselves_when_it_is_cancelled(tmp_path):
+    flight = SingleFlight(tmp_path)
+    started = threading.Event()
+
+    def cancelled():
+        started.set()
+        time.sleep(0.2)
+        raise CallCancelled("the leader gave up")
+
+    leader = threading.Thread(target=lambda: pytest.raises(CallCancelled, flight.do, "abc", cancelled))
+    leader.start()
+    assert started.wait(5)
+    assert flight.do("abc", lambda: "done") == "done"
+    leader.join()
+    assert not flight._inflight
+
+
+def test_removed_lock_files_are_not_locked_by_waiters(tmp_path):
+    path = tmp_path / "abc.lock"
+    holder = FileLock(path)
+    holder.acquire()
+    acquired = []
+    waiter = FileLock(path, poll_interval=0.01)
+    thread = threading.Thread(target=lambda: acquired.append(waiter.acquire(timeout=5)))
+    thread.start()
+    time.sleep(0.05)  # the waiter has opened the file that is about to go
+    holder.remove()
+    thread.join()
+
+    # The waiter holds a lock on a new file, so a third caller can't get in as well.
+    assert acquired == [True] and path.exists()
+    assert FileLock(path).acquire(timeout=0) is False
+    waiter.release()
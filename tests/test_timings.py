@@ -0,0 +1,62 @@
+import pytest
+
+import services.analyze as analyze
+from services.timings import Timings, collect_timings, current_rss_mb, current_timings, record, timed
+
+
+def test_repeated_stages_accumulate_seconds_and_counts():
+    timings = Timings()
+    timings.add("read", 0.25, files=1, bytes=10)
+    timings.add("read", 0.5, files=1, bytes=5)
+    with timings.stage("graph_build") as counts:
+        counts["nodes"] = 3
+
+    stages = timings.as_dict()["stages"]
+    assert list(stages) == ["read", "graph_build"]
+    assert stages["read"]["seconds"] == 0.75
+    assert stages["read"]["files"] == 2 and stages["read"]["bytes"] == 15
+    assert stages["graph_build"]["nodes"] == 3
+    # Blocks get their resident memory growth (where it can be read); stages recorded after the fact can't.
+    assert ("rss_delta_mb" in stages["graph_build"]) == (current_rss_mb() is not None)
+    assert "rss_delta_mb" not in stages["read"]
+
+
+@pytest.mark.skipif(current_rss_mb() is None, reason="needs /proc")
+def test_rss_delta_measures_growth_across_a_stage():
+    timings = Timings()
+    with timings.stage("parse") as counts:
+        ballast = bytearray(64 * 1024 * 1024)
+        ballast[::4096] = b"x" * len(ballast[::4096])  # touch every page so it is resident
+        counts["files"] = 1
+    assert timings.as_dict()["stages"]["parse"]["rss_delta_mb"] >= 50
+    del ballast
+
+
+def test_stages_are_only_recorded_inside_collect_timings():
+    with timed("ignored") as counts:
+        counts["files"] = 1
+    record("ignored", 1.0)
+    assert current_timings() is None
+
+    with collect_timings() as timings:
+        with timed("clone") as counts:
+            counts["bytes"] = 42
+        record("walk", 0.5, files=2)
+    assert current_timings() is None
+    assert timings.as_dict()["stages"]["clone"]["bytes"] == 42
+    assert timings.as_dict()["stages"]["walk"]["files"] == 2
+
+
+def test_archive_analysis_reports_its_stage_timings(analysis_store, demo_zip):
+    result = analyze.analyze_archive(demo_zip, "demo.zip")
+
+    stages = result["timings"]["stages"]
+    assert stages["read"]["files"] == 2 and stages["parse:python"]["files"] == 2
+    assert stages["walk"]["files"] == 3
+    assert stages["hash"]["bytes"] == demo_zip.stat().st_size
+    assert stages["graph_build"]["nodes"] >= 2
+    for name in ("centrality", "mermaid:c4_modules", "mermaid:dependencies", "mermaid:routes", "cache_write"):
+        assert name in stages
+    # The stored copy was encoded before the cache write.
+    stored = analysis_store.get(result["repo"]["sha"])
+    assert "cache_write" not in stored["timings"]["stages"]
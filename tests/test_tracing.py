@@ -0,0 +1,62 @@
+import json
+import threading
+
+import services.analyze as analyze
+from services.timings import record, timed
+from services.tracing import Trace, collect_trace, current_trace, span
+
+
+def test_spans_are_complete_events_per_thread():
+    trace = Trace()
+    with trace.span("clone") as args:
+        args["bytes"] = 42
+    worker = threading.Thread(target=lambda: trace.add("llm:high_level", trace.started, 0.5), name="llm_0")
+    worker.start()
+    worker.join()
+
+    document = trace.as_dict()
+    names = {event["args"]["name"] for event in document["traceEvents"] if event["ph"] == "M"}
+    spans = {event["name"]: event for event in document["traceEvents"] if event["ph"] == "X"}
+    assert "llm_0" in names
+    assert spans["clone"]["args"] == {"bytes": 42}
+    assert spans["llm:high_level"]["dur"] == 500000
+    assert spans["llm:high_level"]["cat"] == "llm"
+    assert spans["clone"]["tid"] != spans["llm:high_level"]["tid"]
+
+
+def test_nothing_is_traced_unless_enabled():
+    with collect_trace(False) as trace:
+        assert trace is None and current_trace() is None
+        with span("walk"), timed("clone"):
+            record("read", 0.1)
+
+    with collect_trace() as trace:
+        with timed("clone") as counts:
+            counts["bytes"] = 1
+        record("read", 0.1, files=1)
+        record("clone", 0.0, bytes=2)  # counts only: no span
+    assert current_trace() is None
+    assert [event["name"] for event in trace.events] == ["clone", "read"]
+
+
+def test_traced_analysis_writes_a_chrome_trace(tmp_path, analysis_store, demo_zip):
+    with collect_trace():
+        result = analyze.analyze_archive(demo_zip, "demo.zip")
+
+    trace_path = tmp_path / f"{result['repo']['sha']}.trace.json"
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    by_name = {event["name"]: event for event in spans}
+    for name in ("hash", "walk", "read", "parse:python", "graph_build", "mermaid:dependencies", "cache_write"):
+        assert name in by_name
+    assert [event["name"] for event in spans].count("read") == 2
+    # Reading and parsing happen inside the walk.
+    walk = by_name["walk"]
+    parse = by_name["parse:python"]
+    assert walk["ts"] <= parse["ts"] and parse["ts"] + parse["dur"] <= walk["ts"] + walk["dur"] + 1
+    assert walk["args"] == {"files": 3}
+
+
+def test_untraced_analysis_writes_no_trace(tmp_path, analysis_store, demo_zip):
+    analyze.analyze_archive(demo_zip, "demo.zip")
+    assert not list(tmp_path.glob("*.trace.json"))